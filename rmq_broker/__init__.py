@@ -1,2 +1,11 @@
 __version__ = "1.2.6"
-from wp_utils import logging  # noqa F401
+
+
+def __getattr__(name):
+    # wp_utils.logging устанавливает класс логгеров и загружает настройки сервиса,
+    # поэтому импортируется при обращении, а не при импорте пакета.
+    if name == "logging":
+        from wp_utils import logging
+
+        return logging
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
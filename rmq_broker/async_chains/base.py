@@ -1,19 +1,29 @@
-import logging
+import inspect
 from abc import ABC, abstractmethod
-from typing import Dict
+from collections.abc import Mapping
+from http import HTTPStatus
+from typing import Any, AsyncIterator, Callable, Dict, Optional
 
 from pydantic.error_wrappers import ValidationError
-from starlette import status
 
+from rmq_broker.envelope import Envelope
 from rmq_broker.models import ErrorMessage, ProcessedMessage, UnprocessedMessage
 from rmq_broker.schemas import (
     BrokerMessageHeader,
     ProcessedBrokerMessage,
     UnprocessedBrokerMessage,
 )
+from rmq_broker.utils.active import active_requests
+from rmq_broker.utils.cache import response_cache
+from rmq_broker.utils.capture import traffic_capture
+from rmq_broker.utils.logger import get_logger
+from rmq_broker.utils.metrics import metrics
+from rmq_broker.utils.raw_body import RawBody
 from rmq_broker.utils.singleton import Singleton
+from rmq_broker.utils.tracing import TRACEPARENT, tracer
+from rmq_broker.utils.validation import build_body_validator
 
-logger = logging.getLogger(__name__)
+logger = get_logger(__name__)
 
 
 class AbstractChain(ABC):
@@ -22,6 +32,7 @@ class AbstractChain(ABC):
     def add(self, chain: "BaseChain") -> None:
         """Добавляет нового обработчика в цепочку."""
         self.chains[chain.request_type.lower()] = chain
+        chain.get_body_validator()
         logger.debug(
             "%s.%s: %s added to chains.",
             self.__class__.__name__,
@@ -49,7 +60,7 @@ class AbstractChain(ABC):
         self,
         data: UnprocessedBrokerMessage,
         body: dict = None,
-        code: int = status.HTTP_200_OK,
+        code: int = HTTPStatus.OK.value,
         message: str = "",
     ) -> ProcessedBrokerMessage:
         body = body or {}
@@ -80,12 +91,43 @@ class BaseChain(AbstractChain):
         actual (str): Наименование актуального Chain в Swagger документации. Отображается
                     рядом с устаревшим Chain (где include_in_schema = True, deprecated = True).
                     Устанавливает deprecated = True автоматически, если deprecated не был указан как True.
+        sheddable (bool): False (значение по умолчанию) - запрос обрабатывается всегда;
+                        True - запрос дешево повторить, при перегрузке консьюмера
+                        он отклоняется сразу с кодом 503.
+        cache_ttl (float): 0 (значение по умолчанию) - ответы не кэшируются;
+                        иначе успешный ответ на запрос с тем же телом
+                        возвращается из кэша в течение cache_ttl секунд.
+        cache_key (callable): Необязательная функция cache_key(data), значение которой
+                        используется вместо тела запроса при вычислении ключа кэша.
+        body_model: Необязательная pydantic модель или тип тела запроса. Тело
+                        проверяется до обработки, при ошибке возвращается ответ
+                        с кодом 400; разобранное значение доступно в self.body.
+        passthrough (bool): False (значение по умолчанию) - закодированное тело
+                        запроса (RawBody) декодируется до обработки;
+                        True - обработчик получает тело как есть, чтобы переслать
+                        его в другой сервис (см. BaseService.forward_message).
+        partition_key (str): Путь к полю сообщения через точку (например,
+                        "body.account_id"). Запросы с одинаковым значением поля
+                        обрабатываются консьюмером по очереди, в порядке получения
+                        (см. rmq_broker.utils.ordering).
+
+    Метод get_response_body может быть асинхронным генератором, возвращающим тело
+    ответа по частям (например, списки записей). Тогда handle возвращает асинхронный
+    генератор ответов, по одному на каждую часть, а консьюмер передает их клиенту
+    по мере готовности (см. BaseService.stream_message). Такие ответы не кэшируются.
     """
 
     request_type: str = ""
     include_in_schema: bool = True
     deprecated: bool = False
     actual: str = ""
+    sheddable: bool = False
+    cache_ttl: float = 0
+    cache_key: Optional[Callable[[UnprocessedBrokerMessage], Any]] = None
+    passthrough: bool = False
+    partition_key: str = ""
+    body_model: Any = None
+    body: Any = None
 
     async def handle(self, data: UnprocessedBrokerMessage) -> ProcessedBrokerMessage:
         """
@@ -105,6 +147,7 @@ class BaseChain(AbstractChain):
         logger.info(
             "%s.%s: data=%s", self.__class__.__name__, self.handle.__name__, data
         )
+        timer = metrics.timer(self.request_type)
         try:
             UnprocessedMessage(**data)
         except ValidationError as error:
@@ -112,10 +155,17 @@ class BaseChain(AbstractChain):
                 "%s.%s: %s", self.__class__.__name__, self.handle.__name__, str(error)
             )
             return ErrorMessage().generate(message=str(error))
+        if (error_response := self.validate_body(data)) is not None:
+            return error_response
+        timer.lap("validation")
         if self.request_type.lower() == data["request_type"].lower():
-            response = ProcessedMessage().generate()
+            body = self.get_response_body(data)
+            if inspect.isasyncgen(body):
+                return self.stream_response(data, body)
+            response = self.generate_response(data)
             try:
-                response.update(await self.get_response_body(data))
+                response.update(await body)
+                timer.lap("body")
                 logger.debug(
                     "%s.%s: After body update response=%s",
                     self.handle.__name__,
@@ -125,6 +175,7 @@ class BaseChain(AbstractChain):
             except Exception as exc:
                 return ErrorMessage().generate(message=str(exc))
             response.update(self.get_response_header(data))
+            timer.lap("header")
             logger.debug(
                 "%s.%s: After header update response=%s",
                 self.__class__.__name__,
@@ -142,6 +193,7 @@ class BaseChain(AbstractChain):
             )
             try:
                 ProcessedMessage(**response)
+                timer.lap("response_validation")
                 return response
             except ValidationError as error:
                 logger.error(
@@ -160,6 +212,95 @@ class BaseChain(AbstractChain):
             )
             return ErrorMessage().generate(message="Can't handle this request type")
 
+    def generate_response(
+        self, data: UnprocessedBrokerMessage
+    ) -> ProcessedBrokerMessage:
+        """Заготовка ответа того же типа, что и запрос (словарь или Envelope)."""
+        response = ProcessedMessage().generate()
+        if isinstance(data, Envelope):
+            return Envelope.from_dict(response)
+        return response
+
+    async def stream_response(
+        self, data: UnprocessedBrokerMessage, pages: AsyncIterator
+    ) -> AsyncIterator[ProcessedBrokerMessage]:
+        """Формирует ответ на каждую часть тела, которую возвращает генератор
+        get_response_body. Генератор без частей дает один ответ с пустым телом,
+        ошибка генератора - ответ с ошибкой, после которого поток завершается.
+        """
+        header = self.get_response_header(data)
+        empty = True
+        try:
+            async for page in pages:
+                empty = False
+                yield self.form_page(data, header, page)
+        except Exception as exc:
+            logger.error(
+                "%s.%s: %s",
+                self.__class__.__name__,
+                self.stream_response.__name__,
+                str(exc),
+            )
+            yield ErrorMessage().generate_reply(data, message=str(exc))
+            return
+        if empty:
+            yield self.form_page(data, header, [])
+
+    def form_page(
+        self, data: UnprocessedBrokerMessage, header: BrokerMessageHeader, page: Any
+    ) -> ProcessedBrokerMessage:
+        response = ProcessedMessage().generate()
+        response.update(header)
+        response["body"] = page
+        response["status"] = {"message": "", "code": HTTPStatus.OK.value}
+        response["request_id"] = data["request_id"]
+        response["request_type"] = data["request_type"]
+        return response
+
+    @classmethod
+    def get_body_validator(cls) -> Optional[Callable[[Any], Any]]:
+        """Валидатор тела запроса, создается один раз для класса обработчика."""
+        if "_body_validator" not in cls.__dict__:
+            cls._body_validator = build_body_validator(
+                cls.body_model, f"{cls.__name__}Body"
+            )
+        return cls._body_validator
+
+    def validate_body(
+        self, data: UnprocessedBrokerMessage
+    ) -> Optional[ProcessedBrokerMessage]:
+        """Проверяет тело запроса по body_model и сохраняет разобранное значение
+        в self.body. Возвращает ответ с ошибкой, если тело не прошло проверку.
+        """
+        validator = self.get_body_validator()
+        if validator is None or self.passthrough:
+            return None
+        try:
+            self.body = validator(data["body"])
+        except ValidationError as error:
+            logger.error(
+                "%s.%s: Body validation error: %s",
+                self.__class__.__name__,
+                self.validate_body.__name__,
+                str(error),
+            )
+            return ErrorMessage().generate_reply(
+                data, message=f"Body validation error: {error}"
+            )
+        return None
+
+    @classmethod
+    def prepare(cls) -> None:
+        """Подготовка обработчика при запуске консьюмера, до получения сообщений.
+        Переопределяется для дорогих вычислений, результат которых не зависит
+        от запроса.
+        """
+
+    @classmethod
+    def invalidate_cache(cls, data: Optional[UnprocessedBrokerMessage] = None) -> None:
+        """Удаляет из кэша ответ на запрос data или все ответы обработчика."""
+        response_cache.invalidate(cls, data)
+
     def get_response_header(
         self, data: UnprocessedBrokerMessage
     ) -> BrokerMessageHeader:
@@ -194,7 +335,37 @@ class ChainManager(BaseChain, Singleton):
         try:
             UnprocessedMessage(**data)
             chain = self.chains[data["request_type"].lower()]
-            return await chain().handle(data)
+            raw_body = isinstance(data["body"], RawBody) and not chain.passthrough
+            if raw_body:
+                data["body"] = data["body"].decode()
+            record = traffic_capture.record(data)
+            if inspect.isasyncgenfunction(chain.get_response_body):
+                traffic_capture.finish(record)
+                return self.stream(chain, data)
+            timer = metrics.request_timer(chain.request_type)
+            response = None
+            try:
+                with tracer.start_span(
+                    chain.request_type,
+                    data["header"].get(TRACEPARENT),
+                    request_id=str(data["request_id"]),
+                    src=data["header"]["src"],
+                ) as span, active_requests.track(
+                    chain.request_type, data["request_id"]
+                ):
+                    cache_key = self.get_cache_key(chain, data)
+                    response = self.get_cached_response(chain, cache_key, data)
+                    if response is None:
+                        response = await chain().handle(data)
+                        self.cache_response(chain, cache_key, response)
+                    span.set_response(response)
+            finally:
+                timer.finish(response)
+                traffic_capture.finish(record, response)
+            if raw_body and not isinstance(response["body"], RawBody):
+                # Отвечаем закодированным телом тем, кто прислал закодированное.
+                response["body"] = RawBody.encode(response["body"])
+            return response
         except ValidationError as error:
             msg = f"Incoming message validation error: {error}"
         except KeyError as error:
@@ -202,5 +373,83 @@ class ChainManager(BaseChain, Singleton):
         logger.error("%s.%s: %s", self.__class__.__name__, self.handle.__name__, msg)
         return ErrorMessage().generate(message=msg)
 
+    async def stream(
+        self, chain: BaseChain, data: UnprocessedBrokerMessage
+    ) -> AsyncIterator[ProcessedBrokerMessage]:
+        """Передает части ответа обработчика-генератора. Метрики и span
+        запроса охватывают формирование всех частей.
+        """
+        timer = metrics.request_timer(chain.request_type)
+        response = None
+        try:
+            with tracer.start_span(
+                chain.request_type,
+                data["header"].get(TRACEPARENT),
+                request_id=str(data["request_id"]),
+                src=data["header"]["src"],
+            ) as span, active_requests.track(chain.request_type, data["request_id"]):
+                pages = await chain().handle(data)
+                if isinstance(pages, Mapping):
+                    response = pages
+                    yield response
+                else:
+                    async for response in pages:
+                        yield response
+                span.set_response(response)
+        finally:
+            timer.finish(response)
+
+    def prepare_chains(self) -> None:
+        """Подготавливает все обработчики (см. BaseChain.prepare)."""
+        for chain in self.chains.values():
+            chain.prepare()
+
+    def get_cache_key(
+        self, chain: BaseChain, data: UnprocessedBrokerMessage
+    ) -> Optional[str]:
+        """Ключ кэша запроса или None, если обработчик не кэширует ответы."""
+        if not chain.cache_ttl:
+            return None
+        return response_cache.make_key(chain, data)
+
+    def get_cached_response(
+        self, chain: BaseChain, cache_key: Optional[str], data: UnprocessedBrokerMessage
+    ) -> Optional[ProcessedBrokerMessage]:
+        """Формирует ответ из кэша, если обработчик кэширует ответы."""
+        if cache_key is None:
+            return None
+        cached = response_cache.get(chain, cache_key)
+        if cached is None:
+            return None
+        handler = chain()
+        response = handler.generate_response(data)
+        response.update(
+            handler.form_response(
+                data,
+                cached["body"],
+                cached["status"]["code"],
+                cached["status"]["message"],
+            )
+        )
+        response.update(handler.get_response_header(data))
+        response["request_id"] = data["request_id"]
+        response["request_type"] = data["request_type"]
+        logger.debug(
+            "%s.%s: Cached response=%s",
+            self.__class__.__name__,
+            self.get_cached_response.__name__,
+            response,
+        )
+        return response
+
+    def cache_response(
+        self,
+        chain: BaseChain,
+        cache_key: Optional[str],
+        response: ProcessedBrokerMessage,
+    ) -> None:
+        if cache_key is not None:
+            response_cache.set(chain, cache_key, response)
+
     async def get_response_body(self, data):
         pass
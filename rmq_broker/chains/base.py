@@ -1,4 +1,3 @@
-import logging
 from abc import abstractmethod
 
 from pydantic.error_wrappers import ValidationError
@@ -7,9 +6,15 @@ from rmq_broker.async_chains.base import BaseChain as AsyncBaseChain
 from rmq_broker.async_chains.base import ChainManager as AsyncChainManager
 from rmq_broker.models import ErrorMessage, ProcessedMessage, UnprocessedMessage
 from rmq_broker.schemas import ProcessedBrokerMessage, UnprocessedBrokerMessage
+from rmq_broker.utils.active import active_requests
+from rmq_broker.utils.capture import traffic_capture
+from rmq_broker.utils.logger import get_logger
+from rmq_broker.utils.metrics import metrics
+from rmq_broker.utils.raw_body import RawBody
 from rmq_broker.utils.singleton import Singleton
+from rmq_broker.utils.tracing import TRACEPARENT, tracer
 
-logger = logging.getLogger(__name__)
+logger = get_logger(__name__)
 
 
 class BaseChain(AsyncBaseChain):
@@ -33,6 +38,7 @@ class BaseChain(AsyncBaseChain):
         logger.info(
             "%s.%s: data=%s", self.__class__.__name__, self.handle.__name__, data
         )
+        timer = metrics.timer(self.request_type)
         try:
             UnprocessedMessage(**data)
         except ValidationError as error:
@@ -40,10 +46,14 @@ class BaseChain(AsyncBaseChain):
                 "%s.%s: %s", self.__class__.__name__, self.handle.__name__, str(error)
             )
             return ErrorMessage().generate(message=str(error))
+        if (error_response := self.validate_body(data)) is not None:
+            return error_response
+        timer.lap("validation")
         if self.request_type.lower() == data["request_type"].lower():
             response = ProcessedMessage().generate()
             try:
                 response.update(self.get_response_body(data))
+                timer.lap("body")
                 logger.debug(
                     "%s.%s: After body update response=%s",
                     self.__class__.__name__,
@@ -53,6 +63,7 @@ class BaseChain(AsyncBaseChain):
             except Exception as exc:
                 return ErrorMessage().generate(message=str(exc))
             response.update(self.get_response_header(data))
+            timer.lap("header")
             logger.debug(
                 "%s.%s: After header update response=%s",
                 self.__class__.__name__,
@@ -70,6 +81,7 @@ class BaseChain(AsyncBaseChain):
             )
             try:
                 ProcessedMessage(**response)
+                timer.lap("response_validation")
                 return response
             except ValidationError as error:
                 logger.error(
@@ -103,7 +115,34 @@ class ChainManager(AsyncChainManager, Singleton):
         try:
             UnprocessedMessage(**data)
             chain = self.chains[data["request_type"].lower()]
-            return chain().handle(data)
+            raw_body = isinstance(data["body"], RawBody) and not chain.passthrough
+            if raw_body:
+                data["body"] = data["body"].decode()
+            record = traffic_capture.record(data)
+            timer = metrics.request_timer(chain.request_type)
+            response = None
+            try:
+                with tracer.start_span(
+                    chain.request_type,
+                    data["header"].get(TRACEPARENT),
+                    request_id=str(data["request_id"]),
+                    src=data["header"]["src"],
+                ) as span, active_requests.track(
+                    chain.request_type, data["request_id"]
+                ):
+                    cache_key = self.get_cache_key(chain, data)
+                    response = self.get_cached_response(chain, cache_key, data)
+                    if response is None:
+                        response = chain().handle(data)
+                        self.cache_response(chain, cache_key, response)
+                    span.set_response(response)
+            finally:
+                timer.finish(response)
+                traffic_capture.finish(record, response)
+            if raw_body and not isinstance(response["body"], RawBody):
+                # Отвечаем закодированным телом тем, кто прислал закодированное.
+                response["body"] = RawBody.encode(response["body"])
+            return response
         except ValidationError as error:
             msg = f"Incoming message validation error: {error}"
         except KeyError as error:
@@ -0,0 +1,56 @@
+"""Формирование документации OpenAPI при сборке сервиса.
+
+    python -m rmq_broker.documentation service.chains -o openapi.json
+
+Импортирует модули с обработчиками и записывает документ в файл. Чтобы обработчик
+документации не формировал документ при запуске, укажите файл в openapi_file:
+
+    class Docs(PydanticModelsChainMixin, AsyncDocsChain):
+        request_type = "docs"
+        openapi_file = "openapi.json"
+"""
+
+import argparse
+import importlib
+import sys
+
+from rmq_broker.async_chains.base import ChainManager
+from rmq_broker.documentation.base import BaseDocsChain
+from rmq_broker.documentation.mixins.pydantic.chains import PydanticModelsChainMixin
+
+
+class BuildDocsChain(PydanticModelsChainMixin, BaseDocsChain):
+    pass
+
+
+def get_docs_chain() -> type:
+    """Обработчик документации сервиса или обработчик по умолчанию."""
+    for chain in ChainManager().chains.values():
+        if issubclass(chain, BaseDocsChain):
+            return chain
+    return BuildDocsChain
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m rmq_broker.documentation",
+        description="Записывает документацию OpenAPI обработчиков в JSON файл.",
+    )
+    parser.add_argument("modules", nargs="+", help="Модули с обработчиками.")
+    parser.add_argument("-o", "--output", help="Файл документа (по умолчанию stdout).")
+    args = parser.parse_args(argv)
+
+    for module in args.modules:
+        importlib.import_module(module)
+    docs_chain = get_docs_chain()
+    docs_chain.openapi_file = ""
+    docs_chain.prepare()
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(docs_chain.openapi_json)
+    else:
+        sys.stdout.write(docs_chain.openapi_json + "\n")
+
+
+if __name__ == "__main__":
+    main()
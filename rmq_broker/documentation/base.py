@@ -1,20 +1,42 @@
+import hashlib
+import json
 from collections import defaultdict
+from http import HTTPStatus
 from typing import Tuple
 
 from rmq_broker.async_chains.base import BaseChain as AsyncBaseChain
 from rmq_broker.async_chains.base import ChainManager
 from rmq_broker.chains.base import BaseChain
 from rmq_broker.schemas import ProcessedBrokerMessage, UnprocessedBrokerMessage
-from rmq_broker.settings import settings
+from rmq_broker.settings import lazy_setting, settings
+from rmq_broker.utils.raw_body import RawBody
 
 from . import REF_PREFIX
 from .models import OpenAPI
 from .utils import get_class_dir
 
+CONTENT_HASH = "x-content-hash"
+
 
 class BaseDocsChain:
+    """Документация OpenAPI по обработчикам сервиса.
+
+    Документ формируется один раз при запуске консьюмера (prepare) или заранее
+    командой `python -m rmq_broker.documentation` и загружается из файла
+    openapi_file. В документе хранится хэш содержимого (x-content-hash). Если в теле
+    запроса передан известный клиенту хэш {"hash": ...} и документ не изменился,
+    возвращается ответ с кодом 304 без документа.
+
+    Документ передается в ответе закодированным (RawBody): он кодируется один раз,
+    а клиент получает собственную копию.
+    """
+
     openapi: dict = {}
-    title: str = settings.SERVICE_NAME
+    openapi_body: RawBody = RawBody()
+    openapi_hash: str = ""
+    openapi_json: str = ""
+    openapi_file: str = ""
+    title = lazy_setting(lambda cls: settings.SERVICE_NAME)
     openapi_version: str = "3.0.2"
     version: str = "0.1"
     include_in_schema = False
@@ -83,20 +105,53 @@ class BaseDocsChain:
         )
         return OpenAPI(**output).dict(by_alias=True, exclude_none=True)
 
+    @classmethod
+    def prepare(cls) -> None:
+        """Формирует документ, если он еще не сформирован для класса."""
+        if "openapi" in cls.__dict__:
+            return
+        if cls.openapi_file:
+            with open(cls.openapi_file, encoding="utf-8") as file:
+                document = json.load(file)
+        else:
+            document = cls().make_openapi(chain_manager=ChainManager())
+        cls.set_document(document)
+
+    @classmethod
+    def set_document(cls, document: dict) -> None:
+        """Сохраняет документ вместе с его JSON представлением, хэшем и телом ответа."""
+        document.pop(CONTENT_HASH, None)
+        content = json.dumps(document, sort_keys=True, ensure_ascii=False)
+        cls.openapi_hash = hashlib.sha256(content.encode()).hexdigest()
+        document[CONTENT_HASH] = cls.openapi_hash
+        cls.openapi = document
+        cls.openapi_json = json.dumps(document, ensure_ascii=False, indent=2)
+        cls.openapi_body = RawBody.encode(document)
+
+    def get_document_response(
+        self, data: UnprocessedBrokerMessage
+    ) -> ProcessedBrokerMessage:
+        self.prepare()
+        body = data.get("body")
+        if isinstance(body, dict) and body.get("hash") == self.openapi_hash:
+            return self.form_response(
+                data,
+                {"hash": self.openapi_hash},
+                HTTPStatus.NOT_MODIFIED.value,
+                "Not Modified",
+            )
+        return self.form_response(data, self.openapi_body)
+
 
 class DocsChain(BaseDocsChain, BaseChain):
     def get_response_body(
         self, data: UnprocessedBrokerMessage
     ) -> ProcessedBrokerMessage:
-        if not self.openapi:
-            self.openapi = self.make_openapi(chain_manager=ChainManager())
-        return self.form_response(data, self.openapi)
+        return self.get_document_response(data)
 
 
 class AsyncDocsChain(BaseDocsChain, AsyncBaseChain):
     async def get_response_body(
         self, data: UnprocessedBrokerMessage
     ) -> ProcessedBrokerMessage:
-        if not self.openapi:
-            self.openapi = self.make_openapi(chain_manager=ChainManager())
-        return self.form_response(data, self.openapi)
+        return self.get_document_response(data)
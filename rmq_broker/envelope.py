@@ -0,0 +1,232 @@
+"""Компактное представление сообщения брокера.
+
+Сообщение хранится в одном объекте со `__slots__`, а не во вложенных словарях.
+Объект поддерживает интерфейс словаря, поэтому обработчики работают с ним так же,
+как с обычным сообщением:
+
+    envelope = Envelope.from_dict(message)
+    envelope["header"]["src"]
+    envelope.update({"status": {"message": "OK", "code": 200}})
+
+Ключи `header` и `status` возвращают представления, которые читают и меняют поля
+самого объекта. При сериализации (pickle) конверт и представления превращаются
+в обычные словари, поэтому получатель работает со словарями.
+
+Включается для консьюмера настройкой `settings.CONSUMERS[<брокер>]["envelope"] = True`.
+"""
+
+import functools
+from collections.abc import Mapping, MutableMapping
+from typing import Any, Callable, Iterator, Optional
+
+HEADER_FIELDS = ("src", "dst")
+STATUS_FIELDS = ("message", "code")
+FIELDS = ("request_type", "request_id", "body")
+
+
+class HeaderView(MutableMapping):
+    """Заголовок сообщения: поля src и dst конверта и дополнительные ключи."""
+
+    __slots__ = ("envelope",)
+
+    def __init__(self, envelope: "Envelope") -> None:
+        self.envelope = envelope
+
+    def __getitem__(self, key: str) -> Any:
+        if key in HEADER_FIELDS:
+            return getattr(self.envelope, key)
+        if self.envelope.header_extra is None:
+            raise KeyError(key)
+        return self.envelope.header_extra[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key in HEADER_FIELDS:
+            setattr(self.envelope, key, value)
+        else:
+            if self.envelope.header_extra is None:
+                self.envelope.header_extra = {}
+            self.envelope.header_extra[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        if key in HEADER_FIELDS or self.envelope.header_extra is None:
+            raise KeyError(key)
+        del self.envelope.header_extra[key]
+
+    def __iter__(self) -> Iterator[str]:
+        yield from HEADER_FIELDS
+        if self.envelope.header_extra:
+            yield from self.envelope.header_extra
+
+    def __len__(self) -> int:
+        return len(HEADER_FIELDS) + len(self.envelope.header_extra or ())
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+class StatusView(MutableMapping):
+    """Статус сообщения: поля message и code конверта."""
+
+    __slots__ = ("envelope",)
+
+    def __init__(self, envelope: "Envelope") -> None:
+        self.envelope = envelope
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in STATUS_FIELDS:
+            raise KeyError(key)
+        return getattr(self.envelope, key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key not in STATUS_FIELDS:
+            raise KeyError(key)
+        setattr(self.envelope, key, value)
+
+    def __delitem__(self, key: str) -> None:
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(STATUS_FIELDS)
+
+    def __len__(self) -> int:
+        return len(STATUS_FIELDS)
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+class Envelope(MutableMapping):
+    """Сообщение брокера с интерфейсом словаря.
+
+    Статус есть у сообщения, только если задан code. Ключи, которых нет
+    в структуре сообщения, хранятся в дополнительном словаре.
+    """
+
+    __slots__ = (
+        "request_type",
+        "request_id",
+        "body",
+        "src",
+        "dst",
+        "message",
+        "code",
+        "header_extra",
+        "extra",
+    )
+
+    def __init__(
+        self,
+        request_type: str = "",
+        request_id: Any = None,
+        body: Any = None,
+        src: str = "",
+        dst: str = "",
+        message: str = "",
+        code: Optional[int] = None,
+    ) -> None:
+        self.request_type = request_type
+        self.request_id = request_id
+        self.body = body
+        self.src = src
+        self.dst = dst
+        self.message = message
+        self.code = code
+        self.header_extra: Optional[dict] = None
+        self.extra: Optional[dict] = None
+
+    @classmethod
+    def from_dict(cls, data: Mapping) -> "Envelope":
+        envelope = cls()
+        envelope.update(data)
+        return envelope
+
+    def to_dict(self) -> dict:
+        """Сообщение в виде вложенных словарей."""
+        data = {
+            "request_type": self.request_type,
+            "request_id": self.request_id,
+            "body": self.body,
+            "header": dict(HeaderView(self)),
+        }
+        if self.code is not None:
+            data["status"] = {"message": self.message, "code": self.code}
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def __getitem__(self, key: str) -> Any:
+        if key in FIELDS:
+            return getattr(self, key)
+        if key == "header":
+            return HeaderView(self)
+        if key == "status" and self.code is not None:
+            return StatusView(self)
+        if self.extra is None or key == "status":
+            raise KeyError(key)
+        return self.extra[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key in FIELDS:
+            setattr(self, key, value)
+        elif key == "header":
+            value = dict(value)
+            self.header_extra = None
+            HeaderView(self).update(value)
+        elif key == "status":
+            if value is None:
+                self.code = None
+            else:
+                self.message = value["message"]
+                self.code = value["code"]
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        if key == "status" and self.code is not None:
+            self.code = None
+        elif self.extra is not None and key in self.extra:
+            del self.extra[key]
+        else:
+            raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        yield from FIELDS
+        yield "header"
+        if self.code is not None:
+            yield "status"
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self) -> int:
+        return 4 + (self.code is not None) + len(self.extra or ())
+
+    def __reduce__(self):
+        return dict, (self.to_dict(),)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.to_dict()!r})"
+
+
+def wrap_envelope(worker: Callable) -> Callable:
+    """Оборачивает обработчик сообщений консьюмера: входящее сообщение передается
+    обработчику в виде конверта.
+    """
+    from aiormq.tools import awaitable
+
+    worker = awaitable(worker)
+
+    @functools.wraps(worker)
+    async def with_envelope(data):
+        if isinstance(data, dict):
+            data = Envelope.from_dict(data)
+        return await worker(data=data)
+
+    return with_envelope
@@ -14,11 +14,53 @@ dst и src. Вложенная структура(header, status) формиру
     >>> {"header": {"src": "", "dst": "destination"}, "request_type": "creation"...}
 """
 
-from typing import Iterable, Optional, Union
+import copy
+import functools
+from http import HTTPStatus
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple, Type, Union
 from uuid import UUID, uuid4
 
 from pydantic import BaseModel, Field
-from starlette import status as http_code
+
+
+class MessageTemplate:
+    """Значения по умолчанию модели сообщения, вычисленные один раз для класса.
+
+    Для каждого поля DefaultValues хранит значение по умолчанию и функцию, которая
+    создает новое значение при каждой генерации (default_factory или копирование
+    изменяемого значения), а также признак приведения переданного значения к str.
+    Используется в BaseMessage.generate_flat_message.
+    """
+
+    __slots__ = ("fields",)
+
+    def __init__(self, model: Type["BaseMessage"]) -> None:
+        self.fields: Tuple[Tuple[str, Any, Optional[Callable], bool], ...] = tuple(
+            self.compile_field(name, field)
+            for name, field in model.DefaultValues.__fields__.items()
+        )
+
+    @staticmethod
+    def compile_field(name: str, field) -> Tuple[str, Any, Optional[Callable], bool]:
+        factory = field.default_factory
+        default = field.get_default()
+        if factory is None and isinstance(default, (dict, list, set)):
+            factory = functools.partial(copy.deepcopy, default)
+        return name, default, factory, isinstance(default, str)
+
+    def flat_message(self, fields: Dict[str, Any]) -> dict:
+        flat_message = dict()
+        for field_name, default_value, factory, is_str in self.fields:
+            if value := fields.get(field_name):
+                if is_str:
+                    value = str(value)
+                flat_message[field_name] = value
+            else:
+                flat_message[field_name] = factory() if factory else default_value
+        return flat_message
+
+
+_templates: Dict[type, MessageTemplate] = {}
 
 
 class MessageHeader(BaseModel):
@@ -51,19 +93,34 @@ class BaseMessage(BaseModel):
         flat_message = self.generate_flat_message(**fields)
         return self.get_structured_message(flat_message)
 
+    @classmethod
+    def get_template(cls) -> MessageTemplate:
+        """Значения по умолчанию класса сообщения, вычисляются при первом вызове."""
+        try:
+            return _templates[cls]
+        except KeyError:
+            template = _templates[cls] = MessageTemplate(cls)
+            return template
+
+    def generate_reply(self, data: dict, **fields) -> dict:
+        """Генерирует ответ на сообщение data: сохраняет request_id и request_type,
+        меняет местами получателя и отправителя.
+        """
+        header = data.get("header") or {}
+        reply_fields = {
+            "request_id": data.get("request_id"),
+            "request_type": data.get("request_type"),
+            "src": header.get("dst"),
+            "dst": header.get("src"),
+        }
+        reply_fields.update(fields)
+        return self.generate(**reply_fields)
+
     def generate_flat_message(self, **fields) -> dict:
         """Заполняет плоскую структуру сообщения переданными значениями.
         Если значение не указано - берет его из DefaultValues.
         """
-        flat_message = dict()
-        for field_name, default_value in self.DefaultValues().dict().items():
-            if value := fields.get(field_name):
-                if isinstance(default_value, str):
-                    value = str(value)
-                flat_message[field_name] = value
-            else:
-                flat_message[field_name] = default_value
-        return flat_message
+        return self.get_template().flat_message(fields)
 
     def get_structured_message(self, flat_message: dict) -> dict:
         """Создает вложенность в плоском сообщении."""
@@ -117,12 +174,12 @@ class BaseMessage(BaseModel):
         src: str = ""
         dst: str = ""
         message: str = "OK"
-        code: int = http_code.HTTP_200_OK
+        code: int = HTTPStatus.OK.value
 
 
 class ErrorMessage(BaseMessage):
     class DefaultValues(BaseMessage.DefaultValues):
-        code = http_code.HTTP_400_BAD_REQUEST
+        code = HTTPStatus.BAD_REQUEST.value
         message = "Error"
 
 
@@ -0,0 +1,300 @@
+"""Профилирование работающего консьюмера по запросу.
+
+Обработчик подключается в сервисе так же, как обработчик документации:
+
+    class Profile(AsyncProfilingChain):
+        request_type = "profile"
+
+Запрос {"mode": "sampling", "duration": 10} запускает профилировщик на duration
+секунд (не больше max_duration) и возвращает результаты, сгруппированные
+по `request_type` обрабатывавшихся запросов:
+
+    "sampling"    - поток профилировщика каждые `interval` секунд записывает стек
+                    цикла событий и тип запроса, который обрабатывает текущая
+                    задача; для каждого типа возвращаются число отсчетов и функции
+                    с наибольшим числом отсчетов (self - функция выполнялась,
+                    total - функция была в стеке);
+    "cprofile"    - cProfile в потоке цикла событий; для каждого типа возвращается
+                    время выполнения get_response_body обработчика (cumtime)
+                    и число возобновлений корутины, а также функции с наибольшим
+                    cumtime;
+    "tracemalloc" - разница снимков памяти в начале и в конце профилирования;
+                    для каждого типа возвращается объем памяти, выделенной
+                    в get_response_body обработчика и вызываемых им функциях.
+
+Одновременно выполняется только одно профилирование, повторный запрос получает
+ответ с кодом 409. Клиент должен ждать ответ дольше duration секунд.
+"""
+
+import asyncio
+import cProfile
+import dis
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from http import HTTPStatus
+from typing import Dict, FrozenSet, List, Literal, Optional, Tuple
+
+from pydantic import BaseModel, confloat, conint
+
+from rmq_broker.async_chains.base import BaseChain as AsyncBaseChain
+from rmq_broker.async_chains.base import ChainManager
+from rmq_broker.schemas import ProcessedBrokerMessage, UnprocessedBrokerMessage
+from rmq_broker.utils.active import active_requests
+
+IDLE = "<idle>"
+UNTRACKED = "<untracked>"
+
+FunctionKey = Tuple[str, int, str]
+
+
+class ProfilingRequest(BaseModel):
+    mode: Literal["sampling", "cprofile", "tracemalloc"] = "sampling"
+    duration: confloat(gt=0) = 10
+    interval: confloat(gt=0) = 0.005
+    limit: conint(gt=0) = 20
+    nframes: conint(gt=0) = 25
+
+
+def format_function(key: FunctionKey) -> str:
+    filename, line, name = key
+    return f"{filename}:{line}({name})"
+
+
+def chain_code_map() -> Dict[object, str]:
+    """Объекты кода get_response_body обработчиков и их типы запросов."""
+    return {
+        chain.get_response_body.__code__: request_type
+        for request_type, chain in ChainManager.chains.items()
+        if hasattr(chain.get_response_body, "__code__")
+    }
+
+
+def chain_line_map() -> Dict[str, List[Tuple[FrozenSet[int], str]]]:
+    """Строки get_response_body обработчиков по файлам и их типы запросов."""
+    result = defaultdict(list)
+    for code, request_type in chain_code_map().items():
+        lines = frozenset(line for _, line in dis.findlinestarts(code) if line)
+        result[code.co_filename].append((lines, request_type))
+    return result
+
+
+class SamplingProfiler:
+    """Отсчеты стека цикла событий с типом запроса текущей задачи."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, interval: float) -> None:
+        self.loop = loop
+        self.loop_thread_id = threading.get_ident()
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self.self_counts: Dict[str, Counter] = defaultdict(Counter)
+        self.total_counts: Dict[str, Counter] = defaultdict(Counter)
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        active_requests.enable()
+        self._thread = threading.Thread(
+            target=self.run, name="rmq-broker-profiler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+        active_requests.disable()
+
+    def run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self.sample()
+
+    def sample(self) -> None:
+        frame = sys._current_frames().get(self.loop_thread_id)
+        task, info = active_requests.current(self.loop)
+        if task is None:
+            request_type = IDLE
+        else:
+            request_type = info[0] if info else UNTRACKED
+        self.samples[request_type] += 1
+        seen = set()
+        leaf = True
+        while frame is not None:
+            code = frame.f_code
+            key = (code.co_filename, code.co_firstlineno, code.co_name)
+            if leaf:
+                self.self_counts[request_type][key] += 1
+                leaf = False
+            if key not in seen:
+                seen.add(key)
+                self.total_counts[request_type][key] += 1
+            frame = frame.f_back
+
+    def result(self, limit: int) -> dict:
+        total = sum(self.samples.values())
+        request_types = {}
+        for request_type, count in self.samples.most_common():
+            functions = self.total_counts[request_type].most_common(limit)
+            request_types[request_type] = {
+                "samples": count,
+                "share": count / total,
+                "functions": [
+                    {
+                        "function": format_function(key),
+                        "self": self.self_counts[request_type][key],
+                        "total": value,
+                    }
+                    for key, value in functions
+                ],
+            }
+        return {"samples": total, "request_types": request_types}
+
+
+def cprofile_result(profiler: cProfile.Profile, limit: int) -> dict:
+    stats = pstats.Stats(profiler).stats
+    codes = {
+        (code.co_filename, code.co_firstlineno, code.co_name): request_type
+        for code, request_type in chain_code_map().items()
+    }
+    request_types = {}
+    for key, (_, calls, tottime, cumtime, _) in stats.items():
+        if key in codes:
+            request_types[codes[key]] = {"calls": calls, "cumtime": cumtime}
+    functions = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)
+    return {
+        "request_types": request_types,
+        "functions": [
+            {
+                "function": format_function(key),
+                "calls": calls,
+                "tottime": tottime,
+                "cumtime": cumtime,
+            }
+            for key, (_, calls, tottime, cumtime, _) in functions[:limit]
+        ],
+    }
+
+
+def find_request_type(
+    traceback: tracemalloc.Traceback,
+    chain_lines: Dict[str, List[Tuple[FrozenSet[int], str]]],
+) -> str:
+    """Тип запроса обработчика, ближайшего к месту выделения памяти."""
+    for frame in reversed(traceback):
+        for lines, request_type in chain_lines.get(frame.filename, ()):
+            if frame.lineno in lines:
+                return request_type
+    return UNTRACKED
+
+
+def tracemalloc_result(
+    before: tracemalloc.Snapshot, after: tracemalloc.Snapshot, limit: int
+) -> dict:
+    chain_lines = chain_line_map()
+    sizes: Counter = Counter()
+    counts: Counter = Counter()
+    for diff in after.compare_to(before, "traceback"):
+        request_type = find_request_type(diff.traceback, chain_lines)
+        sizes[request_type] += diff.size_diff
+        counts[request_type] += diff.count_diff
+    return {
+        "request_types": {
+            request_type: {"size_diff": size, "count_diff": counts[request_type]}
+            for request_type, size in sizes.most_common()
+        },
+        "lines": [
+            {
+                "line": f"{diff.traceback[0].filename}:{diff.traceback[0].lineno}",
+                "size_diff": diff.size_diff,
+                "count_diff": diff.count_diff,
+            }
+            for diff in after.compare_to(before, "lineno")[:limit]
+        ],
+    }
+
+
+def take_snapshot() -> tracemalloc.Snapshot:
+    """Снимок памяти без выделений самого tracemalloc."""
+    return tracemalloc.take_snapshot().filter_traces(
+        [tracemalloc.Filter(False, tracemalloc.__file__)]
+    )
+
+
+class BaseProfilingChain:
+    """Профилирование консьюмера: сэмплирующий профилировщик, cProfile или
+    снимки tracemalloc (см. описание модуля).
+    """
+
+    include_in_schema = False
+    body_model = ProfilingRequest
+    max_duration: float = 60
+    _lock = threading.Lock()
+
+    async def profile(self, data: UnprocessedBrokerMessage) -> ProcessedBrokerMessage:
+        request: ProfilingRequest = self.body
+        if not self._lock.acquire(blocking=False):
+            return self.form_response(
+                data,
+                code=HTTPStatus.CONFLICT.value,
+                message="Profiling is already running",
+            )
+        try:
+            duration = min(request.duration, self.max_duration)
+            started = time.monotonic()
+            try:
+                body = await getattr(self, f"profile_{request.mode}")(request, duration)
+            except ValueError as error:
+                # Другой профилировщик уже установлен (sys.setprofile).
+                return self.form_response(
+                    data, code=HTTPStatus.CONFLICT.value, message=str(error)
+                )
+            body.update(mode=request.mode, duration=time.monotonic() - started)
+            return self.form_response(data, body)
+        finally:
+            self._lock.release()
+
+    async def profile_sampling(
+        self, request: ProfilingRequest, duration: float
+    ) -> dict:
+        profiler = SamplingProfiler(asyncio.get_running_loop(), request.interval)
+        profiler.start()
+        try:
+            await asyncio.sleep(duration)
+        finally:
+            profiler.stop()
+        return profiler.result(request.limit)
+
+    async def profile_cprofile(
+        self, request: ProfilingRequest, duration: float
+    ) -> dict:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await asyncio.sleep(duration)
+        finally:
+            profiler.disable()
+        return cprofile_result(profiler, request.limit)
+
+    async def profile_tracemalloc(
+        self, request: ProfilingRequest, duration: float
+    ) -> dict:
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start(request.nframes)
+        try:
+            before = take_snapshot()
+            await asyncio.sleep(duration)
+            after = take_snapshot()
+        finally:
+            if started:
+                tracemalloc.stop()
+        return tracemalloc_result(before, after, request.limit)
+
+
+class AsyncProfilingChain(BaseProfilingChain, AsyncBaseChain):
+    async def get_response_body(
+        self, data: UnprocessedBrokerMessage
+    ) -> ProcessedBrokerMessage:
+        return await self.profile(data)
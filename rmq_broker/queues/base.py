@@ -1,9 +1,29 @@
-import logging
 from abc import ABC, abstractmethod
+from collections.abc import Mapping
+from typing import Callable
 
+from rmq_broker.async_chains.base import ChainManager
+from rmq_broker.envelope import wrap_envelope
+from rmq_broker.schemas import UnprocessedBrokerMessage
 from rmq_broker.settings import settings
+from rmq_broker.utils.admission import AdmissionController
+from rmq_broker.utils.batching import wrap_batch
+from rmq_broker.utils.dedup import RequestDeduplicator
+from rmq_broker.utils.logger import get_logger
+from rmq_broker.utils.ordering import OrderedDispatcher, get_ordering_config
+from rmq_broker.utils.scheduling import FairScheduler
+from rmq_broker.utils.shadow import ShadowMirror
+from rmq_broker.utils.watchdog import LoopWatchdog
 
-logger = logging.getLogger(__name__)
+logger = get_logger(__name__)
+
+
+def is_sheddable(data: UnprocessedBrokerMessage) -> bool:
+    """Проверяет, что обработчик запроса разрешает отклонять его при перегрузке."""
+    if not isinstance(data, Mapping):
+        return False
+    chain = ChainManager.chains.get(str(data.get("request_type", "")).lower())
+    return bool(chain and chain.sheddable)
 
 
 class AsyncAbstractMessageQueue(ABC):
@@ -14,9 +34,29 @@ class AsyncAbstractMessageQueue(ABC):
         if self.MessageQueue == "":
             raise AttributeError("Broker name has not been set.")
         self.config = settings.CONSUMERS.get(self.MessageQueue)
-        self.broker_url = self.config["broker_url"]
+        self.broker_url = self.config.get("broker_url")
         self.connection = None
         self.client_properties = None
+        self.admission = None
+        if admission_config := self.config.get("admission"):
+            self.admission = AdmissionController(
+                **admission_config,
+                is_sheddable=is_sheddable,
+                throttle=self.throttle,
+                unthrottle=self.unthrottle,
+            )
+        self.deduplicator = None
+        if deduplication_config := self.config.get("deduplication"):
+            self.deduplicator = RequestDeduplicator(**deduplication_config)
+        self.scheduler = None
+        if scheduling_config := self.config.get("fair_scheduling"):
+            self.scheduler = FairScheduler(**scheduling_config)
+        self.shadow = None
+        if shadow_config := self.config.get("shadow"):
+            self.shadow = ShadowMirror(**shadow_config, post=self.post_message)
+        self.watchdog = None
+        if watchdog_config := self.config.get("watchdog"):
+            self.watchdog = LoopWatchdog(**watchdog_config)
         logger.debug(
             "%s.%s: Initialized", self.__class__.__name__, self.__init__.__name__
         )
@@ -40,3 +80,51 @@ class AsyncAbstractMessageQueue(ABC):
     @abstractmethod
     async def post_message(self):
         pass
+
+    async def throttle(self) -> None:
+        """Ограничивает получение новых сообщений при перегрузке."""
+
+    async def unthrottle(self) -> None:
+        pass
+
+    def start_consumer_tasks(self) -> None:
+        """Запускает фоновые задачи консьюмера. Вызывается из цикла событий
+        после подключения к брокеру.
+        """
+        if self.admission is not None:
+            self.admission.start()
+        if self.watchdog is not None:
+            self.watchdog.start()
+
+    async def stop_consumer_tasks(self) -> None:
+        if self.admission is not None:
+            await self.admission.stop()
+        if self.watchdog is not None:
+            self.watchdog.stop()
+
+    def wrap_worker(self, worker: Callable) -> Callable:
+        """Оборачивает обработчик сообщений включенными в настройках механизмами
+        консьюмера. Пакеты запросов (см. rmq_broker.utils.batching) принимаются
+        всегда, каждый запрос пакета проходит через все механизмы отдельно.
+        """
+        if self.config.get("envelope"):
+            worker = wrap_envelope(worker)
+        if self.shadow is not None:
+            worker = self.shadow.wrap(worker)
+        if self.scheduler is not None:
+            worker = self.scheduler.wrap(worker)
+        ordering_config = get_ordering_config(self.config)
+        if ordering_config is not None:
+            worker = OrderedDispatcher(**ordering_config).wrap(worker)
+        if self.admission is not None:
+            worker = self.admission.wrap(worker)
+        if self.deduplicator is not None:
+            worker = self.deduplicator.wrap(worker)
+        return wrap_batch(self.wrap_broker_worker(worker))
+
+    def wrap_broker_worker(self, worker: Callable) -> Callable:
+        """Механизмы консьюмера, доступные только для конкретного брокера.
+        Оборачивают остальные механизмы: запрос учитывается с момента доставки
+        сообщения, в том числе пока он ждет очереди планировщика или партиции.
+        """
+        return worker
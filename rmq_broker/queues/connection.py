@@ -0,0 +1,60 @@
+import asyncio
+from typing import Optional
+
+import aio_pika
+from aio_pika import RobustConnection
+from yarl import URL
+
+from rmq_broker.utils.logger import get_logger
+from rmq_broker.utils.nodes import BrokerNodes, censor
+
+logger = get_logger(__name__)
+
+
+class FailoverConnection(RobustConnection):
+    """Соединение, которое после разрыва переподключается к другому узлу кластера.
+
+    Узел помечается недоступным, а адрес меняется на следующий узел после каждой
+    неудачи: и при разрыве установленного соединения, и при неудачной попытке
+    переподключения (aio-pika сообщает о ней тем же обратным вызовом закрытия).
+    Поэтому переподключение перебирает все узлы кластера, а не повторяет попытки
+    к одному недоступному узлу.
+    """
+
+    nodes: Optional[BrokerNodes] = None
+    node_url: str = ""
+    queue: Optional[str] = None
+
+    def failover(self) -> None:
+        """Помечает текущий узел недоступным и переключает адрес на следующий."""
+        self.nodes.mark_failed(self.node_url)
+        self.node_url = self.nodes.next_url(self.node_url, self.queue)
+        self.url = URL(self.node_url)
+        logger.info(
+            "%s.%s: Reconnecting to %s",
+            self.__class__.__name__,
+            self.failover.__name__,
+            censor(self.node_url),
+        )
+
+    async def _on_connection_close(self, closing: asyncio.Future) -> None:
+        if self.nodes is not None and not (self._close_called or self.is_closed):
+            self.failover()
+        await super()._on_connection_close(closing)
+
+    async def _on_connected(self, transport) -> None:
+        await super()._on_connected(transport)
+        if self.nodes is not None:
+            self.nodes.mark_available(self.node_url)
+
+
+async def connect_failover(
+    url: str, nodes: BrokerNodes, queue: Optional[str] = None, **kwargs
+) -> FailoverConnection:
+    connection = await aio_pika.connect_robust(
+        url, connection_class=FailoverConnection, **kwargs
+    )
+    connection.nodes = nodes
+    connection.node_url = url
+    connection.queue = queue
+    return connection
@@ -1,20 +1,37 @@
 import asyncio
-import logging
+from typing import Callable, Dict, Optional
 
-import aio_pika
-from aio_pika.patterns import RPC
 from pydantic.error_wrappers import ValidationError
 
+from rmq_broker.async_chains.base import ChainManager
 from rmq_broker.models import ErrorMessage, ProcessedMessage, UnprocessedMessage
 from rmq_broker.queues.base import AsyncAbstractMessageQueue
+from rmq_broker.queues.rpc import get_rpc_class
 from rmq_broker.schemas import ProcessedBrokerMessage, UnprocessedBrokerMessage
+from rmq_broker.utils.logger import get_logger
+from rmq_broker.utils.nodes import get_broker_nodes
+from rmq_broker.utils.prefetch import PrefetchController
 
-logger = logging.getLogger(__name__)
+logger = get_logger(__name__)
 
 
 class AsyncRabbitMessageQueue(AsyncAbstractMessageQueue):
     MessageQueue: str = "rabbitmq"
 
+    def __init__(self):
+        super().__init__()
+        self.prefetch_count = self.config.get("prefetch_count", 0)
+        self.throttled = False
+        self.prefetch_controller = None
+        if prefetch_config := self.config.get("adaptive_prefetch"):
+            self.prefetch_controller = PrefetchController(
+                **{"initial_prefetch": self.prefetch_count or None, **prefetch_config},
+                set_prefetch=self.adjust_prefetch,
+            )
+            self.prefetch_count = self.prefetch_controller.prefetch
+        self.nodes = get_broker_nodes(self.broker_url, self.config)
+        self.workers: Dict[str, Callable] = {}
+
     async def consume(self) -> None:
         logger.info(
             "%s.%s: RPC consumer started",
@@ -51,7 +68,69 @@ class AsyncRabbitMessageQueue(AsyncAbstractMessageQueue):
 
     async def register_tasks(self, routing_key: str, worker: callable):
         """Вызывать перед стартом консьюмера."""
-        await self.rpc.register(routing_key, worker, auto_delete=True)
+        ChainManager().prepare_chains()
+        self.workers[routing_key] = self.wrap_worker(worker)
+        if not await self.follow_leader(routing_key):
+            await self.rpc.register(
+                routing_key, self.workers[routing_key], auto_delete=True
+            )
+
+    async def follow_leader(self, routing_key: str) -> bool:
+        """Переподключается к узлу-лидеру очереди routing_key, если он указан в
+        `queue_leaders`. Соединение консьюмера одно на все очереди, поэтому узел
+        выбирается по первой зарегистрированной очереди с лидером. Возвращает True,
+        если соединение переподключено и обработчики зарегистрированы заново.
+        """
+        if routing_key not in self.nodes.queue_leaders or any(
+            queue in self.nodes.queue_leaders
+            for queue in self.workers
+            if queue != routing_key
+        ):
+            return False
+        self.connection.queue = routing_key
+        if self.nodes.candidates(routing_key)[0] == self.connection.node_url:
+            return False
+        logger.info(
+            "%s.%s: Reconnecting to the leader of %s",
+            self.__class__.__name__,
+            self.follow_leader.__name__,
+            routing_key,
+        )
+        await self.close_connection()
+        await self.connect(routing_key)
+        for queue, worker in self.workers.items():
+            await self.rpc.register(queue, worker, auto_delete=True)
+        return True
+
+    def wrap_broker_worker(self, worker: callable) -> callable:
+        if self.prefetch_controller is not None:
+            worker = self.prefetch_controller.wrap(worker)
+        return worker
+
+    async def set_prefetch(self, prefetch_count: int) -> None:
+        """Меняет число неподтвержденных сообщений, которые брокер может
+        передать консьюмеру. Ограничение действует на весь канал.
+        """
+        await self.channel.set_qos(prefetch_count=prefetch_count, global_=True)
+
+    async def adjust_prefetch(self, prefetch_count: int) -> None:
+        """Устанавливает prefetch, выбранный контроллером. При перегрузке
+        значение применяется после ее окончания.
+        """
+        self.prefetch_count = prefetch_count
+        if not self.throttled:
+            await self.set_prefetch(prefetch_count)
+
+    async def throttle(self) -> None:
+        """Снижает prefetch до 1: новые сообщения доставляются только после
+        подтверждения обработанных, затем по одному.
+        """
+        self.throttled = True
+        await self.set_prefetch(1)
+
+    async def unthrottle(self) -> None:
+        self.throttled = False
+        await self.set_prefetch(self.prefetch_count)
 
     async def __aenter__(self):
         """
@@ -63,13 +142,26 @@ class AsyncRabbitMessageQueue(AsyncAbstractMessageQueue):
                 self.__class__.__name__,
                 self.__aenter__.__name__,
             )
-            self.connection = await aio_pika.connect_robust(
-                self.broker_url,
-            )
-            self.channel = await self.connection.channel()
-            self.rpc = await RPC.create(self.channel)
+            await self.connect()
+            self.start_consumer_tasks()
+            if self.prefetch_controller is not None:
+                self.prefetch_controller.start()
         return self
 
     async def __aexit__(self, *args, **kwargs):
+        await self.stop_consumer_tasks()
+        if self.prefetch_controller is not None:
+            await self.prefetch_controller.stop()
+        await self.close_connection()
+
+    async def connect(self, queue: Optional[str] = None) -> None:
+        """Подключается к узлу кластера, предпочитая лидера очереди queue."""
+        self.connection = await self.nodes.connect(queue=queue)
+        self.channel = await self.connection.channel()
+        if self.prefetch_count:
+            await self.set_prefetch(self.prefetch_count)
+        self.rpc = await get_rpc_class(self.config).create(self.channel)
+
+    async def close_connection(self) -> None:
         await self.connection.close()
         await self.channel.close()
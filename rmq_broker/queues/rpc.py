@@ -0,0 +1,219 @@
+import asyncio
+import inspect
+from collections.abc import Mapping
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Any, AsyncIterator, Dict, Optional, Type
+
+from aio_pika.abc import AbstractIncomingMessage
+from aio_pika.patterns import RPC
+from aio_pika.patterns.rpc import RPCMessageType
+
+from rmq_broker.utils.logger import get_logger
+from rmq_broker.utils.metrics import STAGE_DURATION, metrics
+
+logger = get_logger(__name__)
+
+# Заголовок вызова: клиент принимает ответ частями.
+STREAM = "x-stream"
+# Заголовок промежуточной части ответа с ее порядковым номером.
+STREAM_SEQ = "x-stream-seq"
+
+_incoming_message: ContextVar[Optional[AbstractIncomingMessage]] = ContextVar(
+    "rmq_broker_incoming_message", default=None
+)
+_stream_end = object()
+
+
+class BrokerRPC(RPC):
+    """RPC поверх aio-pika.
+
+    Дополнительно к возможностям aio-pika:
+        - учитывает время сериализации ответов в метриках;
+        - передает ответы обработчиков-генераторов частями. Все части, кроме
+          последней, публикуются как промежуточные сообщения с заголовком
+          `x-stream-seq`, последняя - как обычный результат вызова. Если клиент
+          не запросил ответ частями, части собираются в один ответ.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.streams: Dict[str, asyncio.Queue] = {}
+
+    def serialize(self, data: Any) -> bytes:
+        if not metrics.enabled or not isinstance(data, Mapping) or "status" not in data:
+            return super().serialize(data)
+        started = perf_counter()
+        serialized = super().serialize(data)
+        metrics.observe(
+            STAGE_DURATION,
+            perf_counter() - started,
+            request_type=str(data.get("request_type", "")).lower(),
+            stage="serialization",
+        )
+        return serialized
+
+    async def on_call_message(
+        self, method_name: str, message: AbstractIncomingMessage
+    ) -> None:
+        token = _incoming_message.set(message)
+        try:
+            await super().on_call_message(method_name, message)
+        finally:
+            _incoming_message.reset(token)
+
+    async def execute(self, func, payload: Dict[str, Any]) -> Any:
+        result = await super().execute(func, payload)
+        if not inspect.isasyncgen(result):
+            return result
+        message = _incoming_message.get()
+        if message is not None and message.reply_to and message.headers.get(STREAM):
+            return await self.publish_pages(message, result)
+        return await collect_pages(result)
+
+    async def publish_pages(
+        self, message: AbstractIncomingMessage, pages: AsyncIterator
+    ) -> Any:
+        """Публикует все части ответа, кроме последней, и возвращает последнюю."""
+        previous, seq = None, 0
+        async for page in pages:
+            if seq:
+                page_message = await self.serialize_message(
+                    payload=previous,
+                    message_type=RPCMessageType.RESULT,
+                    correlation_id=message.correlation_id,
+                    delivery_mode=message.delivery_mode,
+                    headers={STREAM_SEQ: seq - 1},
+                )
+                await self.channel.default_exchange.publish(
+                    page_message, message.reply_to, mandatory=False
+                )
+            previous, seq = page, seq + 1
+        return previous
+
+    async def on_result_message(self, message: AbstractIncomingMessage) -> None:
+        pages = self.streams.get(message.correlation_id)
+        if pages is not None and message.headers.get(STREAM_SEQ) is not None:
+            pages.put_nowait(await self.deserialize_message(message))
+            return
+        await super().on_result_message(message)
+
+    async def call_stream(
+        self,
+        method_name: str,
+        kwargs: Optional[Dict[str, Any]] = None,
+        *,
+        expiration: Optional[int] = None,
+        priority: int = 5,
+        delivery_mode=RPC.DELIVERY_MODE,
+    ) -> AsyncIterator[Any]:
+        """Вызывает удаленный метод и возвращает части ответа по мере получения."""
+        future, correlation_id = self.create_future()
+        pages: asyncio.Queue = asyncio.Queue()
+        self.streams[correlation_id] = pages
+        future.add_done_callback(lambda _: pages.put_nowait(_stream_end))
+
+        message = await self.serialize_message(
+            payload=kwargs or {},
+            message_type=RPCMessageType.CALL,
+            correlation_id=correlation_id,
+            delivery_mode=delivery_mode,
+            reply_to=self.result_queue.name,
+            headers={"From": self.result_queue.name, STREAM: True},
+            priority=priority,
+        )
+        if expiration is not None:
+            message.expiration = expiration
+
+        try:
+            await self.channel.default_exchange.publish(
+                message, routing_key=method_name, mandatory=True
+            )
+            while (page := await pages.get()) is not _stream_end:
+                yield page
+            yield future.result()
+        finally:
+            self.streams.pop(correlation_id, None)
+            if not future.done():
+                future.cancel()
+
+
+class DirectReplyRPC(BrokerRPC):
+    """RPC, получающий ответы через псевдо-очередь RabbitMQ `amq.rabbitmq.reply-to`.
+
+    Не объявляет собственную очередь ответов и обменник для просроченных вызовов:
+    создание RPC не требует обращений к брокеру, а брокер не хранит очередь
+    на каждого клиента. Ответы сопоставляются с вызовами по correlation_id.
+    Вызовы должны публиковаться в том же канале, в котором получаются ответы.
+    Просроченные в очереди вызовы (expiration) не возвращаются клиенту.
+    """
+
+    REPLY_QUEUE = "amq.rabbitmq.reply-to"
+
+    async def initialize(self, **kwargs: Any) -> None:
+        if hasattr(self, "result_queue"):
+            return
+        await self.consume_replies()
+        self.channel.close_callbacks.add(self.on_close)
+        self.channel.return_callbacks.add(self.on_message_returned)
+        reopen_callbacks = getattr(self.channel, "reopen_callbacks", None)
+        if reopen_callbacks is not None:
+            reopen_callbacks.add(self.on_reopen)
+
+    async def consume_replies(self) -> None:
+        """Подписывается на ответы. Объект очереди привязан к текущему каналу
+        aiormq и не восстанавливается aio-pika, поэтому создается заново при каждой
+        подписке.
+        """
+        self.result_queue = await self.channel.get_queue(self.REPLY_QUEUE, ensure=False)
+        # Псевдо-очередь принимает только потребителя без подтверждений.
+        self.result_consumer_tag = await self.result_queue.consume(
+            self.on_result_message, exclusive=True, no_ack=True
+        )
+
+    async def on_reopen(self, channel) -> None:
+        """Подписывается на ответы заново после переподключения канала."""
+        if hasattr(self, "result_queue"):
+            await self.consume_replies()
+
+    async def close(self) -> None:
+        if not hasattr(self, "result_queue"):
+            logger.warning(
+                "%s.%s: RPC already closed",
+                self.__class__.__name__,
+                self.close.__name__,
+            )
+            return
+        await self.result_queue.cancel(self.result_consumer_tag)
+        del self.result_consumer_tag
+        for future in self.futures.values():
+            if not future.done():
+                future.set_exception(asyncio.CancelledError)
+        del self.result_queue
+
+
+def get_rpc_class(config: Optional[dict]) -> Type[BrokerRPC]:
+    """Класс RPC по настройке `rpc_reply_mode` брокера: "direct" - ответы через
+    `amq.rabbitmq.reply-to`, иначе - через собственную очередь ответов.
+    """
+    if config and config.get("rpc_reply_mode") == "direct":
+        return DirectReplyRPC
+    return BrokerRPC
+
+
+async def collect_pages(pages: AsyncIterator) -> Any:
+    """Собирает части ответа в один ответ. Тела-списки объединяются,
+    остальные тела собираются в список. Ответ с ошибкой возвращается как есть.
+    """
+    response, bodies = None, []
+    async for response in pages:
+        if response["status"]["code"] >= 400:
+            return response
+        bodies.append(response["body"])
+    if response is None:
+        return None
+    if all(isinstance(body, list) for body in bodies):
+        response["body"] = [item for body in bodies for item in body]
+    else:
+        response["body"] = bodies
+    return response
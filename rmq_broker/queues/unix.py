@@ -0,0 +1,369 @@
+"""RPC между сервисами одного хоста через Unix сокеты.
+
+Консьюмер `AsyncUnixSocketMessageQueue` принимает вызовы на сокете
+`<socket_dir>/<routing_key>.sock`, клиент `UnixSocketRPC` - тот же интерфейс
+`call`/`call_stream`, что и RPC брокера. Сообщения передаются кадрами: длина кадра
+(4 байта, big-endian) и pickle кортежа (тип кадра, номер вызова, данные).
+Вызовы одного соединения выполняются параллельно, ответы сопоставляются с вызовами
+по номеру.
+
+    CONSUMERS = {
+        "unix": {
+            "socket_dir": "/run/rmq_broker",
+            "socket_mode": 0o660,  # по умолчанию 0o600
+            "destinations": ["catalog"],  # сервисы, вызываемые через сокеты
+        }
+    }
+
+Кадры содержат pickle, поэтому подключиться к сокету должны иметь возможность только
+доверенные процессы: `socket_dir` задается явно, каталог не должен быть доступен
+для записи другим пользователям (иначе в нем можно подменить сокет), права сокета
+задаются `socket_mode`. Сервисы разных пользователей используют общую группу
+и `socket_mode` 0o660.
+
+Консьюмер запускается так же, как консьюмер RabbitMQ:
+
+    async with AsyncUnixSocketMessageQueue() as provider:
+        await provider.register_tasks(settings.SERVICE_NAME, ChainManager().handle)
+        await provider.consume()
+
+Механизмы консьюмера (admission, deduplication, ordering, fair_scheduling, shadow,
+watchdog, envelope) настраиваются в `CONSUMERS["unix"]` так же, как для RabbitMQ.
+При перегрузке (action "throttle") консьюмер останавливает чтение новых вызовов из соединений. Адаптивный
+prefetch не поддерживается: у сокета нет prefetch.
+"""
+
+import asyncio
+import inspect
+import itertools
+import os
+import pickle
+import stat
+import struct
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple
+
+from rmq_broker.async_chains.base import ChainManager
+from rmq_broker.queues.base import AsyncAbstractMessageQueue
+from rmq_broker.schemas import ProcessedBrokerMessage, UnprocessedBrokerMessage
+from rmq_broker.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+UNIX = "unix"
+HEADER = struct.Struct(">I")
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+
+CALL = 0
+RESULT = 1
+ERROR = 2
+PAGE = 3
+
+
+def get_socket_path(config: dict, routing_key: str) -> str:
+    socket_dir = config.get("socket_dir")
+    if not socket_dir:
+        raise AttributeError("Unix socket directory has not been set.")
+    return os.path.join(socket_dir, f"{routing_key}.sock")
+
+
+def check_socket_dir(path: str) -> None:
+    """Проверяет, что другие пользователи не могут подменить сокет path."""
+    directory = os.path.dirname(path) or "."
+    if os.stat(directory).st_mode & stat.S_IWOTH:
+        raise RuntimeError(
+            f"Unix socket directory {directory} is writable by other users"
+        )
+
+
+async def read_frame(reader: asyncio.StreamReader, max_size: int) -> Tuple:
+    (size,) = HEADER.unpack(await reader.readexactly(HEADER.size))
+    if size > max_size:
+        raise ValueError(f"Frame too large: {size} bytes")
+    return pickle.loads(await reader.readexactly(size))
+
+
+def encode_frame(*frame) -> bytes:
+    payload = pickle.dumps(frame, protocol=pickle.HIGHEST_PROTOCOL)
+    return HEADER.pack(len(payload)) + payload
+
+
+async def write_frame(
+    writer: asyncio.StreamWriter, lock: asyncio.Lock, frame: bytes
+) -> None:
+    async with lock:
+        writer.write(frame)
+        await writer.drain()
+
+
+class UnixSocketRPC:
+    """Клиент RPC через Unix сокет. Одно соединение используется для всех вызовов."""
+
+    def __init__(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        max_frame_size: int = MAX_FRAME_SIZE,
+    ) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.max_frame_size = max_frame_size
+        self.calls: Dict[int, asyncio.Queue] = {}
+        self.call_ids = itertools.count()
+        self.write_lock = asyncio.Lock()
+        self._reading = asyncio.ensure_future(self.read_replies())
+
+    @classmethod
+    async def connect(cls, path: str, **kwargs) -> "UnixSocketRPC":
+        try:
+            check_socket_dir(path)
+            reader, writer = await asyncio.open_unix_connection(path)
+        except OSError as error:
+            raise RuntimeError(f"Unix socket {path} unavailable: {error}") from error
+        return cls(reader, writer, **kwargs)
+
+    @property
+    def is_closed(self) -> bool:
+        return self._reading.done()
+
+    async def read_replies(self) -> None:
+        try:
+            while True:
+                kind, call_id, payload = await read_frame(
+                    self.reader, self.max_frame_size
+                )
+                replies = self.calls.get(call_id)
+                if replies is not None:
+                    replies.put_nowait((kind, payload))
+        except Exception as error:
+            # Кроме разрыва соединения, это ошибки разбора кадра (например,
+            # pickle.UnpicklingError или неизвестный класс): дальнейшие кадры
+            # соединения прочитать нельзя.
+            closed = RuntimeError(f"Unix socket connection closed: {error}")
+        except asyncio.CancelledError:
+            closed = RuntimeError("Unix socket connection closed")
+        for replies in self.calls.values():
+            replies.put_nowait((ERROR, closed))
+        self.writer.close()
+
+    async def call(
+        self,
+        method_name: str,
+        kwargs: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        call_id, replies = await self.send_call(method_name, kwargs, stream=False)
+        try:
+            kind, payload = await asyncio.wait_for(replies.get(), timeout)
+            if kind == ERROR:
+                raise payload
+            return payload
+        finally:
+            self.calls.pop(call_id, None)
+
+    async def call_stream(
+        self, method_name: str, kwargs: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[Any]:
+        """Вызывает удаленный метод и возвращает части ответа по мере получения."""
+        call_id, replies = await self.send_call(method_name, kwargs, stream=True)
+        try:
+            while True:
+                kind, payload = await replies.get()
+                if kind == ERROR:
+                    raise payload
+                yield payload
+                if kind == RESULT:
+                    return
+        finally:
+            self.calls.pop(call_id, None)
+
+    async def send_call(
+        self, method_name: str, kwargs: Optional[Dict[str, Any]], stream: bool
+    ) -> Tuple[int, asyncio.Queue]:
+        """Отправляет вызов и возвращает его номер и очередь ответов."""
+        if self.is_closed:
+            raise RuntimeError("Unix socket connection closed")
+        call_id = next(self.call_ids)
+        replies = self.calls[call_id] = asyncio.Queue()
+        try:
+            await write_frame(
+                self.writer,
+                self.write_lock,
+                encode_frame(CALL, call_id, (method_name, kwargs or {}, stream)),
+            )
+        except BaseException:
+            self.calls.pop(call_id, None)
+            raise
+        return call_id, replies
+
+    async def close(self) -> None:
+        self._reading.cancel()
+        try:
+            await self._reading
+        except asyncio.CancelledError:
+            pass
+
+
+_clients: Dict[Tuple[asyncio.AbstractEventLoop, str], UnixSocketRPC] = {}
+
+
+async def get_unix_rpc(path: str) -> UnixSocketRPC:
+    """Общее для цикла событий соединение с сокетом path."""
+    key = (asyncio.get_running_loop(), path)
+    rpc = _clients.get(key)
+    if rpc is None or rpc.is_closed:
+        for loop, client_path in list(_clients):
+            if loop.is_closed():
+                del _clients[loop, client_path]
+        rpc = _clients[key] = await UnixSocketRPC.connect(path)
+    return rpc
+
+
+class AsyncUnixSocketMessageQueue(AsyncAbstractMessageQueue):
+    MessageQueue: str = UNIX
+
+    def __init__(self):
+        super().__init__()
+        self.max_frame_size = self.config.get("max_frame_size", MAX_FRAME_SIZE)
+        self.socket_mode = self.config.get("socket_mode", 0o600)
+        self.servers: Dict[str, asyncio.AbstractServer] = {}
+        self.accepting: Optional[asyncio.Event] = None
+
+    async def __aenter__(self):
+        if self.accepting is None:
+            self.accepting = asyncio.Event()
+            self.accepting.set()
+        self.start_consumer_tasks()
+        return self
+
+    async def __aexit__(self, *args, **kwargs):
+        await self.stop_consumer_tasks()
+        self.accepting.set()
+        for path, server in self.servers.items():
+            server.close()
+            await server.wait_closed()
+            if os.path.exists(path):
+                os.unlink(path)
+        self.servers.clear()
+
+    async def consume(self) -> None:
+        logger.info(
+            "%s.%s: Unix socket consumer started: %s",
+            self.__class__.__name__,
+            self.consume.__name__,
+            ", ".join(self.servers),
+        )
+        await asyncio.Future()
+
+    async def post_message(
+        self, data: UnprocessedBrokerMessage, worker: str
+    ) -> ProcessedBrokerMessage:
+        rpc = await get_unix_rpc(get_socket_path(self.config, worker))
+        return await rpc.call(worker, kwargs=dict(data=data))
+
+    async def register_tasks(self, routing_key: str, worker: Callable):
+        """Вызывать перед стартом консьюмера. Создает сокет для routing_key."""
+        ChainManager().prepare_chains()
+        path = get_socket_path(self.config, routing_key)
+        check_socket_dir(path)
+        if os.path.exists(path):
+            # Сокет остался от предыдущего запуска.
+            os.unlink(path)
+        worker = self.wrap_worker(worker)
+        self.servers[path] = await asyncio.start_unix_server(
+            lambda reader, writer: self.serve(reader, writer, worker), path
+        )
+        os.chmod(path, self.socket_mode)
+
+    async def throttle(self) -> None:
+        """Приостанавливает чтение новых вызовов из всех соединений."""
+        self.accepting.clear()
+
+    async def unthrottle(self) -> None:
+        self.accepting.set()
+
+    async def serve(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        worker: Callable,
+    ) -> None:
+        """Принимает вызовы соединения и выполняет их параллельно."""
+        tasks = set()
+        lock = asyncio.Lock()
+        try:
+            while True:
+                kind, call_id, (_, kwargs, stream) = await read_frame(
+                    reader, self.max_frame_size
+                )
+                if kind != CALL:
+                    continue
+                await self.accepting.wait()
+                task = asyncio.ensure_future(
+                    self.execute(writer, lock, worker, call_id, kwargs, stream)
+                )
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as error:
+            # Кадр слишком большой, не разбирается pickle или не имеет вид
+            # (kind, call_id, (name, kwargs, stream)): дальнейшие кадры соединения
+            # прочитать нельзя.
+            logger.error(
+                "%s.%s: Invalid frame: %r",
+                self.__class__.__name__,
+                self.serve.__name__,
+                error,
+            )
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    async def execute(
+        self,
+        writer: asyncio.StreamWriter,
+        lock: asyncio.Lock,
+        worker: Callable,
+        call_id: int,
+        kwargs: Dict[str, Any],
+        stream: bool,
+    ) -> None:
+        try:
+            result = await worker(**kwargs)
+            if inspect.isasyncgen(result):
+                if stream:
+                    result = await self.publish_pages(writer, lock, call_id, result)
+                else:
+                    from rmq_broker.queues.rpc import collect_pages
+
+                    result = await collect_pages(result)
+            frame = encode_frame(RESULT, call_id, result)
+        except Exception as error:
+            logger.error(
+                "%s.%s: Call failed: %s",
+                self.__class__.__name__,
+                self.execute.__name__,
+                error,
+            )
+            try:
+                frame = encode_frame(ERROR, call_id, error)
+            except Exception:
+                frame = encode_frame(ERROR, call_id, RuntimeError(str(error)))
+        if not writer.is_closing():
+            await write_frame(writer, lock, frame)
+
+    async def publish_pages(
+        self,
+        writer: asyncio.StreamWriter,
+        lock: asyncio.Lock,
+        call_id: int,
+        pages: AsyncIterator,
+    ) -> Any:
+        """Отправляет все части ответа, кроме последней, и возвращает последнюю."""
+        previous, first = None, True
+        async for page in pages:
+            if not first:
+                await write_frame(writer, lock, encode_frame(PAGE, call_id, previous))
+            previous, first = page, False
+        return previous
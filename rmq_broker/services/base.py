@@ -1,24 +1,46 @@
 import asyncio
-import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Collection, Iterable, List, Tuple
 
-import aio_pika
-from aio_pika.patterns import RPC
 from pydantic.error_wrappers import ValidationError
 
 from rmq_broker.models import ErrorMessage, ProcessedMessage, UnprocessedMessage
 from rmq_broker.schemas import ProcessedBrokerMessage, UnprocessedBrokerMessage
-from rmq_broker.settings import settings
+from rmq_broker.settings import lazy_setting, settings
+from rmq_broker.utils.batching import BATCH
+from rmq_broker.utils.hedging import get_hedge_policy, hedged_call
+from rmq_broker.utils.logger import get_logger
+from rmq_broker.utils.nodes import get_broker_nodes
+from rmq_broker.utils.raw_body import RawBody, decode_body
+from rmq_broker.utils.tracing import CLIENT, tracer
 
-logger = logging.getLogger(__name__)
+logger = get_logger(__name__)
+
+UNIX = "unix"
 
 
 class BaseService:
-    """Отправка сообщений в сервисы."""
+    """Отправка сообщений в сервисы.
+
+    Attributes:
+        raw_body (bool): False (значение по умолчанию) - тело запроса передается
+                        в составе сообщения; True - тело кодируется отдельно
+                        (RawBody), чтобы промежуточные сервисы пересылали его,
+                        не декодируя.
+        hedged_requests (Collection[str]): Типы идемпотентных запросов (в нижнем
+                        регистре), которые отправляются повторно, если ответ
+                        задерживается дольше обычного (см. rmq_broker.utils.hedging).
+        hedge_options (dict): Параметры HedgePolicy для повторной отправки:
+                        percentile, budget, burst, window, min_samples.
+    """
 
     broker_name = "rabbitmq"
-    config = settings.CONSUMERS.get(broker_name)
-    broker_url = config["broker_url"]
-    service_name = settings.SERVICE_NAME
+    config = lazy_setting(lambda cls: settings.CONSUMERS.get(cls.broker_name))
+    broker_url = lazy_setting(lambda cls: cls.config["broker_url"])
+    service_name = lazy_setting(lambda cls: settings.SERVICE_NAME)
+    raw_body: bool = False
+    hedged_requests: Collection[str] = ()
+    hedge_options: dict = {}
 
     def __init__(self):
         """Создает необходимые атрибуты для подключения к брокеру сообщений."""
@@ -27,6 +49,40 @@ class BaseService:
                 f"Attribute `dst_service_name` has not been set for class {self.__class__.__name__}"
             )
 
+    def get_broker_name(self) -> str:
+        """Брокер для вызовов dst_service_name: "unix", если сервис указан
+        в `destinations` настроек Unix сокетов, иначе broker_name.
+        """
+        unix_config = settings.CONSUMERS.get(UNIX)
+        if unix_config and self.dst_service_name in unix_config.get("destinations", ()):
+            return UNIX
+        return self.broker_name
+
+    @asynccontextmanager
+    async def connect(self):
+        """Соединение с брокером и RPC поверх него. aio-pika импортируется
+        при первом подключении, а не при импорте модуля. Если в broker_url указан
+        список узлов, подключается к лидеру очереди получателя или к следующему
+        доступному узлу (см. rmq_broker.utils.nodes).
+
+        Сервисы того же хоста вызываются через Unix сокет (см. rmq_broker.queues.unix),
+        соединение с сокетом используется повторно.
+        """
+        broker_name = self.get_broker_name()
+        if broker_name == UNIX:
+            from rmq_broker.queues.unix import get_socket_path, get_unix_rpc
+
+            path = get_socket_path(settings.CONSUMERS[UNIX], self.dst_service_name)
+            yield await get_unix_rpc(path)
+            return
+
+        from rmq_broker.queues.rpc import get_rpc_class
+
+        nodes = get_broker_nodes(self.broker_url, self.config)
+        connection = await nodes.connect(queue=self.dst_service_name)
+        async with connection, connection.channel() as channel:
+            yield await get_rpc_class(self.config).create(channel)
+
     async def send_message(
         self, request_type: str, body: dict
     ) -> ProcessedBrokerMessage:
@@ -39,17 +95,184 @@ class BaseService:
             dst=self.dst_service_name,
             body=body,
         )
-        return await self.send_rpc_request(message)
+        if self.raw_body:
+            message["body"] = RawBody.encode(message["body"])
+        with tracer.start_span(
+            request_type,
+            kind=CLIENT,
+            request_id=str(message["request_id"]),
+            dst=self.dst_service_name,
+        ) as span:
+            span.inject(message)
+            if request_type.lower() in self.hedged_requests:
+                response = await self.send_hedged_request(message)
+            else:
+                response = await self.send_rpc_request(message)
+            span.set_response(response)
+        response["body"] = decode_body(response.get("body"))
+        return response
 
-    async def send_rpc_request(
+    async def send_hedged_request(
+        self, message: UnprocessedBrokerMessage
+    ) -> ProcessedBrokerMessage:
+        """Отправляет сообщение и его копию, если ответ задерживается. Копия
+        имеет тот же request_id.
+        """
+        request_type = message["request_type"].lower()
+        policy = get_hedge_policy(
+            self.dst_service_name, request_type, **self.hedge_options
+        )
+        return await hedged_call(
+            lambda: self.send_rpc_request(message),
+            policy,
+            dst=self.dst_service_name,
+            request_type=request_type,
+        )
+
+    async def send_batch(
+        self, requests: Iterable[Tuple[str, Any]]
+    ) -> List[ProcessedBrokerMessage]:
+        """Отправляет запросы (request_type, body) одним сообщением и возвращает
+        ответы в том же порядке (см. rmq_broker.utils.batching).
+        """
+        messages = []
+        for request_type, body in requests:
+            message = UnprocessedMessage().generate(
+                request_type=request_type,
+                src=self.service_name,
+                dst=self.dst_service_name,
+                body=body,
+            )
+            if self.raw_body:
+                message["body"] = RawBody.encode(message["body"])
+            messages.append(message)
+        with tracer.start_span(
+            BATCH, kind=CLIENT, dst=self.dst_service_name, size=len(messages)
+        ) as span:
+            for message in messages:
+                span.inject(message)
+            responses = await self.send_batch_request(messages)
+        for response in responses:
+            response["body"] = decode_body(response.get("body"))
+        return responses
+
+    async def send_batch_request(
+        self, messages: List[UnprocessedBrokerMessage]
+    ) -> List[ProcessedBrokerMessage]:
+        """Отправляет пакет сообщений в очередь. При ошибке отправки формирует
+        сообщение с ошибкой для каждого запроса пакета. TypeError означает, что
+        получатель использует версию пакета без поддержки пакетов (аргумент batch).
+        """
+        try:
+            async with self.connect() as rpc:
+                return await rpc.call(self.dst_service_name, kwargs={BATCH: messages})
+        except (
+            asyncio.TimeoutError,
+            asyncio.CancelledError,
+            RuntimeError,
+            TypeError,
+        ) as err:
+            return [
+                ErrorMessage().generate(
+                    request_id=message["request_id"],
+                    request_type=message["request_type"],
+                    src=self.dst_service_name,
+                    dst=self.service_name,
+                    message=str(err),
+                )
+                for message in messages
+            ]
+
+    async def forward_message(
+        self, data: UnprocessedBrokerMessage
+    ) -> ProcessedBrokerMessage:
+        """Пересылает запрос в сервис dst_service_name без изменений тела.
+
+        Сохраняет request_id, request_type и тело запроса (в том числе
+        закодированное), меняет только отправителя и получателя. Запрос и ответ
+        не валидируются, тело ответа не декодируется.
+        """
+        message = {
+            "request_type": data["request_type"],
+            "request_id": data["request_id"],
+            "body": data["body"],
+            "header": {
+                **data["header"],
+                "src": self.service_name,
+                "dst": self.dst_service_name,
+            },
+        }
+        with tracer.start_span(
+            data["request_type"],
+            kind=CLIENT,
+            request_id=str(message["request_id"]),
+            dst=self.dst_service_name,
+        ) as span:
+            span.inject(message)
+            response = await self.send_rpc_request(message, validate=False)
+            span.set_response(response)
+        return response
+
+    async def stream_message(
+        self, request_type: str, body: dict
+    ) -> AsyncIterator[ProcessedBrokerMessage]:
+        """Отправляет запрос и возвращает ответы по мере их получения.
+
+        Обработчик-генератор присылает ответ на каждую часть тела, обычный
+        обработчик - один ответ. Ответ с ошибкой завершает поток.
+        """
+        message = UnprocessedMessage().generate(
+            request_type=request_type,
+            src=self.service_name,
+            dst=self.dst_service_name,
+            body=body,
+        )
+        if self.raw_body:
+            message["body"] = RawBody.encode(message["body"])
+        with tracer.start_span(
+            request_type,
+            kind=CLIENT,
+            request_id=str(message["request_id"]),
+            dst=self.dst_service_name,
+        ) as span:
+            span.inject(message)
+            response = None
+            async for response in self.stream_rpc_request(message):
+                yield response
+            span.set_response(response)
+
+    async def stream_rpc_request(
         self, message: UnprocessedBrokerMessage
+    ) -> AsyncIterator[ProcessedBrokerMessage]:
+        """Отправляет сообщение в очередь и возвращает части ответа."""
+        try:
+            async with self.connect() as rpc:
+                async for response in rpc.call_stream(
+                    self.dst_service_name, kwargs=dict(data=message)
+                ):
+                    yield response
+        except (
+            asyncio.TimeoutError,
+            RuntimeError,
+        ) as err:
+            yield ErrorMessage().generate(
+                request_id=message["request_id"],
+                request_type=message["request_type"],
+                src=self.dst_service_name,
+                dst=self.service_name,
+                message=str(err),
+            )
+
+    async def send_rpc_request(
+        self, message: UnprocessedBrokerMessage, validate: bool = True
     ) -> ProcessedBrokerMessage:
         """Валидирует сообщение, создает соединение с брокером и отправляет
         сообщение в очередь.
         В случае ошибки формирует сообщение с данными об ошибке и HTTP кодом 400.
         """
         try:
-            UnprocessedMessage(**message)
+            if validate:
+                UnprocessedMessage(**message)
         except ValidationError as error:
             logger.error(
                 "%s.%s: UnprocessedMessage validation failed!: %s",
@@ -59,13 +282,12 @@ class BaseService:
             )
             return ErrorMessage().generate(message=str(error))
         try:
-            connection = await aio_pika.connect_robust(self.broker_url)
-            async with connection, connection.channel() as channel:
-                rpc = await RPC.create(channel)
+            async with self.connect() as rpc:
                 response = await rpc.call(
                     self.dst_service_name, kwargs=dict(data=message)
                 )
-                ProcessedMessage(**response)
+                if validate:
+                    ProcessedMessage(**response)
                 return response
         except ValidationError as error:
             # Временный фикс, пока все сервисы не перейдут на новую версию пакета.
@@ -1,9 +1,15 @@
-import importlib
+"""Настройки сервиса.
+
+Модуль настроек ищется по путям из `paths` при первом обращении к атрибуту
+`settings`, а не при импорте пакета.
+"""
 
-import environ
+import importlib
+import os
+from types import ModuleType
+from typing import Any, Callable, Optional
 
-env = environ.Env()
-default_path = env("MICROSERVICE_SETTINGS", default="settings")
+default_path = os.environ.get("MICROSERVICE_SETTINGS", "settings")
 paths = [
     default_path,
     "config.settings.base",
@@ -11,19 +17,48 @@ paths = [
     "settings",
     "application.settings",
 ]
-settings = ""
-
 
-for path in paths:
-    try:
-        settings = importlib.import_module(path)
-    except ModuleNotFoundError:
-        pass
-    else:
-        break
 
-if settings == "":
+def get_settings_module() -> ModuleType:
+    for path in paths:
+        try:
+            return importlib.import_module(path)
+        except ModuleNotFoundError:
+            pass
     raise AttributeError(
         "Specified microservice settings file path is not correct! Error: %s"
         % default_path
     )
+
+
+class LazySettings:
+    """Настройки сервиса, модуль настроек загружается при первом обращении."""
+
+    def __init__(self) -> None:
+        self._wrapped: Optional[ModuleType] = None
+
+    def __getattr__(self, attr: str) -> Any:
+        if attr.startswith("__"):
+            raise AttributeError(attr)
+        if self._wrapped is None:
+            self._wrapped = get_settings_module()
+        return getattr(self._wrapped, attr)
+
+
+class lazy_setting:
+    """Атрибут класса, значение которого вычисляется по настройкам при обращении.
+
+        class BaseService:
+            service_name = lazy_setting(lambda cls: settings.SERVICE_NAME)
+
+    В наследниках атрибут переопределяется обычным значением.
+    """
+
+    def __init__(self, getter: Callable[[type], Any]) -> None:
+        self.getter = getter
+
+    def __get__(self, instance: Any, owner: type) -> Any:
+        return self.getter(owner)
+
+
+settings = LazySettings()
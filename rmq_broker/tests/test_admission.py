@@ -0,0 +1,83 @@
+import asyncio
+
+from rmq_broker.async_chains.base import BaseChain, ChainManager
+from rmq_broker.tests.factories import MessageFactory
+from rmq_broker.utils.admission import REJECT, SHED, AdmissionController
+from rmq_broker.utils.metrics import metrics
+
+
+class AdmissionTestChain(BaseChain):
+    request_type = "admission_test"
+    include_in_schema = False
+
+    async def get_response_body(self, data):
+        return self.form_response(data, {})
+
+
+async def worker(data):
+    return {"status": {"code": 200, "message": "OK"}}
+
+
+class TestAdmissionController:
+    def test_overloaded_consumer_rejects_sheddable_request(self):
+        controller = AdmissionController(
+            max_loop_lag=0.1, action=REJECT, is_sheddable=lambda data: True
+        )
+        controller.lag = 1.0
+        message = MessageFactory.get_unprocessed_message()
+        response = asyncio.run(controller.wrap(worker)(data=message))
+        assert response["status"]["code"] == 503
+        assert response["request_id"] == message["request_id"]
+        assert response["header"]["dst"] == message["header"]["src"]
+
+    def test_overloaded_consumer_handles_regular_request(self):
+        controller = AdmissionController(max_in_flight=0, action=REJECT)
+        response = asyncio.run(controller.wrap(worker)(data={}))
+        assert response["status"]["code"] == 200
+        assert controller.in_flight == 0
+
+    def test_throttle_and_unthrottle(self):
+        events = []
+
+        async def throttle():
+            events.append("throttle")
+
+        async def unthrottle():
+            events.append("unthrottle")
+
+        async def run():
+            controller = AdmissionController(
+                max_loop_lag=0.1, throttle=throttle, unthrottle=unthrottle
+            )
+            controller.lag = 1.0
+            await controller.update_state()
+            controller.lag = 0.01
+            await controller.update_state()
+
+        asyncio.run(run())
+        assert events == ["throttle", "unthrottle"]
+
+    def test_shed_metric_label(self):
+        ChainManager()
+        controller = AdmissionController(
+            max_loop_lag=0.1, action=REJECT, is_sheddable=lambda data: True
+        )
+        controller.lag = 1.0
+        worker_ = controller.wrap(worker)
+
+        async def run():
+            for request_type in ("Random-1", "random-2", "admission_test"):
+                message = MessageFactory.get_unprocessed_message()
+                message["request_type"] = request_type
+                await worker_(data=message)
+
+        metrics.reset()
+        metrics.enable()
+        try:
+            asyncio.run(run())
+        finally:
+            metrics.disable()
+        assert {
+            sample["labels"]["request_type"]: sample["value"]
+            for sample in metrics.snapshot()[SHED]
+        } == {"unknown": 2, "admission_test": 1}
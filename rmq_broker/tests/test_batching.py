@@ -0,0 +1,147 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from rmq_broker.async_chains.base import BaseChain, ChainManager
+from rmq_broker.services.base import BaseService
+from rmq_broker.tests.factories import MessageFactory
+from rmq_broker.utils.batching import RequestBatcher, wrap_batch
+
+
+class BatchTestChain(BaseChain):
+    request_type = "batch_test"
+    include_in_schema = False
+
+    async def get_response_body(self, data):
+        if data["body"].get("fail"):
+            raise ValueError("failed")
+        await asyncio.sleep(0.01)
+        return self.form_response(data, {"value": data["body"]["value"] * 2})
+
+
+class BatchTestService(BaseService):
+    dst_service_name = "batch_test"
+
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+        self.worker = wrap_batch(ChainManager().handle)
+
+    async def send_batch_request(self, messages):
+        self.batches.append(len(messages))
+        return await self.worker(batch=messages)
+
+
+class RaisingChainManager:
+    async def handle(self, data):
+        raise RuntimeError("boom")
+
+
+class TestWrapBatch:
+    def test_single_message(self):
+        async def worker(data):
+            return data
+
+        assert asyncio.run(wrap_batch(worker)(data={"a": 1})) == {"a": 1}
+
+    def test_items_are_handled_concurrently(self):
+        async def run():
+            service = BatchTestService()
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            responses = await service.send_batch(
+                [("batch_test", {"value": value}) for value in range(20)]
+            )
+            return responses, loop.time() - started
+
+        responses, elapsed = asyncio.run(run())
+        assert [response["body"]["value"] for response in responses] == list(
+            range(0, 40, 2)
+        )
+        assert elapsed < 0.1
+
+    def test_failed_item(self):
+        message = MessageFactory.get_unprocessed_message()
+        responses = asyncio.run(
+            wrap_batch(RaisingChainManager().handle)(batch=[message])
+        )
+        assert responses[0]["status"]["code"] == 500
+        assert responses[0]["request_id"] == message["request_id"]
+
+
+class TestRequestBatcher:
+    def test_callers_get_own_responses(self):
+        async def run():
+            service = BatchTestService()
+            batcher = RequestBatcher(service, max_size=3, linger=0.01)
+            responses = await asyncio.gather(
+                *(
+                    batcher.send_message("batch_test", {"value": value})
+                    for value in range(5)
+                )
+            )
+            return service.batches, responses
+
+        batches, responses = asyncio.run(run())
+        assert batches == [3, 2]
+        assert [response["body"]["value"] for response in responses] == [
+            0,
+            2,
+            4,
+            6,
+            8,
+        ]
+
+    def test_send_error_is_propagated(self):
+        class FailingService(BatchTestService):
+            async def send_batch(self, requests):
+                raise RuntimeError("unavailable")
+
+        async def run():
+            batcher = RequestBatcher(FailingService(), linger=0)
+            try:
+                await batcher.send_message("batch_test", {"value": 1})
+            except RuntimeError as error:
+                return str(error)
+
+        assert asyncio.run(run()) == "unavailable"
+
+    def test_missing_responses_fail_all_callers(self):
+        class ShortService(BatchTestService):
+            async def send_batch(self, requests):
+                return [{"body": None}]
+
+        async def run():
+            batcher = RequestBatcher(ShortService(), max_size=2, linger=1)
+            return await asyncio.wait_for(
+                asyncio.gather(
+                    batcher.send_message("batch_test", {"value": 1}),
+                    batcher.send_message("batch_test", {"value": 2}),
+                    return_exceptions=True,
+                ),
+                1,
+            )
+
+        errors = asyncio.run(run())
+        assert all(isinstance(error, RuntimeError) for error in errors)
+
+
+class TestSendBatch:
+    def test_receiver_without_batch_support(self):
+        class OldReceiverRPC:
+            async def call(self, method_name, kwargs=None, timeout=None):
+                raise TypeError("handle() got an unexpected keyword argument 'batch'")
+
+        class OldReceiverService(BaseService):
+            dst_service_name = "old_receiver"
+
+            @asynccontextmanager
+            async def connect(self):
+                yield OldReceiverRPC()
+
+        responses = asyncio.run(
+            OldReceiverService().send_batch(
+                [("batch_test", {"value": 1}), ("batch_test", {"value": 2})]
+            )
+        )
+        assert [response["status"]["code"] for response in responses] == [400, 400]
+        assert "batch" in responses[0]["status"]["message"]
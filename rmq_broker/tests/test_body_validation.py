@@ -0,0 +1,63 @@
+import asyncio
+from typing import List
+
+from pydantic import BaseModel
+
+from rmq_broker.async_chains.base import BaseChain, ChainManager
+from rmq_broker.tests.factories import MessageFactory
+
+
+class Item(BaseModel):
+    name: str
+    count: int = 1
+
+
+class ItemTestChain(BaseChain):
+    request_type = "item_test"
+    include_in_schema = False
+    body_model = Item
+
+    async def get_response_body(self, data):
+        return self.form_response(
+            data, {"name": self.body.name, "count": self.body.count}
+        )
+
+
+class ItemsTestChain(BaseChain):
+    request_type = "items_test"
+    include_in_schema = False
+    body_model = List[Item]
+    calls = 0
+
+    async def get_response_body(self, data):
+        ItemsTestChain.calls += 1
+        return self.form_response(data, [item.count for item in self.body])
+
+
+def handle(request_type, body):
+    message = MessageFactory.get_unprocessed_message()
+    message["request_type"] = request_type
+    message["body"] = body
+    return asyncio.run(ChainManager().handle(message))
+
+
+class TestBodyValidation:
+    def test_validator_is_built_at_registration(self):
+        ChainManager()
+        assert "_body_validator" in ItemTestChain.__dict__
+        assert ItemTestChain.get_body_validator() is ItemTestChain.get_body_validator()
+
+    def test_parsed_model_is_passed_to_chain(self):
+        response = handle(ItemTestChain.request_type, {"name": "a", "count": "2"})
+        assert response["body"] == {"name": "a", "count": 2}
+
+    def test_non_model_body(self):
+        response = handle(ItemsTestChain.request_type, [{"name": "a"}, {"name": "b"}])
+        assert response["body"] == [1, 1]
+
+    def test_invalid_body_is_rejected_before_chain(self):
+        calls = ItemsTestChain.calls
+        response = handle(ItemsTestChain.request_type, [{"count": 1}])
+        assert response["status"]["code"] == 400
+        assert "Body validation error" in response["status"]["message"]
+        assert ItemsTestChain.calls == calls
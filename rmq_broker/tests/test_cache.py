@@ -0,0 +1,75 @@
+import asyncio
+import time
+
+from rmq_broker.async_chains.base import BaseChain, ChainManager
+from rmq_broker.tests.factories import MessageFactory
+from rmq_broker.utils.cache import LRUCacheBackend, canonical_hash, response_cache
+
+
+class CachedTestChain(BaseChain):
+    request_type = "cached_test"
+    include_in_schema = False
+    cache_ttl = 60
+    calls = 0
+
+    async def get_response_body(self, data):
+        CachedTestChain.calls += 1
+        return self.form_response(data, {"calls": CachedTestChain.calls})
+
+
+def get_message(body):
+    message = MessageFactory.get_unprocessed_message()
+    message["request_type"] = CachedTestChain.request_type
+    message["body"] = body
+    return message
+
+
+class TestLRUCacheBackend:
+    def test_evicts_least_recently_used(self):
+        backend = LRUCacheBackend(max_size=2)
+        backend.set("a", 1, ttl=60)
+        backend.set("b", 2, ttl=60)
+        backend.get("a")
+        backend.set("c", 3, ttl=60)
+        assert backend.get("b") is None
+        assert backend.get("a") == 1
+        assert backend.get("c") == 3
+
+    def test_expired_entry(self):
+        backend = LRUCacheBackend()
+        backend.set("a", 1, ttl=0.01)
+        time.sleep(0.02)
+        assert backend.get("a") is None
+        assert len(backend) == 0
+
+    def test_canonical_hash_ignores_key_order(self):
+        assert canonical_hash({"a": 1, "b": 2}) == canonical_hash({"b": 2, "a": 1})
+
+
+class TestResponseCache:
+    def test_chain_manager_serves_cached_body(self):
+        CachedTestChain.invalidate_cache()
+        first = asyncio.run(ChainManager().handle(get_message({"x": 1, "y": 2})))
+        second_message = get_message({"y": 2, "x": 1})
+        second = asyncio.run(ChainManager().handle(second_message))
+        assert first["body"] == second["body"] == {"calls": CachedTestChain.calls}
+        assert second["request_id"] == second_message["request_id"]
+        assert second["header"]["dst"] == second_message["header"]["src"]
+        assert response_cache.stats()["cached_test"]["hits"] >= 1
+
+    def test_changing_response_does_not_change_cache(self):
+        CachedTestChain.invalidate_cache()
+        asyncio.run(ChainManager().handle(get_message({"z": 1})))
+        hit = asyncio.run(ChainManager().handle(get_message({"z": 1})))
+        expected = dict(hit["body"])
+        hit["body"]["calls"] = "changed"
+        hit["body"]["extra"] = True
+        next_hit = asyncio.run(ChainManager().handle(get_message({"z": 1})))
+        assert next_hit["body"] == expected
+
+    def test_invalidate_cache(self):
+        message = get_message({"x": 3})
+        first = asyncio.run(ChainManager().handle(message))
+        CachedTestChain.invalidate_cache(get_message({"x": 3}))
+        second = asyncio.run(ChainManager().handle(get_message({"x": 3})))
+        assert second["body"]["calls"] == first["body"]["calls"] + 1
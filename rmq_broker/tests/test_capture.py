@@ -0,0 +1,77 @@
+import asyncio
+import json
+
+from rmq_broker.async_chains import base
+from rmq_broker.async_chains.base import BaseChain, ChainManager
+from rmq_broker.tests.factories import MessageFactory
+from rmq_broker.tools.replay import read_messages
+from rmq_broker.utils.capture import REDACTED, RotatingWriter, TrafficCapture, redact
+
+
+class CaptureTestChain(BaseChain):
+    request_type = "capture_test"
+    include_in_schema = False
+
+    async def get_response_body(self, data):
+        return self.form_response(data, {"token": "secret", "ok": True})
+
+
+def read_records(path):
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file]
+
+
+class TestTrafficCapture:
+    def test_redact(self):
+        message = {"body": {"password": "1", "users": [{"phone": "1"}, {"id": 2}]}}
+        redact(message, [["body", "password"], ["body", "users", "*", "phone"]])
+        assert message == {
+            "body": {"password": REDACTED, "users": [{"phone": REDACTED}, {"id": 2}]}
+        }
+
+    def test_rotation(self, tmp_path):
+        path = str(tmp_path / "capture.jsonl")
+        writer = RotatingWriter(path, max_bytes=10, backup_count=2)
+        for line in (b"aaaaaa\n", b"bbbbbb\n", b"cccccc\n", b"dddddd\n"):
+            writer.write(line)
+        writer.close()
+        assert sorted(p.name for p in tmp_path.iterdir()) == [
+            "capture.jsonl",
+            "capture.jsonl.1",
+            "capture.jsonl.2",
+        ]
+        assert (tmp_path / "capture.jsonl").read_bytes() == b"dddddd\n"
+        assert (tmp_path / "capture.jsonl.2").read_bytes() == b"bbbbbb\n"
+
+    def test_not_sampled(self, tmp_path):
+        capture = TrafficCapture({"path": str(tmp_path / "c"), "sample_rate": 0})
+        assert capture.record(MessageFactory.get_unprocessed_message()) is None
+
+    def test_chain_manager_captures_request_and_response(self, tmp_path, monkeypatch):
+        path = str(tmp_path / "capture.jsonl")
+        capture = TrafficCapture(
+            {
+                "path": path,
+                "sample_rate": 1,
+                "responses": True,
+                "redact": ["body.token", "header.src"],
+            }
+        )
+        monkeypatch.setattr(base, "traffic_capture", capture)
+        message = MessageFactory.get_unprocessed_message()
+        message["request_type"] = CaptureTestChain.request_type
+        message["body"] = {"token": "secret"}
+        response = asyncio.run(ChainManager().handle(message))
+        assert response["body"] == {"token": "secret", "ok": True}
+        capture.close()
+
+        [record] = read_records(path)
+        assert record["request_type"] == "capture_test"
+        assert record["request"]["body"] == {"token": REDACTED}
+        assert record["request"]["header"]["src"] == REDACTED
+        assert "status" not in record["request"]
+        assert record["response"]["body"] == {"token": REDACTED, "ok": True}
+        assert record["response"]["status"]["code"] == 200
+        assert record["duration"] >= 0
+        with open(path, encoding="utf-8") as file:
+            assert read_messages(file) == [record["request"]]
@@ -0,0 +1,43 @@
+import asyncio
+
+from rmq_broker.tests.factories import MessageFactory
+from rmq_broker.utils.dedup import RequestDeduplicator
+
+
+class TestRequestDeduplicator:
+    def test_redelivered_request_is_not_processed_twice(self):
+        calls = []
+
+        async def worker(data):
+            calls.append(data["request_id"])
+            await asyncio.sleep(0.01)
+            return {"request_id": data["request_id"], "status": {"code": 200}}
+
+        async def run():
+            worker_with_dedup = RequestDeduplicator().wrap(worker)
+            message = MessageFactory.get_unprocessed_message()
+            concurrent = await asyncio.gather(
+                worker_with_dedup(data=message), worker_with_dedup(data=message)
+            )
+            redelivered = await worker_with_dedup(data=message)
+            return concurrent + [redelivered]
+
+        responses = asyncio.run(run())
+        assert len(calls) == 1
+        assert responses[0] == responses[1] == responses[2]
+
+    def test_failed_response_is_not_stored(self):
+        calls = []
+
+        async def worker(data):
+            calls.append(data["request_id"])
+            return {"status": {"code": 500}}
+
+        async def run():
+            worker_with_dedup = RequestDeduplicator().wrap(worker)
+            message = MessageFactory.get_unprocessed_message()
+            await worker_with_dedup(data=message)
+            await worker_with_dedup(data=message)
+
+        asyncio.run(run())
+        assert len(calls) == 2
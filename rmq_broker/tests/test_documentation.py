@@ -0,0 +1,79 @@
+import asyncio
+import json
+
+import pytest
+from pydantic import BaseModel
+
+from rmq_broker.async_chains.base import BaseChain, ChainManager
+
+pytest.importorskip("email_validator")
+
+from rmq_broker.documentation.__main__ import main  # noqa: E402
+from rmq_broker.documentation.base import CONTENT_HASH, AsyncDocsChain  # noqa: E402
+from rmq_broker.documentation.mixins.pydantic.chains import (  # noqa: E402
+    PydanticModelsChainMixin,
+)
+from rmq_broker.tests.factories import MessageFactory  # noqa: E402
+from rmq_broker.utils.raw_body import RawBody  # noqa: E402
+
+
+class DocumentedBody(BaseModel):
+    name: str
+
+
+class DocumentedTestChain(BaseChain):
+    request_type = "documented_test"
+    body_model = DocumentedBody
+
+    async def get_response_body(self, data):
+        return self.form_response(data)
+
+
+class DocsTestChain(PydanticModelsChainMixin, AsyncDocsChain):
+    request_type = "docs_test"
+
+
+def get_message(body):
+    message = MessageFactory.get_unprocessed_message()
+    message["request_type"] = DocsTestChain.request_type
+    message["body"] = body
+    return message
+
+
+class TestDocsChain:
+    def test_document_is_built_once(self, monkeypatch):
+        ChainManager().prepare_chains()
+        document = DocsTestChain.openapi
+        assert document[CONTENT_HASH] == DocsTestChain.openapi_hash
+        assert "DocumentedBody" in document["components"]["schemas"]
+
+        monkeypatch.setattr(DocsTestChain, "make_openapi", None)
+        response = asyncio.run(ChainManager().handle(get_message({})))
+        assert response["body"] is DocsTestChain.openapi_body
+        assert response["body"].decode() == document
+
+    def test_raw_body_request(self):
+        DocsTestChain.prepare()
+        message = get_message(RawBody.encode({}))
+        response = asyncio.run(ChainManager().handle(message))
+        assert response["body"] is DocsTestChain.openapi_body
+
+    def test_not_modified(self):
+        message = get_message({"hash": DocsTestChain.openapi_hash})
+        response = asyncio.run(ChainManager().handle(message))
+        assert response["status"]["code"] == 304
+        assert response["body"] == {"hash": DocsTestChain.openapi_hash}
+
+    def test_cli_writes_document(self, tmp_path):
+        DocsTestChain.prepare()
+        output = tmp_path / "openapi.json"
+        main([__name__, "-o", str(output)])
+        assert json.loads(output.read_text())[CONTENT_HASH] == (
+            DocsTestChain.openapi_hash
+        )
+
+        class FileDocsChain(AsyncDocsChain):
+            openapi_file = str(output)
+
+        FileDocsChain.prepare()
+        assert FileDocsChain.openapi_hash == DocsTestChain.openapi_hash
@@ -0,0 +1,47 @@
+import asyncio
+import pickle
+
+from rmq_broker.async_chains.base import BaseChain, ChainManager
+from rmq_broker.envelope import Envelope
+from rmq_broker.models import ProcessedMessage
+from rmq_broker.tests.factories import MessageFactory
+
+
+class EnvelopeTestChain(BaseChain):
+    request_type = "envelope_test"
+    include_in_schema = False
+
+    async def get_response_body(self, data):
+        return self.form_response(data, {"echo": data["body"]}, 201, "Created")
+
+
+class TestEnvelope:
+    def test_dict_interface(self):
+        message = MessageFactory.get_processed_message()
+        envelope = Envelope.from_dict(message)
+        assert envelope == message
+        assert envelope["header"]["src"] == message["header"]["src"]
+        envelope["header"]["traceparent"] = "00-1-2-01"
+        envelope.update({"status": {"message": "Created", "code": 201}})
+        assert envelope["status"] == {"message": "Created", "code": 201}
+        assert dict(envelope["header"])["traceparent"] == "00-1-2-01"
+
+    def test_status_is_optional(self):
+        envelope = Envelope.from_dict(MessageFactory.get_unprocessed_message())
+        assert "status" not in envelope
+        assert envelope.get("status") is None
+
+    def test_pickles_to_dict(self):
+        message = MessageFactory.get_processed_message()
+        restored = pickle.loads(pickle.dumps(Envelope.from_dict(message)))
+        assert type(restored) is dict and type(restored["header"]) is dict
+        assert restored == message
+
+    def test_chain_manager_handles_envelope(self):
+        message = MessageFactory.get_unprocessed_message()
+        message["request_type"] = EnvelopeTestChain.request_type
+        response = asyncio.run(ChainManager().handle(Envelope.from_dict(message)))
+        assert isinstance(response, Envelope)
+        assert ProcessedMessage(**response)
+        assert response["status"] == {"message": "Created", "code": 201}
+        assert response["header"]["dst"] == message["header"]["src"]
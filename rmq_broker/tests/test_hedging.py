@@ -0,0 +1,135 @@
+import asyncio
+
+from rmq_broker.services.base import BaseService
+from rmq_broker.utils.hedging import HedgePolicy, get_hedge_policy, hedged_call
+
+
+def ok(value):
+    return {"status": {"code": 200, "message": ""}, "body": value}
+
+
+def trained_policy(latency=0.01, **options):
+    policy = HedgePolicy(min_samples=5, budget=1, **options)
+    for _ in range(5):
+        policy.observe(latency)
+    return policy
+
+
+class TestHedgePolicy:
+    def test_policy_per_options(self):
+        policy = get_hedge_policy("options_test", "Get", percentile=0.9)
+        assert get_hedge_policy("options_test", "get", percentile=0.9) is policy
+        other = get_hedge_policy("options_test", "get", percentile=0.5)
+        assert other is not policy
+        assert (policy.percentile, other.percentile) == (0.9, 0.5)
+        assert get_hedge_policy("options_test", "get").percentile == 0.95
+
+    def test_delay_requires_samples(self):
+        policy = HedgePolicy(min_samples=3)
+        policy.observe(0.1)
+        assert policy.delay() is None
+        policy.observe(0.2)
+        policy.observe(0.3)
+        assert policy.delay() == 0.3
+
+    def test_percentile(self):
+        policy = HedgePolicy(percentile=0.9, min_samples=1)
+        for latency in range(1, 101):
+            policy.observe(latency / 1000)
+        assert policy.delay() == 0.09
+
+    def test_budget(self):
+        policy = HedgePolicy(budget=0.5, burst=1)
+        policy.deposit()
+        assert not policy.withdraw()
+        policy.deposit()
+        policy.deposit()
+        assert policy.withdraw()
+        assert not policy.withdraw()
+
+
+class TestHedgedCall:
+    def test_fast_response_is_not_hedged(self):
+        calls = []
+
+        async def send():
+            calls.append(1)
+            return ok(len(calls))
+
+        response = asyncio.run(hedged_call(send, trained_policy(latency=1)))
+        assert response["body"] == 1
+        assert len(calls) == 1
+
+    def test_slow_response_is_hedged(self):
+        calls = []
+        cancelled = []
+
+        async def send():
+            calls.append(1)
+            number = len(calls)
+            try:
+                await asyncio.sleep(1 if number == 1 else 0)
+            except asyncio.CancelledError:
+                cancelled.append(number)
+                raise
+            return ok(number)
+
+        response = asyncio.run(hedged_call(send, trained_policy()))
+        assert response["body"] == 2
+        assert cancelled == [1]
+
+    def test_error_waits_for_other_response(self):
+        calls = []
+
+        async def send():
+            calls.append(1)
+            if len(calls) == 1:
+                await asyncio.sleep(0.05)
+                return ok(1)
+            return {"status": {"code": 500, "message": ""}}
+
+        response = asyncio.run(hedged_call(send, trained_policy()))
+        assert response["body"] == 1
+
+    def test_no_budget(self):
+        calls = []
+
+        async def send():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return ok(len(calls))
+
+        policy = trained_policy()
+        policy.budget = 0
+        asyncio.run(hedged_call(send, policy))
+        assert len(calls) == 1
+
+
+class HedgedTestService(BaseService):
+    dst_service_name = "hedged_test"
+    hedged_requests = ("slow",)
+    hedge_options = {"min_samples": 1, "budget": 1}
+
+    def __init__(self):
+        super().__init__()
+        self.sent = []
+
+    async def send_rpc_request(self, message, validate=True):
+        self.sent.append(message["request_id"])
+        await asyncio.sleep(0.5 if len(self.sent) == 2 else 0.01)
+        return {"status": {"code": 200, "message": ""}, "body": {}}
+
+
+class TestServiceHedging:
+    def test_send_message_hedges_configured_types(self):
+        async def run():
+            service = HedgedTestService()
+            await service.send_message("slow", {})
+            await service.send_message("SLOW", {})
+            await service.send_message("fast", {})
+            return service.sent
+
+        sent = asyncio.run(run())
+        assert len(sent) == 4
+        assert sent[1] == sent[2]
+        assert len(set(sent)) == 3
@@ -0,0 +1,30 @@
+import json
+import subprocess
+import sys
+
+DEFERRED_MODULES = ["aio_pika", "aiormq", "starlette", "wp_utils", "environ"]
+
+SCRIPT = """
+import json, sys
+import rmq_broker.async_chains.base, rmq_broker.chains.base, rmq_broker.services.base
+from rmq_broker.settings import settings
+print(json.dumps({
+    "loaded": [name for name in %r if name in sys.modules],
+    "settings_loaded": settings._wrapped is not None,
+}))
+""" % (
+    DEFERRED_MODULES,
+)
+
+
+class TestImportTime:
+    def test_import_defers_heavy_modules_and_settings(self):
+        output = subprocess.run(
+            [sys.executable, "-c", SCRIPT],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        result = json.loads(output)
+        assert result["loaded"] == []
+        assert not result["settings_loaded"]
@@ -0,0 +1,63 @@
+import asyncio
+
+from rmq_broker.async_chains.base import BaseChain, ChainManager
+from rmq_broker.tests.factories import MessageFactory
+from rmq_broker.utils.metrics import NULL_TIMER, Histogram, MetricsRegistry, metrics
+
+
+class MetricsTestChain(BaseChain):
+    request_type = "metrics_test"
+    include_in_schema = False
+
+    async def get_response_body(self, data):
+        return self.form_response(data, {"ok": True})
+
+
+class TestHistogram:
+    def test_histogram_cumulative_buckets(self):
+        histogram = Histogram(buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value)
+        assert histogram.cumulative() == {"0.1": 2, "1.0": 3, "+Inf": 4}
+        assert histogram.count == 4
+        assert histogram.percentile(0.5) == 0.1
+        assert histogram.percentile(1) == float("inf")
+
+
+class TestMetricsRegistry:
+    def test_disabled_registry_returns_null_timer(self):
+        registry = MetricsRegistry(enabled=False)
+        assert registry.timer("login") is NULL_TIMER
+        registry.inc("requests_total", request_type="login")
+        assert registry.snapshot() == {}
+
+    def test_prometheus_export(self):
+        registry = MetricsRegistry(enabled=True, buckets=(1.0,))
+        registry.observe("stage_duration_seconds", 0.5, request_type="a", stage="body")
+        registry.inc("errors_total", request_type='say "hi"')
+        text = registry.to_prometheus()
+        assert "# TYPE rmq_broker_stage_duration_seconds histogram" in text
+        assert (
+            'rmq_broker_stage_duration_seconds_bucket{request_type="a",stage="body",le="1.0"} 1'
+            in text
+        )
+        assert 'rmq_broker_errors_total{request_type="say \\"hi\\""} 1' in text
+
+    def test_chain_manager_records_stages(self):
+        message = MessageFactory.get_unprocessed_message()
+        message["request_type"] = MetricsTestChain.request_type
+        metrics.reset()
+        metrics.enable()
+        try:
+            response = asyncio.run(ChainManager().handle(message))
+        finally:
+            metrics.disable()
+        assert response["status"]["code"] == 200
+        snapshot = metrics.snapshot()
+        stages = {
+            sample["labels"]["stage"] for sample in snapshot["stage_duration_seconds"]
+        }
+        assert {"validation", "body", "header", "response_validation"} <= stages
+        assert snapshot["requests_total"][0]["value"] == 1
+        assert snapshot["in_flight_requests"][0]["value"] == 0
+        assert "errors_total" not in snapshot
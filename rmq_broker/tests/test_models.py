@@ -21,6 +21,16 @@ class TestBaseMessage:
         message = TestMessage().generate()
         assert not message.get("header")
 
+    def test_generate_uses_structuring_hooks(self):
+        class TestMessage(BaseMessage):
+            def get_structured_message(self, flat_message):
+                message = super().get_structured_message(flat_message)
+                message["header"]["version"] = 2
+                return message
+
+        message = TestMessage().generate(dst="catalog")
+        assert message["header"] == {"dst": "catalog", "src": "", "version": 2}
+
 
 # TODO Rename test names according to model names
 class TestOutgoingMessage:
@@ -75,3 +85,21 @@ class TestErrorMessage:
         assert ProcessedMessage(**message)
         assert message["status"]["code"] == 400
         assert message["status"]["message"] == "Error"
+
+
+class TestMessageTemplate:
+    def test_generate_uses_class_defaults(self):
+        message = ErrorMessage().generate(code=503)
+        assert message["status"] == {"message": "Error", "code": 503}
+        assert "status" not in UnprocessedMessage().generate()
+
+    def test_generate_creates_new_values(self):
+        first, second = ProcessedMessage().generate(), ProcessedMessage().generate()
+        assert first["request_id"] != second["request_id"]
+        first["body"]["key"] = "value"
+        assert second["body"] == {} and ProcessedMessage().generate()["body"] == {}
+
+    def test_generate_casts_to_str_and_ignores_empty_values(self):
+        message = ProcessedMessage().generate(src=123, dst="", message=None)
+        assert message["header"] == {"src": "123", "dst": ""}
+        assert message["status"]["message"] == "OK"
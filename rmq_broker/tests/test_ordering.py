@@ -0,0 +1,89 @@
+import asyncio
+
+from rmq_broker.async_chains.base import BaseChain, ChainManager
+from rmq_broker.tests.factories import MessageFactory
+from rmq_broker.utils.ordering import OrderedDispatcher, get_ordering_config
+
+
+class OrderedTestChain(BaseChain):
+    request_type = "ordered_test"
+    include_in_schema = False
+    partition_key = "body.account"
+    events = []
+
+    async def get_response_body(self, data):
+        body = data["body"]
+        self.events.append(("start", body["account"], body["n"]))
+        await asyncio.sleep(body.get("delay", 0.01))
+        self.events.append(("end", body["account"], body["n"]))
+        return self.form_response(data, body)
+
+
+def get_message(**body):
+    message = MessageFactory.get_unprocessed_message()
+    message["request_type"] = OrderedTestChain.request_type
+    message["body"] = body
+    return message
+
+
+class TestOrderedDispatcher:
+    def test_same_key_in_order_other_keys_in_parallel(self):
+        OrderedTestChain.events = []
+        worker = OrderedDispatcher().wrap(ChainManager().handle)
+
+        async def run():
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            await asyncio.gather(
+                worker(data=get_message(account="a", n=0, delay=0.03)),
+                worker(data=get_message(account="a", n=1, delay=0)),
+                worker(data=get_message(account="b", n=0, delay=0.03)),
+                worker(data=get_message(account="a", n=2, delay=0)),
+            )
+            return loop.time() - started
+
+        elapsed = asyncio.run(run())
+        events_a = [event for event in OrderedTestChain.events if event[1] == "a"]
+        assert events_a == [
+            ("start", "a", 0),
+            ("end", "a", 0),
+            ("start", "a", 1),
+            ("end", "a", 1),
+            ("start", "a", 2),
+            ("end", "a", 2),
+        ]
+        assert OrderedTestChain.events[:2] == [("start", "a", 0), ("start", "b", 0)]
+        assert elapsed < 0.06
+
+    def test_partition_queue_limit(self):
+        dispatcher = OrderedDispatcher(max_pending=2)
+        worker = dispatcher.wrap(ChainManager().handle)
+
+        async def run():
+            return await asyncio.gather(
+                *(worker(data=get_message(account="a", n=n)) for n in range(3))
+            )
+
+        responses = asyncio.run(run())
+        assert [response["status"]["code"] for response in responses] == [
+            200,
+            200,
+            503,
+        ]
+        assert dispatcher.partitions == {}
+
+    def test_key(self):
+        dispatcher = OrderedDispatcher()
+        assert dispatcher.get_key(get_message(account=[1], n=0)) == (
+            "body.account",
+            "[1]",
+        )
+        assert dispatcher.get_key(get_message(n=0)) is None
+        assert dispatcher.get_key(MessageFactory.get_unprocessed_message()) is None
+
+    def test_enabled_by_partitioned_chains(self):
+        ChainManager()
+        assert get_ordering_config({}) == {}
+        assert get_ordering_config({"ordering": {"max_pending": 5}}) == {
+            "max_pending": 5
+        }
@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+
+from rmq_broker.queues.rabbitmq import AsyncRabbitMessageQueue
+from rmq_broker.settings import settings
+from rmq_broker.tests.factories import MessageFactory
+from rmq_broker.utils.prefetch import PrefetchController
+
+
+class TestPrefetchController:
+    def test_bounds_validation(self):
+        with pytest.raises(AttributeError):
+            PrefetchController(min_prefetch=10, max_prefetch=5)
+
+    def test_saturated_consumer_increases_prefetch(self):
+        controller = PrefetchController(
+            min_prefetch=2, max_prefetch=4, initial_prefetch=3, target_latency=1.0
+        )
+        controller.observe(0.01)
+        controller.peak_in_flight = 3
+        assert controller.next_prefetch() == 4
+        controller.prefetch = 4
+        controller.peak_in_flight = 4
+        assert controller.next_prefetch() == 4
+
+    def test_slow_handler_decreases_prefetch(self):
+        controller = PrefetchController(
+            min_prefetch=2, max_prefetch=100, initial_prefetch=40, target_latency=0.1
+        )
+        controller.observe(0.5)
+        controller.peak_in_flight = 40
+        assert controller.next_prefetch() == 20
+
+    def test_idle_consumer_decreases_prefetch(self):
+        controller = PrefetchController(initial_prefetch=10, increase=2)
+        controller.peak_in_flight = 1
+        assert controller.next_prefetch() == 8
+
+    def test_latency_ewma(self):
+        controller = PrefetchController(alpha=0.5)
+        controller.observe(1.0)
+        controller.observe(2.0)
+        assert controller.latency == 1.5
+
+    def test_wrapped_worker_applies_prefetch(self):
+        applied = []
+
+        async def set_prefetch(prefetch):
+            applied.append(prefetch)
+
+        async def worker(data):
+            return data
+
+        async def run():
+            controller = PrefetchController(
+                initial_prefetch=1, max_prefetch=10, set_prefetch=set_prefetch
+            )
+            assert await controller.wrap(worker)(data={"a": 1}) == {"a": 1}
+            assert controller.in_flight == 0
+            await controller.adjust()
+            return controller
+
+        controller = asyncio.run(run())
+        assert controller.peak_in_flight == 0
+        assert applied == [2]
+
+    def test_peak_decays_when_idle(self):
+        async def worker(data):
+            await asyncio.sleep(0.01)
+
+        async def run():
+            controller = PrefetchController(initial_prefetch=4, max_prefetch=10)
+            wrapped = controller.wrap(worker)
+            await asyncio.gather(*(wrapped(data={}) for _ in range(4)))
+            await controller.adjust()
+            # За следующий интервал сообщений не было.
+            await controller.adjust()
+            return controller
+
+        controller = asyncio.run(run())
+        assert controller.peak_in_flight == 0
+        assert controller.prefetch == 4
+
+
+def test_consumer_counts_queued_requests(monkeypatch):
+    monkeypatch.setitem(
+        settings.CONSUMERS,
+        "rabbitmq",
+        {
+            **settings.CONSUMERS["rabbitmq"],
+            "adaptive_prefetch": {"max_prefetch": 10},
+            "fair_scheduling": {"max_concurrency": 1},
+        },
+    )
+    queue = AsyncRabbitMessageQueue()
+    controller = queue.prefetch_controller
+    release = asyncio.Event()
+
+    async def worker(data):
+        await release.wait()
+        return {"status": {"code": 200}}
+
+    async def run():
+        wrapped = queue.wrap_worker(worker)
+        calls = [
+            asyncio.ensure_future(
+                wrapped(data=MessageFactory.get_unprocessed_message())
+            )
+            for _ in range(3)
+        ]
+        await asyncio.sleep(0.01)
+        # Один запрос выполняется, два ждут очереди планировщика.
+        in_flight = controller.in_flight
+        release.set()
+        await asyncio.gather(*calls)
+        return in_flight
+
+    assert asyncio.run(run()) == 3
+    assert controller.in_flight == 0
+    assert controller.peak_in_flight == 3
@@ -0,0 +1,97 @@
+import asyncio
+import time
+
+from rmq_broker.async_chains.base import BaseChain, ChainManager
+from rmq_broker.profiling.base import IDLE, AsyncProfilingChain
+from rmq_broker.tests.factories import MessageFactory
+
+
+class ProfileTestChain(AsyncProfilingChain):
+    request_type = "profile_test"
+
+
+class BusyTestChain(BaseChain):
+    request_type = "busy_test"
+    include_in_schema = False
+
+    async def get_response_body(self, data):
+        await asyncio.sleep(0)
+        chunks = []
+        deadline = time.perf_counter() + 0.02
+        while time.perf_counter() < deadline:
+            chunks.append(bytearray(1000))
+        BusyTestChain.retained.extend(chunks)
+        return self.form_response(data, {"chunks": len(chunks)})
+
+    retained = []
+
+
+def get_message(request_type, body):
+    message = MessageFactory.get_unprocessed_message()
+    message["request_type"] = request_type
+    message["body"] = body
+    return message
+
+
+async def profile(body):
+    manager = ChainManager()
+    task = asyncio.ensure_future(
+        manager.handle(get_message(ProfileTestChain.request_type, body))
+    )
+    await asyncio.sleep(0.01)
+    for _ in range(5):
+        await manager.handle(get_message(BusyTestChain.request_type, {}))
+    return await task
+
+
+class TestProfilingChain:
+    def test_sampling(self):
+        response = asyncio.run(
+            profile(
+                {"mode": "sampling", "duration": 0.2, "interval": 0.001, "limit": 500}
+            )
+        )
+        assert response["status"]["code"] == 200
+        body = response["body"]
+        assert body["mode"] == "sampling"
+        busy = body["request_types"]["busy_test"]
+        assert busy["samples"] > body["request_types"][IDLE]["samples"] / 10
+        assert any("get_response_body" in f["function"] for f in busy["functions"])
+
+    def test_cprofile(self):
+        response = asyncio.run(profile({"mode": "cprofile", "duration": 0.2}))
+        body = response["body"]
+        assert body["request_types"]["busy_test"]["cumtime"] > 0.05
+        assert body["functions"]
+
+    def test_tracemalloc(self):
+        response = asyncio.run(profile({"mode": "tracemalloc", "duration": 0.2}))
+        body = response["body"]
+        assert body["request_types"]["busy_test"]["size_diff"] > 0
+        assert body["lines"]
+
+    def test_invalid_mode(self):
+        response = asyncio.run(
+            ChainManager().handle(
+                get_message(ProfileTestChain.request_type, {"mode": "perf"})
+            )
+        )
+        assert response["status"]["code"] == 400
+
+    def test_concurrent_profiling_conflict(self):
+        async def run():
+            manager = ChainManager()
+            first = asyncio.ensure_future(
+                manager.handle(
+                    get_message(ProfileTestChain.request_type, {"duration": 0.05})
+                )
+            )
+            await asyncio.sleep(0.01)
+            second = await manager.handle(
+                get_message(ProfileTestChain.request_type, {"duration": 0.05})
+            )
+            return await first, second
+
+        first, second = asyncio.run(run())
+        assert first["status"]["code"] == 200
+        assert second["status"]["code"] == 409
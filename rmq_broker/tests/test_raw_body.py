@@ -0,0 +1,75 @@
+import asyncio
+import pickle
+from typing import List
+
+from rmq_broker.async_chains.base import BaseChain, ChainManager
+from rmq_broker.chains import base as sync_base
+from rmq_broker.tests.factories import MessageFactory
+from rmq_broker.utils.raw_body import RawBody, decode_body
+
+
+class RawBodyTestChain(BaseChain):
+    request_type = "raw_body_test"
+    include_in_schema = False
+
+    async def get_response_body(self, data):
+        return self.form_response(data, {"sum": sum(data["body"]["numbers"])})
+
+
+class PassthroughTestChain(BaseChain):
+    request_type = "passthrough_test"
+    include_in_schema = False
+    passthrough = True
+
+    async def get_response_body(self, data):
+        return self.form_response(data, data["body"])
+
+
+class SyncRawBodyTestChain(sync_base.BaseChain):
+    request_type = "sync_raw_body_test"
+    include_in_schema = False
+    body_model = List[int]
+
+    def get_response_body(self, data):
+        return self.form_response(data, {"sum": sum(self.body)})
+
+
+def get_message(request_type, body):
+    message = MessageFactory.get_unprocessed_message()
+    message["request_type"] = request_type
+    message["body"] = body
+    return message
+
+
+class TestRawBody:
+    def test_survives_pickling(self):
+        body = RawBody.encode({"numbers": [1, 2]})
+        restored = pickle.loads(pickle.dumps(body))
+        assert isinstance(restored, RawBody)
+        assert restored.decode() == {"numbers": [1, 2]}
+        assert decode_body({"a": 1}) == {"a": 1}
+
+    def test_chain_gets_decoded_body_and_replies_encoded(self):
+        message = get_message(
+            RawBodyTestChain.request_type, RawBody.encode({"numbers": [1, 2, 3]})
+        )
+        response = asyncio.run(ChainManager().handle(message))
+        assert isinstance(response["body"], RawBody)
+        assert response["body"].decode() == {"sum": 6}
+
+    def test_passthrough_chain_gets_encoded_body(self):
+        body = RawBody.encode({"numbers": [1]})
+        message = get_message(PassthroughTestChain.request_type, body)
+        response = asyncio.run(ChainManager().handle(message))
+        assert response["body"] is body
+
+    def test_sync_chain_gets_decoded_body_and_replies_encoded(self):
+        message = get_message(
+            SyncRawBodyTestChain.request_type, RawBody.encode([1, 2, 3])
+        )
+        # Singleton хранит экземпляры по имени класса, а асинхронный ChainManager
+        # уже создан другими тестами.
+        response = sync_base.ChainManager.handle(ChainManager(), message)
+        assert response["status"]["code"] == 200
+        assert isinstance(response["body"], RawBody)
+        assert response["body"].decode() == {"sum": 6}
@@ -0,0 +1,80 @@
+import asyncio
+import itertools
+import json
+
+import pytest
+
+from rmq_broker.tests.factories import MessageFactory
+from rmq_broker.tools.replay import (
+    ReplayService,
+    percentile,
+    read_messages,
+    replay,
+    schedule,
+)
+
+
+class TestReplay:
+    def test_read_messages_accepts_capture_records(self):
+        message = MessageFactory.get_unprocessed_message()
+        lines = [json.dumps(message), "", json.dumps({"request": message, "ts": 1})]
+        assert read_messages(lines) == [message, message]
+
+    def test_fixed_rate_schedule(self):
+        assert list(itertools.islice(schedule(4), 3)) == [0, 0.25, 0.5]
+
+    def test_ramped_schedule(self):
+        offsets = list(itertools.islice(schedule(100, start_rate=1, ramp=10), 1000))
+        gaps = [b - a for a, b in zip(offsets, offsets[1:])]
+        assert gaps[0] == 1
+        assert gaps == sorted(gaps, reverse=True)
+        assert gaps[-1] == pytest.approx(0.01)
+
+    def test_invalid_rate(self):
+        with pytest.raises(AttributeError):
+            next(schedule(0))
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        assert percentile(values, 0.5) == 50
+        assert percentile(values, 0.99) == 99
+        assert percentile([], 0.5) is None
+
+    def test_open_loop_replay(self):
+        ok = MessageFactory.get_unprocessed_message()
+        failed = {**MessageFactory.get_unprocessed_message(), "request_type": "Fail"}
+
+        async def call(message):
+            # Медленные ответы не задерживают отправку следующих запросов.
+            await asyncio.sleep(0.05)
+            code = 500 if message["request_type"] == "Fail" else 200
+            return {**message, "status": {"code": code, "message": ""}}
+
+        stats = asyncio.run(
+            replay(call, [ok, failed], schedule(1000), count=10, timeout=1)
+        )
+        report = stats.report()
+        assert report["sdfsd"]["count"] == 5
+        assert report["sdfsd"]["error_rate"] == 0
+        assert report["fail"]["error_rate"] == 1
+        assert report["sdfsd"]["p50"] >= 0.05
+        assert stats.duration < 0.1
+        assert "sdfsd" in stats.format_report()
+
+    def test_timeout_is_error(self):
+        async def call(message):
+            await asyncio.sleep(1)
+
+        stats = asyncio.run(
+            replay(call, [{"request_type": "slow"}], schedule(10), timeout=0.01)
+        )
+        assert stats.report()["slow"]["error_rate"] == 1
+
+    def test_prepare_replaces_request_id(self):
+        message = MessageFactory.get_unprocessed_message()
+        prepared = ReplayService("orders").prepare(message)
+        assert prepared["request_id"] != message["request_id"]
+        assert prepared["header"] == {"src": "test", "dst": "orders"}
+        assert message["header"]["dst"] == "sdfsdfs"
+        kept = ReplayService("orders", keep_ids=True).prepare(message)
+        assert kept["request_id"] == message["request_id"]
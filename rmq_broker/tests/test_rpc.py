@@ -0,0 +1,65 @@
+import asyncio
+
+from rmq_broker.queues.rpc import BrokerRPC, DirectReplyRPC, get_rpc_class
+
+
+class FakeCallbacks(set):
+    def add(self, callback):
+        super().add(callback)
+
+
+class FakeQueue:
+    def __init__(self, name, channel):
+        self.name = name
+        self.channel = channel
+        self.consumers = []
+
+    async def consume(self, callback, **kwargs):
+        self.consumers.append(kwargs)
+        return f"ctag{len(self.consumers)}"
+
+
+class FakeChannel:
+    def __init__(self):
+        self.close_callbacks = FakeCallbacks()
+        self.return_callbacks = FakeCallbacks()
+        self.reopen_callbacks = FakeCallbacks()
+        # Канал aiormq, который RobustChannel заменяет при переподключении.
+        self.channel = object()
+        self.queue = None
+
+    async def get_queue(self, name, ensure=True):
+        assert not ensure
+        self.queue = FakeQueue(name, self.channel)
+        return self.queue
+
+    async def declare_queue(self, *args, **kwargs):
+        raise AssertionError("Direct reply-to must not declare queues")
+
+    async def declare_exchange(self, *args, **kwargs):
+        raise AssertionError("Direct reply-to must not declare exchanges")
+
+
+class TestDirectReplyRPC:
+    def test_rpc_class_from_config(self):
+        assert get_rpc_class({"rpc_reply_mode": "direct"}) is DirectReplyRPC
+        assert get_rpc_class({"broker_url": ""}) is BrokerRPC
+        assert get_rpc_class(None) is BrokerRPC
+
+    def test_uses_reply_to_pseudo_queue(self):
+        async def run():
+            channel = FakeChannel()
+            rpc = await DirectReplyRPC.create(channel)
+            first_queue = rpc.result_queue
+            channel.channel = object()
+            await rpc.on_reopen(channel)
+            return rpc, channel, first_queue
+
+        rpc, channel, first_queue = asyncio.run(run())
+        assert rpc.result_queue.name == "amq.rabbitmq.reply-to"
+        assert first_queue.consumers == [{"exclusive": True, "no_ack": True}]
+        # После переподключения ответы получаются в новом канале.
+        assert rpc.result_queue is not first_queue
+        assert rpc.result_queue.channel is channel.channel
+        assert rpc.result_queue.consumers == [{"exclusive": True, "no_ack": True}]
+        assert rpc.on_reopen in channel.reopen_callbacks
@@ -0,0 +1,110 @@
+import asyncio
+
+from rmq_broker.tests.factories import MessageFactory
+from rmq_broker.utils.scheduling import FairScheduler, TokenBucket
+
+
+def get_message(src, n):
+    message = MessageFactory.get_unprocessed_message()
+    message["header"]["src"] = src
+    message["body"] = {"n": n}
+    return message
+
+
+def get_worker(order):
+    async def worker(data):
+        order.append((data["header"]["src"], data["body"]["n"]))
+        await asyncio.sleep(0)
+        return {"status": {"code": 200}}
+
+    return worker
+
+
+class TestFairScheduler:
+    def test_sources_share_by_weight(self):
+        order = []
+        scheduler = FairScheduler(max_concurrency=1, weights={"gateway": 2})
+        worker = scheduler.wrap(get_worker(order))
+
+        async def run():
+            messages = [get_message("noisy", n) for n in range(6)]
+            messages += [get_message("gateway", n) for n in range(4)]
+            await asyncio.gather(*(worker(data=message) for message in messages))
+
+        asyncio.run(run())
+        # Очередь noisy не задерживает gateway: на каждый запрос noisy приходится
+        # два запроса gateway (первый запрос noisy выполнен без очереди).
+        assert [src for src, _ in order[:6]] == [
+            "noisy",
+            "gateway",
+            "gateway",
+            "gateway",
+            "noisy",
+            "gateway",
+        ]
+        assert [n for src, n in order if src == "noisy"] == list(range(6))
+        assert scheduler.in_flight == 0
+        assert scheduler.heap == []
+        assert not scheduler.queued
+
+    def test_rate_limit(self):
+        order = []
+        scheduler = FairScheduler(rate_limits={"noisy": {"rate": 0.001, "burst": 2}})
+        worker = scheduler.wrap(get_worker(order))
+
+        async def run():
+            messages = [get_message("noisy", n) for n in range(3)]
+            messages.append(get_message("other", 0))
+            return await asyncio.gather(*(worker(data=message) for message in messages))
+
+        responses = asyncio.run(run())
+        assert [response["status"]["code"] for response in responses] == [
+            200,
+            200,
+            429,
+            200,
+        ]
+        assert ("noisy", 2) not in order
+
+    def test_source_queue_limit(self):
+        scheduler = FairScheduler(max_concurrency=1, max_queue=1)
+        worker = scheduler.wrap(get_worker([]))
+
+        async def run():
+            return await asyncio.gather(
+                *(worker(data=get_message("noisy", n)) for n in range(3)),
+                worker(data=get_message("other", 0)),
+            )
+
+        responses = asyncio.run(run())
+        assert [response["status"]["code"] for response in responses] == [
+            200,
+            200,
+            503,
+            200,
+        ]
+
+    def test_cancelled_waiter_releases_slot(self):
+        scheduler = FairScheduler(max_concurrency=1)
+        worker = scheduler.wrap(get_worker([]))
+
+        async def run():
+            first = asyncio.ensure_future(worker(data=get_message("a", 0)))
+            second = asyncio.ensure_future(worker(data=get_message("b", 0)))
+            await asyncio.sleep(0)
+            second.cancel()
+            await first
+            return await worker(data=get_message("c", 0))
+
+        assert asyncio.run(run())["status"]["code"] == 200
+        assert scheduler.in_flight == 0
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=10, burst=2)
+    now = bucket.updated
+    assert bucket.try_acquire(now)
+    assert bucket.try_acquire(now)
+    assert not bucket.try_acquire(now)
+    assert bucket.try_acquire(now + 0.15)
+    assert not bucket.try_acquire(now + 0.15)
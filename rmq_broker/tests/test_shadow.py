@@ -0,0 +1,131 @@
+import asyncio
+
+from rmq_broker.models import ErrorMessage
+from rmq_broker.tests.factories import MessageFactory
+from rmq_broker.utils.metrics import metrics
+from rmq_broker.utils.shadow import SHADOW_LATENCY, SHADOW_REQUESTS, ShadowMirror
+
+
+def get_message(n):
+    message = MessageFactory.get_unprocessed_message()
+    message["request_type"] = "Shadow_Test"
+    message["body"] = {"n": n}
+    return message
+
+
+async def primary(data):
+    body = data.pop("body")
+    return {"request_id": data["request_id"], "status": {"code": 200}, "body": body}
+
+
+def reply(data, body):
+    return {"request_id": data["request_id"], "status": {"code": 200}, "body": body}
+
+
+def get_results():
+    return {
+        sample["labels"]["result"]: sample["value"]
+        for sample in metrics.snapshot().get(SHADOW_REQUESTS, [])
+    }
+
+
+def run_mirror(mirror, messages):
+    async def run():
+        worker = mirror.wrap(primary)
+        responses = [await worker(data=message) for message in messages]
+        while mirror._tasks or mirror._comparisons:
+            await asyncio.gather(
+                *mirror._tasks, *mirror._comparisons, return_exceptions=True
+            )
+        return responses
+
+    metrics.reset()
+    metrics.enable()
+    try:
+        return asyncio.run(run())
+    finally:
+        metrics.disable()
+
+
+class TestShadowMirror:
+    def test_compares_responses(self):
+        sent = []
+
+        async def post(data, queue):
+            sent.append((queue, data))
+            n = data["body"]["n"]
+            if n == 2:
+                raise RuntimeError("shadow failed")
+            if n == 3:
+                return ErrorMessage().generate(message="validation error")
+            return reply(data, {"n": n if n else -1})
+
+        mirror = ShadowMirror("shadow_queue", post, sample_rate=1)
+        responses = run_mirror(mirror, [get_message(n) for n in range(4)])
+
+        # Вызывающий получает ответ основного обработчика.
+        assert [response["body"] for response in responses] == [
+            {"n": 0},
+            {"n": 1},
+            {"n": 2},
+            {"n": 3},
+        ]
+        # Основной обработчик изменяет запрос, в теневую очередь уходит копия.
+        assert [(queue, data["body"]) for queue, data in sent] == [
+            ("shadow_queue", {"n": 0}),
+            ("shadow_queue", {"n": 1}),
+            ("shadow_queue", {"n": 2}),
+            ("shadow_queue", {"n": 3}),
+        ]
+        # ErrorMessage вместо ответа на запрос - ошибка теневого вызова.
+        assert get_results() == {"mismatch": 1, "match": 1, "error": 2}
+        targets = {
+            sample["labels"]["target"]
+            for sample in metrics.snapshot()[SHADOW_LATENCY]
+            if sample["labels"]["request_type"] == "shadow_test"
+        }
+        assert targets == {"primary", "shadow"}
+
+    def test_timeout(self):
+        async def post(data, queue):
+            await asyncio.sleep(1)
+
+        mirror = ShadowMirror("shadow_queue", post, sample_rate=1, timeout=0.01)
+        run_mirror(mirror, [get_message(1)])
+        assert get_results() == {"timeout": 1}
+
+    def test_sampling(self):
+        sent = []
+
+        async def post(data, queue):
+            sent.append(data)
+            return reply(data, {})
+
+        mirror = ShadowMirror("shadow_queue", post, sample_rate=0)
+        run_mirror(mirror, [get_message(n) for n in range(5)])
+        assert sent == []
+        mirror = ShadowMirror("shadow_queue", post, sample_rate=1, max_in_flight=0)
+        run_mirror(mirror, [get_message(n) for n in range(5)])
+        assert sent == []
+
+    def test_in_flight_limit_counts_shadow_calls(self):
+        release = asyncio.Event()
+        sent = []
+
+        async def post(data, queue):
+            sent.append(data)
+            await release.wait()
+            return reply(data, {})
+
+        async def run():
+            mirror = ShadowMirror("shadow_queue", post, sample_rate=1, max_in_flight=2)
+            worker = mirror.wrap(primary)
+            for n in range(3):
+                await worker(data=get_message(n))
+            await asyncio.sleep(0.01)
+            in_flight = len(sent)
+            release.set()
+            await asyncio.gather(*mirror._tasks, *mirror._comparisons)
+            return in_flight
+
+        assert asyncio.run(run()) == 2
@@ -0,0 +1,54 @@
+import asyncio
+
+from rmq_broker.async_chains.base import BaseChain, ChainManager
+from rmq_broker.queues.rpc import collect_pages
+from rmq_broker.tests.factories import MessageFactory
+
+
+class StreamingTestChain(BaseChain):
+    request_type = "streaming_test"
+    include_in_schema = False
+
+    async def get_response_body(self, data):
+        for page in range(data["body"]["pages"]):
+            yield [page * 2, page * 2 + 1]
+        if data["body"].get("fail"):
+            raise ValueError("page failed")
+
+
+def get_message(**body):
+    message = MessageFactory.get_unprocessed_message()
+    message["request_type"] = StreamingTestChain.request_type
+    message["body"] = body
+    return message
+
+
+async def handle(message):
+    pages = await ChainManager().handle(message)
+    return [page async for page in pages]
+
+
+class TestStreaming:
+    def test_pages_are_separate_responses(self):
+        message = get_message(pages=3)
+        pages = asyncio.run(handle(message))
+        assert [page["body"] for page in pages] == [[0, 1], [2, 3], [4, 5]]
+        for page in pages:
+            assert page["status"]["code"] == 200
+            assert page["request_id"] == message["request_id"]
+            assert page["header"]["dst"] == message["header"]["src"]
+
+    def test_empty_stream_has_one_page(self):
+        pages = asyncio.run(handle(get_message(pages=0)))
+        assert [page["body"] for page in pages] == [[]]
+
+    def test_error_ends_stream(self):
+        pages = asyncio.run(handle(get_message(pages=1, fail=True)))
+        assert pages[-1]["status"] == {"message": "page failed", "code": 400}
+
+    def test_collect_pages(self):
+        async def run(**body):
+            return await collect_pages(await ChainManager().handle(get_message(**body)))
+
+        assert asyncio.run(run(pages=2))["body"] == [0, 1, 2, 3]
+        assert asyncio.run(run(pages=2, fail=True))["status"]["code"] == 400
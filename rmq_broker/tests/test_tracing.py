@@ -0,0 +1,117 @@
+import asyncio
+import sys
+import types
+
+from rmq_broker.async_chains.base import BaseChain, ChainManager
+from rmq_broker.tests.factories import MessageFactory
+from rmq_broker.utils.tracing import (
+    NULL_SPAN,
+    TRACEPARENT,
+    FileSpanExporter,
+    OpenTelemetrySpanExporter,
+    SpanExporter,
+    Tracer,
+    get_default_exporter,
+    parse_traceparent,
+    tracer,
+)
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+
+class ListExporter(SpanExporter):
+    def __init__(self):
+        self.spans = []
+
+    def export(self, span):
+        self.spans.append(span)
+
+
+class TracingTestChain(BaseChain):
+    request_type = "tracing_test"
+    include_in_schema = False
+
+    async def get_response_body(self, data):
+        return self.form_response(
+            data, {"traceparent": tracer.current_span().traceparent}
+        )
+
+
+class TestTraceparent:
+    def test_parse_traceparent(self):
+        assert parse_traceparent(f"00-{TRACE_ID}-{PARENT_ID}-01") == (
+            TRACE_ID,
+            PARENT_ID,
+            True,
+        )
+
+    def test_parse_invalid_traceparent(self):
+        assert parse_traceparent(None) is None
+        assert parse_traceparent("garbage") is None
+        assert parse_traceparent(f"00-{'0' * 32}-{PARENT_ID}-01") is None
+
+
+class TestTracer:
+    def test_disabled_tracer_returns_null_span(self):
+        assert Tracer(enabled=False).start_span("login") is NULL_SPAN
+
+    def test_nested_span_continues_trace(self):
+        exporter = ListExporter()
+        local_tracer = Tracer(enabled=True, exporter=exporter)
+        with local_tracer.start_span(
+            "server", f"00-{TRACE_ID}-{PARENT_ID}-01"
+        ) as parent:
+            with local_tracer.start_span("client") as child:
+                message = {"header": {}}
+                child.inject(message)
+        assert parent.trace_id == child.trace_id == TRACE_ID
+        assert parent.parent_id == PARENT_ID
+        assert child.parent_id == parent.span_id
+        assert parse_traceparent(message["header"][TRACEPARENT])[1] == child.span_id
+        assert exporter.spans == [child, parent]
+
+    def test_chain_manager_continues_incoming_trace(self):
+        exporter = ListExporter()
+        message = MessageFactory.get_unprocessed_message()
+        message["request_type"] = TracingTestChain.request_type
+        message["header"][TRACEPARENT] = f"00-{TRACE_ID}-{PARENT_ID}-01"
+        tracer.enable(exporter)
+        try:
+            response = asyncio.run(ChainManager().handle(message))
+        finally:
+            tracer.disable()
+        (span,) = exporter.spans
+        assert span.trace_id == TRACE_ID
+        assert span.parent_id == PARENT_ID
+        assert response["body"]["traceparent"] == span.traceparent
+
+
+class FakeTracerProvider:
+    pass
+
+
+def install_opentelemetry(monkeypatch, provider):
+    trace = types.SimpleNamespace(
+        ProxyTracerProvider=type("ProxyTracerProvider", (), {}),
+        NoOpTracerProvider=type("NoOpTracerProvider", (), {}),
+        get_tracer=lambda name: None,
+    )
+    trace.get_tracer_provider = lambda: provider(trace)
+    package = types.ModuleType("opentelemetry")
+    package.trace = trace
+    monkeypatch.setitem(sys.modules, "opentelemetry", package)
+
+
+class TestDefaultExporter:
+    def test_without_opentelemetry(self, monkeypatch):
+        monkeypatch.setitem(sys.modules, "opentelemetry", None)
+        assert isinstance(get_default_exporter(), FileSpanExporter)
+
+    def test_unconfigured_tracer_provider(self, monkeypatch):
+        install_opentelemetry(monkeypatch, lambda trace: trace.ProxyTracerProvider())
+        assert isinstance(get_default_exporter(), FileSpanExporter)
+
+    def test_configured_tracer_provider(self, monkeypatch):
+        install_opentelemetry(monkeypatch, lambda trace: FakeTracerProvider())
+        assert isinstance(get_default_exporter(), OpenTelemetrySpanExporter)
@@ -0,0 +1,195 @@
+import asyncio
+import os
+import pickle
+import stat
+
+import pytest
+
+from rmq_broker.async_chains.base import BaseChain, ChainManager
+from rmq_broker.queues.unix import (
+    HEADER,
+    AsyncUnixSocketMessageQueue,
+    UnixSocketRPC,
+    check_socket_dir,
+    get_socket_path,
+    read_frame,
+)
+from rmq_broker.services.base import BaseService
+from rmq_broker.settings import settings
+
+
+class UnixTestChain(BaseChain):
+    request_type = "unix_test"
+    include_in_schema = False
+
+    async def get_response_body(self, data):
+        return self.form_response(data, {"echo": data["body"]})
+
+
+class UnixStreamTestChain(BaseChain):
+    request_type = "unix_stream_test"
+    include_in_schema = False
+
+    async def get_response_body(self, data):
+        for page in range(3):
+            yield [page]
+
+
+class UnixTestService(BaseService):
+    dst_service_name = "unix_test_service"
+
+
+@pytest.fixture
+def unix_settings(tmp_path, monkeypatch):
+    monkeypatch.setitem(
+        settings.CONSUMERS,
+        "unix",
+        {"socket_dir": str(tmp_path), "destinations": ["unix_test_service"]},
+    )
+    return tmp_path
+
+
+async def serve_and_call(call):
+    async with AsyncUnixSocketMessageQueue() as provider:
+        await provider.register_tasks(
+            UnixTestService.dst_service_name, ChainManager().handle
+        )
+        return await call(UnixTestService())
+
+
+class TestUnixSocketTransport:
+    def test_routing(self, unix_settings):
+        assert UnixTestService().get_broker_name() == "unix"
+
+        class RabbitService(BaseService):
+            dst_service_name = "other"
+
+        assert RabbitService().get_broker_name() == "rabbitmq"
+
+    def test_send_message(self, unix_settings):
+        async def call(service):
+            return await asyncio.gather(
+                *(service.send_message("unix_test", {"n": n}) for n in range(10))
+            )
+
+        responses = asyncio.run(serve_and_call(call))
+        assert [response["body"] for response in responses] == [
+            {"echo": {"n": n}} for n in range(10)
+        ]
+        assert responses[0]["status"]["code"] == 200
+        assert not (unix_settings / "unix_test_service.sock").exists()
+
+    def test_stream_message(self, unix_settings):
+        async def call(service):
+            return [
+                response["body"]
+                async for response in service.stream_message("unix_stream_test", {})
+            ]
+
+        assert asyncio.run(serve_and_call(call)) == [[0], [1], [2]]
+
+    def test_send_batch(self, unix_settings):
+        async def call(service):
+            return await service.send_batch(
+                [("unix_test", {"n": 1}), ("unix_stream_test", {})]
+            )
+
+        first, second = asyncio.run(serve_and_call(call))
+        assert first["body"] == {"echo": {"n": 1}}
+        assert second["body"] == [0, 1, 2]
+
+    def test_unavailable_socket(self, unix_settings):
+        response = asyncio.run(UnixTestService().send_message("unix_test", {}))
+        assert response["status"]["code"] == 400
+        assert "unavailable" in response["status"]["message"]
+
+    def test_consumer_mechanisms(self, unix_settings):
+        settings.CONSUMERS["unix"]["fair_scheduling"] = {
+            "rate_limits": {"*": {"rate": 0.001, "burst": 1}}
+        }
+
+        async def call(service):
+            return [
+                (await service.send_message("unix_test", {}))["status"]["code"]
+                for _ in range(2)
+            ]
+
+        assert asyncio.run(serve_and_call(call)) == [200, 429]
+
+    def test_throttle(self, unix_settings):
+        async def run():
+            async with AsyncUnixSocketMessageQueue() as provider:
+                await provider.register_tasks(
+                    UnixTestService.dst_service_name, ChainManager().handle
+                )
+                service = UnixTestService()
+                await service.send_message("unix_test", {})
+                await provider.throttle()
+                call = asyncio.ensure_future(service.send_message("unix_test", {}))
+                done, _ = await asyncio.wait([call], timeout=0.05)
+                assert not done
+                await provider.unthrottle()
+                return (await call)["status"]["code"]
+
+        assert asyncio.run(run()) == 200
+
+    def test_undecodable_reply_fails_pending_calls(self, tmp_path):
+        path = str(tmp_path / "broken.sock")
+
+        async def reply_garbage(reader, writer):
+            await read_frame(reader, 1024)
+            writer.write(HEADER.pack(7) + b"garbage")
+            await writer.drain()
+
+        async def run():
+            server = await asyncio.start_unix_server(reply_garbage, path)
+            async with server:
+                rpc = await UnixSocketRPC.connect(path)
+                try:
+                    with pytest.raises(RuntimeError, match="connection closed"):
+                        await asyncio.wait_for(rpc.call("broken"), 1)
+                    assert rpc.is_closed
+                finally:
+                    await rpc.close()
+
+        asyncio.run(run())
+
+    @pytest.mark.parametrize(
+        "payload",
+        [b"garbage", pickle.dumps((0, 1, None)), pickle.dumps(None)],
+    )
+    def test_invalid_call_frame_closes_connection(self, unix_settings, payload, caplog):
+        async def call(service):
+            path = str(unix_settings / "unix_test_service.sock")
+            reader, writer = await asyncio.open_unix_connection(path)
+            writer.write(HEADER.pack(len(payload)) + payload)
+            await writer.drain()
+            closed = await asyncio.wait_for(reader.read(), 1)
+            writer.close()
+            return closed, await service.send_message("unix_test", {})
+
+        closed, response = asyncio.run(serve_and_call(call))
+        assert closed == b""
+        assert response["status"]["code"] == 200
+        assert [record.name for record in caplog.records if "frame" in record.message]
+        assert not [
+            record for record in caplog.records if "Unhandled" in record.message
+        ]
+
+    def test_socket_permissions(self, unix_settings):
+        async def call(service):
+            path = unix_settings / "unix_test_service.sock"
+            return stat.S_IMODE(os.stat(path).st_mode)
+
+        assert asyncio.run(serve_and_call(call)) == 0o600
+
+    def test_socket_dir_required(self):
+        with pytest.raises(AttributeError):
+            get_socket_path({}, "catalog")
+
+    def test_world_writable_socket_dir(self, unix_settings):
+        os.chmod(unix_settings, 0o777)
+        with pytest.raises(RuntimeError, match="writable by other users"):
+            check_socket_dir(get_socket_path({"socket_dir": unix_settings}, "a"))
+        response = asyncio.run(UnixTestService().send_message("unix_test", {}))
+        assert "writable by other users" in response["status"]["message"]
@@ -0,0 +1,122 @@
+import asyncio
+import time
+from uuid import uuid4
+
+import pytest
+
+from rmq_broker.async_chains.base import BaseChain, ChainManager
+from rmq_broker.tests.factories import MessageFactory
+from rmq_broker.utils.active import NULL_TRACKING, active_requests
+from rmq_broker.utils.watchdog import LoopWatchdog
+
+
+class ActiveTestChain(BaseChain):
+    request_type = "active_test"
+    include_in_schema = False
+    seen = []
+
+    async def get_response_body(self, data):
+        task, info = active_requests.current(asyncio.get_running_loop())
+        self.seen.append(info)
+        if data["body"].get("fail"):
+            raise ValueError("failed")
+        return self.form_response(data, {})
+
+
+class RecordingWatchdog(LoopWatchdog):
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.reports = []
+
+    def report(self, stalled: float) -> None:
+        self.reports.append((stalled, active_requests.current(self.loop)[1]))
+        super().report(stalled)
+
+
+def run_stalls(watchdog, stalls):
+    async def run():
+        watchdog.start()
+        try:
+            for request_id in range(stalls):
+                with active_requests.track("slow_test", request_id):
+                    time.sleep(0.2)
+                await asyncio.sleep(0.1)
+        finally:
+            watchdog.stop()
+
+    asyncio.run(run())
+
+
+@pytest.fixture
+def tracking():
+    active_requests.enable()
+    yield
+    active_requests.disable()
+
+
+class TestLoopWatchdog:
+    def test_reports_stalled_loop_with_request(self):
+        watchdog = RecordingWatchdog(threshold_ms=50)
+        run_stalls(watchdog, 1)
+        assert len(watchdog.reports) == 1
+        stalled, info = watchdog.reports[0]
+        assert stalled > 0.05
+        assert info == ("slow_test", "0")
+        assert not active_requests.enabled
+
+    def test_reports_are_rate_limited(self):
+        watchdog = RecordingWatchdog(threshold_ms=50, report_interval=60)
+        run_stalls(watchdog, 2)
+        assert len(watchdog.reports) == 1
+
+    def test_reports_every_stall_without_rate_limit(self):
+        watchdog = RecordingWatchdog(threshold_ms=50, report_interval=0)
+        run_stalls(watchdog, 2)
+        assert [info for _, info in watchdog.reports] == [
+            ("slow_test", "0"),
+            ("slow_test", "1"),
+        ]
+
+
+class TestActiveRequests:
+    def test_disabled_registry_does_not_track(self):
+        assert active_requests.track("a", 1) is NULL_TRACKING
+
+    def test_requests_attributed_and_removed(self, tracking):
+        ActiveTestChain.seen = []
+
+        request_ids = [str(uuid4()), str(uuid4())]
+
+        def get_message(request_id, fail=False):
+            message = MessageFactory.get_unprocessed_message()
+            message["request_type"] = ActiveTestChain.request_type
+            message["request_id"] = request_id
+            message["body"] = {"fail": fail}
+            return message
+
+        async def run():
+            ok = await ChainManager().handle(get_message(request_ids[0]))
+            failed = await ChainManager().handle(get_message(request_ids[1], fail=True))
+            return ok, failed
+
+        ok, failed = asyncio.run(run())
+        assert ok["status"]["code"] == 200
+        assert failed["status"]["code"] != 200
+        assert ActiveTestChain.seen == [
+            ("active_test", request_ids[0]),
+            ("active_test", request_ids[1]),
+        ]
+        assert active_requests.tasks == {}
+
+    def test_entry_removed_after_exception(self, tracking):
+        async def run():
+            try:
+                with active_requests.track("a", 1):
+                    assert active_requests.get(asyncio.current_task()) == ("a", "1")
+                    raise ValueError
+            except ValueError:
+                pass
+            return active_requests.get(asyncio.current_task())
+
+        assert asyncio.run(run()) is None
+        assert active_requests.tasks == {}
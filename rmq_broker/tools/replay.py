@@ -0,0 +1,262 @@
+"""Нагрузочное тестирование сервиса повтором записанных запросов.
+
+    python -m rmq_broker.tools.replay requests.jsonl --queue orders --rate 200
+    python -m rmq_broker.tools.replay capture.jsonl --queue orders \\
+        --start-rate 10 --rate 500 --ramp 60 --duration 300
+
+Файл содержит по одному запросу (UnprocessedBrokerMessage) в строке, либо строки
+записи трафика, в которых запрос находится в поле "request". Запросы отправляются
+в очередь `--queue` с постоянной частотой `--rate` запросов в секунду или с частотой,
+линейно растущей от `--start-rate` до `--rate` за `--ramp` секунд. Нагрузка открытая:
+следующий запрос отправляется по расписанию, не дожидаясь ответа на предыдущий,
+а задержка отсчитывается от запланированного времени отправки, поэтому медленные
+ответы не снижают нагрузку и не скрывают задержку.
+
+По завершении выводится отчет по типам запросов: число запросов, пропускная
+способность, доля ошибок (ответы с кодом >= 400, таймауты и ошибки отправки)
+и перцентили задержки.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import sys
+from collections import defaultdict
+from time import perf_counter
+from typing import Awaitable, Callable, Dict, Iterable, Iterator, List, Optional
+from uuid import uuid4
+
+from rmq_broker.schemas import ProcessedBrokerMessage, UnprocessedBrokerMessage
+from rmq_broker.services.base import BaseService
+
+PERCENTILES = (0.5, 0.9, 0.99)
+
+Call = Callable[[UnprocessedBrokerMessage], Awaitable[ProcessedBrokerMessage]]
+
+
+def read_messages(lines: Iterable[str]) -> List[UnprocessedBrokerMessage]:
+    """Запросы из строк JSONL. Пустые строки пропускаются."""
+    messages = []
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        messages.append(record.get("request", record))
+    return messages
+
+
+def schedule(
+    rate: float, start_rate: Optional[float] = None, ramp: float = 0
+) -> Iterator[float]:
+    """Время отправки запросов в секундах от начала теста.
+
+    При заданных start_rate и ramp частота линейно растет от start_rate до rate
+    за ramp секунд, затем остается постоянной.
+    """
+    if rate <= 0 or (start_rate is not None and start_rate <= 0):
+        raise AttributeError("Request rate must be positive.")
+    offset = 0.0
+    while True:
+        yield offset
+        if start_rate is not None and ramp > 0 and offset < ramp:
+            current = start_rate + (rate - start_rate) * offset / ramp
+        else:
+            current = rate
+        offset += 1 / current
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Перцентиль q (0..1) по отсортированному списку значений."""
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, math.ceil(q * len(values)) - 1))]
+
+
+class ReplayStats:
+    """Результаты теста по типам запросов."""
+
+    def __init__(self) -> None:
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.started = perf_counter()
+        self.finished: Optional[float] = None
+
+    def record(self, request_type: str, latency: float, failed: bool) -> None:
+        self.latencies[request_type].append(latency)
+        if failed:
+            self.errors[request_type] += 1
+
+    def finish(self) -> None:
+        self.finished = perf_counter()
+
+    @property
+    def duration(self) -> float:
+        return (self.finished or perf_counter()) - self.started
+
+    def report(self) -> Dict[str, dict]:
+        """{request_type: {"count", "throughput", "error_rate", "p50", "p90", "p99"}}."""
+        duration = self.duration or 1
+        result = {}
+        for request_type in sorted(self.latencies):
+            latencies = sorted(self.latencies[request_type])
+            count = len(latencies)
+            result[request_type] = {
+                "count": count,
+                "throughput": count / duration,
+                "error_rate": self.errors[request_type] / count,
+                **{f"p{round(q * 100)}": percentile(latencies, q) for q in PERCENTILES},
+            }
+        return result
+
+    def format_report(self) -> str:
+        lines = [
+            f"{'request_type':<32} {'count':>8} {'rps':>9} {'errors':>7} "
+            f"{'p50,ms':>9} {'p90,ms':>9} {'p99,ms':>9}"
+        ]
+        for request_type, row in self.report().items():
+            lines.append(
+                f"{request_type:<32} {row['count']:>8} {row['throughput']:>9.1f} "
+                f"{row['error_rate']:>7.2%} "
+                + " ".join(f"{row[p] * 1000:>9.1f}" for p in ("p50", "p90", "p99"))
+            )
+        lines.append(f"Duration: {self.duration:.1f}s")
+        return "\n".join(lines)
+
+
+def is_failed(response) -> bool:
+    try:
+        return response["status"]["code"] >= 400
+    except (TypeError, KeyError):
+        return True
+
+
+async def replay(
+    call: Call,
+    messages: List[UnprocessedBrokerMessage],
+    offsets: Iterator[float],
+    duration: Optional[float] = None,
+    count: Optional[int] = None,
+    timeout: float = 30,
+    prepare: Callable[[dict], dict] = dict,
+) -> ReplayStats:
+    """Отправляет запросы по кругу по расписанию offsets, пока не истечет duration
+    секунд или не будет отправлено count запросов (по умолчанию - один проход
+    по файлу).
+    """
+    if not messages:
+        raise AttributeError("No requests to replay.")
+    if duration is None and count is None:
+        count = len(messages)
+    loop = asyncio.get_running_loop()
+    stats = ReplayStats()
+    start = loop.time()
+
+    async def send(message: dict, scheduled: float) -> None:
+        try:
+            response = await asyncio.wait_for(call(message), timeout)
+            failed = is_failed(response)
+        except Exception:
+            failed = True
+        stats.record(
+            str(message.get("request_type", "")).lower(),
+            loop.time() - scheduled,
+            failed,
+        )
+
+    tasks = []
+    requests = itertools.islice(itertools.cycle(messages), count)
+    for message, offset in zip(requests, offsets):
+        if duration is not None and offset >= duration:
+            break
+        scheduled = start + offset
+        delay = scheduled - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.ensure_future(send(prepare(message), scheduled)))
+    await asyncio.gather(*tasks)
+    stats.finish()
+    return stats
+
+
+class ReplayService(BaseService):
+    """Отправляет записанные запросы в очередь тестируемого сервиса через одно
+    соединение с брокером.
+    """
+
+    def __init__(self, dst_service_name: str, keep_ids: bool = False) -> None:
+        self.dst_service_name = dst_service_name
+        self.keep_ids = keep_ids
+        super().__init__()
+
+    def prepare(self, message: dict) -> dict:
+        """Копия запроса с новым request_id (если не указан keep_ids) и адресом
+        тестируемого сервиса.
+        """
+        message = {
+            **message,
+            "header": {
+                **message.get("header", {}),
+                "src": self.service_name,
+                "dst": self.dst_service_name,
+            },
+        }
+        if not self.keep_ids:
+            message["request_id"] = str(uuid4())
+        return message
+
+    async def run(self, messages: List[UnprocessedBrokerMessage], **kwargs):
+        async with self.connect() as rpc:
+
+            async def call(message: dict) -> ProcessedBrokerMessage:
+                return await rpc.call(self.dst_service_name, kwargs=dict(data=message))
+
+            return await replay(call, messages, prepare=self.prepare, **kwargs)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m rmq_broker.tools.replay",
+        description="Повторяет запросы из JSONL файла и выводит отчет о задержках.",
+    )
+    parser.add_argument("file", help="JSONL файл с запросами.")
+    parser.add_argument("--queue", required=True, help="Очередь сервиса.")
+    parser.add_argument(
+        "--rate", type=float, default=10, help="Запросов в секунду (итоговая)."
+    )
+    parser.add_argument("--start-rate", type=float, help="Начальная частота.")
+    parser.add_argument(
+        "--ramp", type=float, default=0, help="Время роста частоты, секунд."
+    )
+    parser.add_argument("--duration", type=float, help="Длительность теста, секунд.")
+    parser.add_argument("--count", type=int, help="Число запросов.")
+    parser.add_argument(
+        "--timeout", type=float, default=30, help="Таймаут ответа, секунд."
+    )
+    parser.add_argument(
+        "--keep-ids", action="store_true", help="Не менять request_id запросов."
+    )
+    parser.add_argument("--json", action="store_true", help="Отчет в формате JSON.")
+    args = parser.parse_args(argv)
+
+    with open(args.file, encoding="utf-8") as file:
+        messages = read_messages(file)
+    service = ReplayService(args.queue, keep_ids=args.keep_ids)
+    stats = asyncio.run(
+        service.run(
+            messages,
+            offsets=schedule(args.rate, args.start_rate, args.ramp),
+            duration=args.duration,
+            count=args.count,
+            timeout=args.timeout,
+        )
+    )
+    if args.json:
+        sys.stdout.write(json.dumps(stats.report(), indent=2) + "\n")
+    else:
+        sys.stdout.write(stats.format_report() + "\n")
+
+
+if __name__ == "__main__":
+    main()
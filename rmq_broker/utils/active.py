@@ -0,0 +1,91 @@
+"""Реестр запросов, выполняющихся в задачах asyncio.
+
+Позволяет из другого потока определить, какой запрос обрабатывает задача,
+занимающая цикл событий. Запросы регистрируются в `ChainManager.handle`,
+только пока реестр включен хотя бы одним потребителем (например, сторожем
+цикла событий).
+"""
+
+import asyncio
+import threading
+from typing import Dict, Optional, Tuple
+
+RequestInfo = Tuple[str, str]
+
+
+class NullTracking:
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+
+NULL_TRACKING = NullTracking()
+
+
+class Tracking:
+    __slots__ = ("registry", "info", "task")
+
+    def __init__(self, registry: "ActiveRequests", info: RequestInfo) -> None:
+        self.registry = registry
+        self.info = info
+        self.task = None
+
+    def __enter__(self) -> None:
+        try:
+            self.task = asyncio.current_task()
+        except RuntimeError:
+            return
+        if self.task is not None:
+            self.registry.tasks[self.task] = self.info
+
+    def __exit__(self, *exc_info) -> None:
+        if self.task is not None:
+            self.registry.tasks.pop(self.task, None)
+
+
+class ActiveRequests:
+    """Соответствие задач asyncio и обрабатываемых ими запросов."""
+
+    def __init__(self) -> None:
+        self.tasks: Dict[asyncio.Task, RequestInfo] = {}
+        self._users = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self._users > 0
+
+    def enable(self) -> None:
+        with self._lock:
+            self._users += 1
+
+    def disable(self) -> None:
+        with self._lock:
+            self._users = max(0, self._users - 1)
+
+    def track(self, request_type: str, request_id):
+        """Контекстный менеджер, связывающий текущую задачу с запросом."""
+        if not self._users:
+            return NULL_TRACKING
+        return Tracking(self, (request_type, str(request_id)))
+
+    def get(self, task: Optional[asyncio.Task]) -> Optional[RequestInfo]:
+        if task is None:
+            return None
+        return self.tasks.get(task)
+
+    def current(
+        self, loop: asyncio.AbstractEventLoop
+    ) -> Tuple[Optional[asyncio.Task], Optional[RequestInfo]]:
+        """Задача, выполняющаяся в цикле событий loop, и ее запрос.
+        Можно вызывать из другого потока.
+        """
+        task = asyncio.current_task(loop)
+        return task, self.get(task)
+
+
+active_requests = ActiveRequests()
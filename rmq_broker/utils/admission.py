@@ -0,0 +1,180 @@
+"""Контроль допуска запросов в консьюмер по состоянию цикла событий.
+
+Задержка цикла событий измеряется фоновой задачей: она засыпает на `check_interval`
+секунд и сравнивает фактическое время пробуждения с ожидаемым. При превышении
+`max_loop_lag` или `max_in_flight` консьюмер считается перегруженным и, в зависимости
+от `action`:
+
+    "throttle" - ограничивает получение новых сообщений: для RabbitMQ prefetch
+                 канала снижается до 1 (новое сообщение доставляется только после
+                 подтверждения обработанных, затем по одному), консьюмер Unix
+                 сокетов перестает читать новые вызовы;
+    "reject"   - сразу отвечает ошибкой с кодом 503 на запросы обработчиков
+                 с `sheddable = True`.
+
+Нормальная работа возобновляется, когда задержка и число запросов в обработке
+опускаются ниже `resume_ratio` от пороговых значений.
+
+Настраивается в `settings.CONSUMERS[<брокер>]["admission"]`:
+
+    "admission": {"max_loop_lag": 0.5, "max_in_flight": 100, "action": "throttle"}
+"""
+
+import asyncio
+import functools
+from http import HTTPStatus
+from typing import Awaitable, Callable, Optional
+
+from aiormq.tools import awaitable
+
+from rmq_broker.async_chains.base import ChainManager
+from rmq_broker.models import ErrorMessage
+from rmq_broker.utils.logger import get_logger
+from rmq_broker.utils.metrics import metrics
+
+logger = get_logger(__name__)
+
+THROTTLE = "throttle"
+REJECT = "reject"
+LAG_DECAY = 0.8
+
+LOOP_LAG = "event_loop_lag_seconds"
+OVERLOADED = "consumer_overloaded"
+SHED = "shed_requests_total"
+
+metrics.describe(LOOP_LAG, "gauge", "Задержка цикла событий консьюмера.")
+metrics.describe(OVERLOADED, "gauge", "1, если консьюмер перегружен.")
+metrics.describe(SHED, "counter", "Число запросов, отклоненных из-за перегрузки.")
+
+
+def get_request_type_label(data) -> str:
+    """request_type для метрик: только типы зарегистрированных обработчиков,
+    чтобы отправители не могли создавать произвольное число рядов.
+    """
+    request_type = str(data.get("request_type", "")).lower()
+    return request_type if request_type in ChainManager.chains else "unknown"
+
+
+class AdmissionController:
+    """Следит за задержкой цикла событий и числом запросов в обработке."""
+
+    def __init__(
+        self,
+        max_loop_lag: Optional[float] = None,
+        max_in_flight: Optional[int] = None,
+        action: str = THROTTLE,
+        check_interval: float = 0.1,
+        resume_ratio: float = 0.5,
+        is_sheddable: Callable[[dict], bool] = lambda data: False,
+        throttle: Optional[Callable[[], Awaitable]] = None,
+        unthrottle: Optional[Callable[[], Awaitable]] = None,
+    ) -> None:
+        if action not in (THROTTLE, REJECT):
+            raise AttributeError(f"Unknown overload action: {action}")
+        self.max_loop_lag = max_loop_lag
+        self.max_in_flight = max_in_flight
+        self.action = action
+        self.check_interval = check_interval
+        self.resume_ratio = resume_ratio
+        self.is_sheddable = is_sheddable
+        self.throttle = throttle
+        self.unthrottle = unthrottle
+        self.lag = 0.0
+        self.in_flight = 0
+        self.overloaded = False
+        self._task: Optional[asyncio.Task] = None
+
+    def exceeds(self, ratio: float = 1.0) -> bool:
+        """Проверяет превышение порогов, умноженных на ratio."""
+        if self.max_loop_lag is not None and self.lag > self.max_loop_lag * ratio:
+            return True
+        return (
+            self.max_in_flight is not None
+            and self.in_flight >= self.max_in_flight * ratio
+        )
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.ensure_future(self.monitor())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def monitor(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.check_interval)
+            sample = max(0.0, loop.time() - started - self.check_interval)
+            # Одиночный всплеск задержки затухает постепенно, чтобы консьюмер
+            # не переключался между состояниями на каждой проверке.
+            self.lag = max(sample, self.lag * LAG_DECAY)
+            metrics.set_gauge(LOOP_LAG, self.lag)
+            await self.update_state()
+
+    async def update_state(self) -> None:
+        if not self.overloaded and self.exceeds():
+            self.overloaded = True
+            logger.warning(
+                "%s.%s: Consumer overloaded: lag=%.3fs in_flight=%s",
+                self.__class__.__name__,
+                self.update_state.__name__,
+                self.lag,
+                self.in_flight,
+            )
+            if self.action == THROTTLE and self.throttle is not None:
+                await self.throttle()
+        elif self.overloaded and not self.exceeds(self.resume_ratio):
+            self.overloaded = False
+            logger.info(
+                "%s.%s: Consumer recovered: lag=%.3fs in_flight=%s",
+                self.__class__.__name__,
+                self.update_state.__name__,
+                self.lag,
+                self.in_flight,
+            )
+            if self.action == THROTTLE and self.unthrottle is not None:
+                await self.unthrottle()
+        metrics.set_gauge(OVERLOADED, int(self.overloaded))
+
+    def should_reject(self, data: dict) -> bool:
+        return (
+            self.action == REJECT
+            and (self.overloaded or self.exceeds())
+            and self.is_sheddable(data)
+        )
+
+    def wrap(self, worker: Callable) -> Callable:
+        """Оборачивает обработчик сообщений консьюмера с учетом запросов в обработке
+        и отклонением запросов при перегрузке.
+        """
+        worker = awaitable(worker)
+
+        @functools.wraps(worker)
+        async def admit(data: dict):
+            if self.should_reject(data):
+                metrics.inc(SHED, request_type=get_request_type_label(data))
+                logger.warning(
+                    "%s.%s: Request rejected due to overload: request_id=%s",
+                    self.__class__.__name__,
+                    self.wrap.__name__,
+                    data.get("request_id"),
+                )
+                return ErrorMessage().generate_reply(
+                    data,
+                    code=HTTPStatus.SERVICE_UNAVAILABLE.value,
+                    message="Service overloaded",
+                )
+            self.in_flight += 1
+            try:
+                return await worker(data=data)
+            finally:
+                self.in_flight -= 1
+
+        return admit
@@ -0,0 +1,131 @@
+"""Отправка нескольких запросов одним сообщением.
+
+`BaseService.send_batch` передает список запросов одному сервису в одном сообщении
+брокера (аргумент `batch` вместо `data`). Консьюмер обрабатывает запросы пакета
+параллельно и возвращает список ответов в том же порядке. Ответ на запрос, при
+обработке которого возникло исключение, содержит ошибку с кодом 500.
+
+`RequestBatcher` собирает в пакеты отдельные вызовы: запросы, отправленные в течение
+`linger` секунд (но не больше `max_size`), уходят одним сообщением, а каждый
+вызывающий получает свой ответ.
+
+    batcher = RequestBatcher(CatalogService(), max_size=100, linger=0.005)
+    response = await batcher.send_message("get_item", {"id": 1})
+
+Сервис-получатель должен использовать версию пакета, поддерживающую пакеты.
+"""
+
+import asyncio
+import functools
+import inspect
+from http import HTTPStatus
+from typing import Any, Callable, List, Optional, Set, Tuple
+
+from rmq_broker.models import ErrorMessage
+from rmq_broker.schemas import ProcessedBrokerMessage, UnprocessedBrokerMessage
+from rmq_broker.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+BATCH = "batch"
+
+
+def wrap_batch(worker: Callable) -> Callable:
+    """Оборачивает обработчик сообщений консьюмера обработкой пакетов запросов."""
+    from aiormq.tools import awaitable
+
+    from rmq_broker.queues.rpc import collect_pages
+
+    worker = awaitable(worker)
+
+    async def handle_item(data: UnprocessedBrokerMessage) -> ProcessedBrokerMessage:
+        try:
+            response = await worker(data=data)
+            if inspect.isasyncgen(response):
+                response = await collect_pages(response)
+            return response
+        except Exception as error:
+            logger.error(
+                "%s: Batch item failed: request_id=%s: %s",
+                wrap_batch.__name__,
+                data.get("request_id"),
+                error,
+            )
+            return ErrorMessage().generate_reply(
+                data,
+                code=HTTPStatus.INTERNAL_SERVER_ERROR.value,
+                message=str(error),
+            )
+
+    @functools.wraps(worker)
+    async def dispatch(
+        data: Optional[UnprocessedBrokerMessage] = None,
+        batch: Optional[List[UnprocessedBrokerMessage]] = None,
+    ):
+        if batch is None:
+            return await worker(data=data)
+        return await asyncio.gather(*(handle_item(item) for item in batch))
+
+    return dispatch
+
+
+class RequestBatcher:
+    """Объединяет запросы к сервису, отправленные за короткое время, в пакеты."""
+
+    def __init__(self, service, max_size: int = 100, linger: float = 0.005) -> None:
+        self.service = service
+        self.max_size = max_size
+        self.linger = linger
+        self.pending: List[Tuple[str, Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def send_message(
+        self, request_type: str, body: Any
+    ) -> ProcessedBrokerMessage:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((request_type, body, future))
+        if len(self.pending) >= self.max_size:
+            self.flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.linger, self.flush)
+        return await future
+
+    def flush(self) -> None:
+        """Отправляет накопленные запросы, не дожидаясь истечения linger."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        items, self.pending = self.pending, []
+        if items:
+            task = asyncio.ensure_future(self.send(items))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def send(self, items: List[Tuple[str, Any, asyncio.Future]]) -> None:
+        try:
+            responses = await self.service.send_batch(
+                [(request_type, body) for request_type, body, _ in items]
+            )
+        except Exception as error:
+            self.fail(items, error)
+            return
+        if len(responses) != len(items):
+            self.fail(
+                items,
+                RuntimeError(
+                    f"Batch of {len(items)} requests got {len(responses)} responses"
+                ),
+            )
+            return
+        for (_, _, future), response in zip(items, responses):
+            if not future.done():
+                future.set_result(response)
+
+    def fail(
+        self, items: List[Tuple[str, Any, asyncio.Future]], error: Exception
+    ) -> None:
+        for _, _, future in items:
+            if not future.done():
+                future.set_exception(error)
@@ -0,0 +1,180 @@
+"""Кэширование ответов обработчиков на стороне сервиса.
+
+Обработчик с атрибутом `cache_ttl` (секунды) получает ответ из кэша, если запрос
+того же `request_type` с тем же телом уже обрабатывался в течение `cache_ttl`.
+Ключ кэша - хэш канонического JSON представления тела запроса или значения,
+которое вернула функция `cache_key(data)` обработчика.
+
+По умолчанию используется ограниченный LRU кэш в памяти процесса
+(размер задается настройкой `BROKER_CACHE_MAX_SIZE`). Общее для нескольких
+процессов хранилище подключается реализацией `AbstractCacheBackend`:
+
+    response_cache.backend = RedisCacheBackend(...)
+"""
+
+import copy
+import hashlib
+import json
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from rmq_broker.settings import settings
+from rmq_broker.utils.metrics import metrics
+
+CACHE_HITS = "cache_hits_total"
+CACHE_MISSES = "cache_misses_total"
+
+metrics.describe(CACHE_HITS, "counter", "Число ответов, полученных из кэша.")
+metrics.describe(CACHE_MISSES, "counter", "Число промахов кэша ответов.")
+
+
+class AbstractCacheBackend(ABC):
+    """Интерфейс хранилища кэша."""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Any]:
+        ...  # pragma: no cover
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        ...  # pragma: no cover
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        ...  # pragma: no cover
+
+    @abstractmethod
+    def delete_prefix(self, prefix: str) -> None:
+        ...  # pragma: no cover
+
+
+class LRUCacheBackend(AbstractCacheBackend):
+    """Кэш в памяти процесса с вытеснением давно не использованных записей."""
+
+    def __init__(self, max_size: int = 1024) -> None:
+        self.max_size = max_size
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_prefix(self, prefix: str) -> None:
+        with self._lock:
+            for key in [key for key in self._data if key.startswith(prefix)]:
+                del self._data[key]
+
+
+def canonical_hash(value: Any) -> str:
+    """Хэш канонического JSON представления значения."""
+    serialized = json.dumps(
+        value, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(serialized.encode()).hexdigest()
+
+
+class ResponseCache:
+    """Кэш ответов обработчиков со статистикой попаданий по типам запросов."""
+
+    def __init__(self, backend: Optional[AbstractCacheBackend] = None) -> None:
+        self._backend = backend
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+
+    @property
+    def backend(self) -> AbstractCacheBackend:
+        if self._backend is None:
+            self._backend = LRUCacheBackend(
+                getattr(settings, "BROKER_CACHE_MAX_SIZE", 1024)
+            )
+        return self._backend
+
+    @backend.setter
+    def backend(self, backend: AbstractCacheBackend) -> None:
+        self._backend = backend
+
+    def make_key(self, chain, data: dict) -> str:
+        key_function = getattr(chain, "cache_key", None)
+        value = key_function(data) if key_function else data.get("body")
+        return f"{chain.request_type.lower()}:{canonical_hash(value)}"
+
+    def get(self, chain, key: str) -> Optional[dict]:
+        """Копия закэшированных тела и статуса ответа по ключу запроса: изменение
+        ответа не меняет запись кэша.
+        """
+        request_type = chain.request_type.lower()
+        cached = self.backend.get(key)
+        if cached is None:
+            self.misses[request_type] = self.misses.get(request_type, 0) + 1
+            metrics.inc(CACHE_MISSES, request_type=request_type)
+            return None
+        self.hits[request_type] = self.hits.get(request_type, 0) + 1
+        metrics.inc(CACHE_HITS, request_type=request_type)
+        return {
+            "body": copy.deepcopy(cached["body"]),
+            "status": dict(cached["status"]),
+        }
+
+    def set(self, chain, key: str, response: dict) -> None:
+        """Сохраняет успешный ответ по ключу запроса на `chain.cache_ttl` секунд.
+        Ключ нужно вычислить до обработки запроса: обработчик меняет тело сообщения.
+        """
+        if response["status"]["code"] >= 400:
+            return
+        self.backend.set(
+            key,
+            {
+                "body": copy.deepcopy(response["body"]),
+                "status": dict(response["status"]),
+            },
+            chain.cache_ttl,
+        )
+
+    def invalidate(self, chain, data: Optional[dict] = None) -> None:
+        """Удаляет ответ на запрос data или все ответы обработчика."""
+        if data is None:
+            self.backend.delete_prefix(f"{chain.request_type.lower()}:")
+        else:
+            self.backend.delete(self.make_key(chain, data))
+
+    def stats(self) -> Dict[str, dict]:
+        """Число попаданий, промахов и доля попаданий по типам запросов."""
+        result = {}
+        for request_type in set(self.hits) | set(self.misses):
+            hits = self.hits.get(request_type, 0)
+            misses = self.misses.get(request_type, 0)
+            result[request_type] = {
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": hits / (hits + misses),
+            }
+        return result
+
+
+response_cache = ResponseCache()
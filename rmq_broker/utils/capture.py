@@ -0,0 +1,246 @@
+"""Запись выборки входящих запросов в файл для воспроизведения нагрузки.
+
+`ChainManager.handle` передает в `traffic_capture` часть входящих запросов
+(`sample_rate`), при включенном `responses` - вместе с ответами и временем обработки.
+Записи сериализуются и пишутся в файл фоновым потоком, цикл событий только копирует
+запрос. Если очередь записи заполнена, запись отбрасывается.
+
+Файл в формате JSON Lines, по одной записи в строке:
+
+    {"ts": 1700000000.0, "request_type": "...", "duration": 0.012,
+     "request": {...}, "response": {...}}
+
+При превышении `max_bytes` файл переименовывается в `<path>.1` (предыдущие копии
+сдвигаются до `<path>.<backup_count>`, самая старая удаляется), поэтому на диске
+хранится не больше `max_bytes * (backup_count + 1)` байт. Записи можно передать
+в `python -m rmq_broker.tools.replay`.
+
+Поля, перечисленные в `redact`, заменяются на "***". Путь к полю задается через точку,
+`*` соответствует любому ключу или элементу списка: "body.password",
+"body.users.*.phone", "header.token".
+
+Включается настройкой:
+
+    BROKER_CAPTURE = {
+        "path": "capture.jsonl",
+        "sample_rate": 0.01,
+        "responses": True,
+        "max_bytes": 50 * 1024 * 1024,
+        "backup_count": 3,
+        "redact": ["body.password"],
+    }
+"""
+
+import copy
+import json
+import os
+import queue
+import random
+import threading
+import time
+from collections.abc import Mapping
+from typing import Iterable, List, Optional
+
+from rmq_broker.envelope import Envelope
+from rmq_broker.settings import settings
+from rmq_broker.utils.logger import get_logger
+from rmq_broker.utils.metrics import metrics
+
+logger = get_logger(__name__)
+
+REDACTED = "***"
+WILDCARD = "*"
+
+CAPTURED = "captured_requests_total"
+CAPTURE_DROPPED = "capture_dropped_total"
+
+metrics.describe(CAPTURED, "counter", "Число записанных в файл запросов.")
+metrics.describe(
+    CAPTURE_DROPPED, "counter", "Число записей, отброшенных из-за заполненной очереди."
+)
+
+
+def redact(message, paths: Iterable[List[str]]):
+    """Заменяет значения полей по путям paths на REDACTED (изменяет message)."""
+    for path in paths:
+        redact_path(message, path)
+    return message
+
+
+def redact_path(value, path: List[str]) -> None:
+    key, rest = path[0], path[1:]
+    if isinstance(value, dict):
+        keys = list(value) if key == WILDCARD else [key] if key in value else []
+    elif isinstance(value, list):
+        keys = range(len(value)) if key == WILDCARD else []
+    else:
+        return
+    for item in keys:
+        if rest:
+            redact_path(value[item], rest)
+        else:
+            value[item] = REDACTED
+
+
+def snapshot(message):
+    """Копия сообщения в виде словаря."""
+    if isinstance(message, Envelope):
+        return copy.deepcopy(message.to_dict())
+    if isinstance(message, Mapping):
+        return copy.deepcopy(dict(message))
+    return None
+
+
+class RotatingWriter:
+    """Дописывает строки в файл, переименовывая его при превышении max_bytes."""
+
+    def __init__(self, path: str, max_bytes: int, backup_count: int) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.file = None
+
+    def write(self, line: bytes) -> None:
+        if self.file is None:
+            self.file = open(self.path, "ab")
+        if self.file.tell() and self.file.tell() + len(line) > self.max_bytes:
+            self.rotate()
+        self.file.write(line)
+
+    def rotate(self) -> None:
+        self.file.close()
+        if self.backup_count:
+            for index in range(self.backup_count - 1, 0, -1):
+                source = f"{self.path}.{index}"
+                if os.path.exists(source):
+                    os.replace(source, f"{self.path}.{index + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        self.file = open(self.path, "wb")
+
+    def flush(self) -> None:
+        if self.file is not None:
+            self.file.flush()
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class TrafficCapture:
+    """Отбирает запросы для записи и передает их фоновому потоку.
+
+    При config=None настройки читаются из BROKER_CAPTURE при первой проверке.
+    """
+
+    def __init__(self, config: Optional[dict] = None) -> None:
+        self._enabled: Optional[bool] = None
+        self._queue: Optional[queue.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        if config is not None:
+            self.configure(config)
+
+    @property
+    def enabled(self) -> bool:
+        if self._enabled is None:
+            self.configure(getattr(settings, "BROKER_CAPTURE", None))
+        return self._enabled
+
+    def configure(self, config: Optional[dict]) -> None:
+        """Применяет настройки записи. config=None выключает запись."""
+        self.close()
+        self._enabled = bool(config)
+        if not config:
+            return
+        self.path = config.get("path", "capture.jsonl")
+        self.sample_rate = config.get("sample_rate", 0.01)
+        self.responses = config.get("responses", False)
+        self.redact_paths = [path.split(".") for path in config.get("redact", ())]
+        self.writer = RotatingWriter(
+            self.path,
+            config.get("max_bytes", 50 * 1024 * 1024),
+            config.get("backup_count", 3),
+        )
+        self._queue = queue.Queue(config.get("queue_size", 10000))
+
+    def record(self, data) -> Optional[dict]:
+        """Начинает запись запроса, если он попал в выборку. Запрос копируется:
+        обработчик формирует ответ в том же словаре.
+        """
+        if not self.enabled or random.random() >= self.sample_rate:
+            return None
+        return {
+            "ts": time.time(),
+            "request_type": str(data.get("request_type", "")).lower(),
+            "request": snapshot(data),
+            "started": time.perf_counter(),
+        }
+
+    def finish(self, record: Optional[dict], response=None) -> None:
+        """Передает запись фоновому потоку вместе с ответом и временем обработки."""
+        if record is None:
+            return
+        started = record.pop("started")
+        if self.responses:
+            record["duration"] = time.perf_counter() - started
+            record["response"] = snapshot(response)
+        self.start()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            metrics.inc(CAPTURE_DROPPED)
+
+    def start(self) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self.run, name="rmq-broker-capture", daemon=True
+                    )
+                    self._thread.start()
+
+    def run(self) -> None:
+        records = self._queue
+        while True:
+            record = records.get()
+            try:
+                if record is None:
+                    self.writer.close()
+                    return
+                self.write(record)
+                if records.empty():
+                    self.writer.flush()
+            except Exception as error:
+                logger.error(
+                    "%s.%s: Capture write failed: %s",
+                    self.__class__.__name__,
+                    self.run.__name__,
+                    error,
+                )
+            finally:
+                records.task_done()
+
+    def write(self, record: dict) -> None:
+        for field in ("request", "response"):
+            if isinstance(record.get(field), dict):
+                redact(record[field], self.redact_paths)
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        self.writer.write(line.encode())
+        metrics.inc(CAPTURED, request_type=record["request_type"])
+
+    def flush(self) -> None:
+        """Ожидает записи всех переданных записей."""
+        if self._thread is not None:
+            self._queue.join()
+            self.writer.flush()
+
+    def close(self) -> None:
+        """Записывает оставшиеся записи и останавливает фоновый поток."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+
+traffic_capture = TrafficCapture()
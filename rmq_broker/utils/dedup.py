@@ -0,0 +1,110 @@
+"""Дедупликация повторно доставленных запросов по `request_id`.
+
+После переподключения брокер повторно доставляет неподтвержденные сообщения.
+Консьюмер запоминает успешные ответы на `window` секунд и отвечает на повторный
+запрос с тем же `request_id` сохраненным ответом, не запуская обработчик снова.
+Если первый запрос еще обрабатывается, повторный дожидается его ответа.
+
+По умолчанию ответы хранятся в ограниченном кэше в памяти процесса, общее для
+нескольких консьюмеров хранилище передается параметром `backend`
+(реализация `AbstractCacheBackend`).
+
+Настраивается в `settings.CONSUMERS[<брокер>]["deduplication"]`:
+
+    "deduplication": {"window": 300, "max_size": 10000}
+"""
+
+import asyncio
+import functools
+from collections.abc import Mapping
+from typing import Callable, Dict, Optional
+
+from aiormq.tools import awaitable
+
+from rmq_broker.utils.cache import AbstractCacheBackend, LRUCacheBackend
+from rmq_broker.utils.logger import get_logger
+from rmq_broker.utils.metrics import metrics
+
+logger = get_logger(__name__)
+
+DUPLICATES = "duplicate_requests_total"
+
+metrics.describe(DUPLICATES, "counter", "Число повторно доставленных запросов.")
+
+
+class RequestDeduplicator:
+    """Хранит ответы на обработанные запросы в пределах временного окна."""
+
+    def __init__(
+        self,
+        window: float = 300,
+        max_size: int = 10000,
+        backend: Optional[AbstractCacheBackend] = None,
+    ) -> None:
+        self.window = window
+        self.backend = backend or LRUCacheBackend(max_size)
+        self.pending: Dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def make_key(request_id) -> str:
+        return f"request:{request_id}"
+
+    def wrap(self, worker: Callable) -> Callable:
+        """Оборачивает обработчик сообщений консьюмера дедупликацией запросов."""
+        worker = awaitable(worker)
+
+        @functools.wraps(worker)
+        async def deduplicate(data: dict):
+            request_id = data.get("request_id") if isinstance(data, Mapping) else None
+            if not request_id:
+                return await worker(data=data)
+            key = self.make_key(request_id)
+            response = self.backend.get(key)
+            pending = self.pending.get(key)
+            if response is None and pending is not None:
+                await asyncio.wait([pending])
+                if not pending.cancelled() and pending.exception() is None:
+                    # Потоковый ответ можно прочитать только один раз.
+                    if isinstance(pending.result(), Mapping):
+                        response = pending.result()
+            if response is not None:
+                metrics.inc(DUPLICATES, request_type=str(data.get("request_type", "")))
+                logger.info(
+                    "%s.%s: Duplicate request answered from store: request_id=%s",
+                    self.__class__.__name__,
+                    self.wrap.__name__,
+                    request_id,
+                )
+                return response
+            return await self.process(worker, key, data)
+
+        return deduplicate
+
+    async def process(self, worker: Callable, key: str, data: dict):
+        future = asyncio.get_running_loop().create_future()
+        self.pending[key] = future
+        try:
+            response = await worker(data=data)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            # Ошибку получает вызывающий код, ожидающих повторов может не быть.
+            future.exception()
+            raise
+        else:
+            if self.is_storable(response):
+                self.backend.set(key, response, self.window)
+            future.set_result(response)
+            return response
+        finally:
+            if self.pending.get(key) is future:
+                del self.pending[key]
+
+    @staticmethod
+    def is_storable(response) -> bool:
+        try:
+            return response["status"]["code"] < 400
+        except (TypeError, KeyError):
+            return False
@@ -0,0 +1,136 @@
+"""Повторная отправка медленных запросов (hedging).
+
+Если ответ на запрос не получен за время, превышающее перцентиль `percentile`
+задержки последних `window` запросов того же типа, `BaseService` отправляет копию
+запроса: ее может обработать другой консьюмер очереди. Используется первый
+полученный успешный ответ, второй запрос отменяется.
+
+Число копий ограничено бюджетом: каждый запрос добавляет `budget` копии
+(не больше `burst` в запасе), каждая копия расходует одну. При budget=0.1 копии
+добавляют не больше 10% запросов к нагрузке на сервис.
+"""
+
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from rmq_broker.schemas import ProcessedBrokerMessage
+from rmq_broker.utils.metrics import metrics
+
+HEDGED = "hedged_requests_total"
+HEDGE_WINS = "hedge_wins_total"
+
+metrics.describe(HEDGED, "counter", "Число отправленных копий медленных запросов.")
+metrics.describe(HEDGE_WINS, "counter", "Число копий, ответивших раньше запроса.")
+
+
+class HedgePolicy:
+    """Задержка отправки копии по недавним задержкам и бюджет копий."""
+
+    def __init__(
+        self,
+        percentile: float = 0.95,
+        budget: float = 0.1,
+        burst: float = 10,
+        window: int = 200,
+        min_samples: int = 20,
+        min_delay: float = 0.001,
+    ) -> None:
+        self.percentile = percentile
+        self.budget = budget
+        self.burst = burst
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.latencies: deque = deque(maxlen=window)
+        self.tokens = 0.0
+        self._delay: Optional[float] = None
+
+    def observe(self, latency: float) -> None:
+        self.latencies.append(latency)
+        self._delay = None
+
+    def delay(self) -> Optional[float]:
+        """Время ожидания ответа до отправки копии или None, пока задержек мало."""
+        if len(self.latencies) < self.min_samples:
+            return None
+        if self._delay is None:
+            latencies = sorted(self.latencies)
+            count = len(latencies)
+            index = min(count - 1, max(0, math.ceil(self.percentile * count) - 1))
+            self._delay = max(self.min_delay, latencies[index])
+        return self._delay
+
+    def deposit(self) -> None:
+        self.tokens = min(self.burst, self.tokens + self.budget)
+
+    def withdraw(self) -> bool:
+        """Расходует копию из бюджета, если она есть."""
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+_policies: Dict[Tuple[str, str, tuple], HedgePolicy] = {}
+
+
+def get_hedge_policy(dst: str, request_type: str, **options) -> HedgePolicy:
+    """Общая для процесса политика запросов request_type к сервису dst. Сервисы
+    с разными параметрами hedge_options используют разные политики.
+    """
+    key = (dst, request_type.lower(), tuple(sorted(options.items())))
+    if key not in _policies:
+        _policies[key] = HedgePolicy(**options)
+    return _policies[key]
+
+
+def is_failed(response) -> bool:
+    try:
+        return response["status"]["code"] >= 500
+    except (TypeError, KeyError):
+        return True
+
+
+async def hedged_call(
+    send: Callable[[], Awaitable[ProcessedBrokerMessage]],
+    policy: HedgePolicy,
+    **labels: str,
+) -> ProcessedBrokerMessage:
+    """Вызывает send и, если ответ задерживается, повторяет вызов. Возвращает первый
+    успешный ответ (или последний ответ, если оба с ошибкой), второй вызов отменяется.
+    """
+    policy.deposit()
+    started = time.monotonic()
+    tasks = [asyncio.ensure_future(send())]
+    try:
+        delay = policy.delay()
+        if delay is not None:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and policy.withdraw():
+                metrics.inc(HEDGED, **labels)
+                tasks.append(asyncio.ensure_future(send()))
+        response, winner = await first_success(tasks)
+        if winner:
+            metrics.inc(HEDGE_WINS, **labels)
+    finally:
+        for task in tasks:
+            task.cancel()
+    policy.observe(time.monotonic() - started)
+    return response
+
+
+async def first_success(tasks: list) -> Tuple[ProcessedBrokerMessage, int]:
+    """Ожидает задачи до первого успешного ответа. Возвращает ответ и номер
+    задачи, которая его получила.
+    """
+    pending = set(tasks)
+    response, index = None, 0
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in sorted(done, key=tasks.index):
+            response, index = task.result(), tasks.index(task)
+            if not is_failed(response):
+                return response, index
+    return response, index
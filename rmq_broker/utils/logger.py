@@ -0,0 +1,29 @@
+"""Логгеры пакета, создаваемые при первой записи в лог.
+
+Класс логгеров (`wp_utils.logging`, обрезает длинные аргументы) устанавливается
+при первой записи в лог, а не при импорте пакета: импорт `wp_utils.logging`
+загружает настройки сервиса и pysolr.
+"""
+
+import logging
+from typing import Any
+
+
+class LazyLogger:
+    """Заместитель логгера `logging.getLogger(name)`."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def __getattr__(self, attr: str) -> Any:
+        import wp_utils.logging  # noqa: F401
+
+        value = getattr(logging.getLogger(self.name), attr)
+        if callable(value):
+            # Следующие вызовы метода не проходят через __getattr__.
+            setattr(self, attr, value)
+        return value
+
+
+def get_logger(name: str) -> LazyLogger:
+    return LazyLogger(name)
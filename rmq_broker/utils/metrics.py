@@ -0,0 +1,323 @@
+"""Метрики обработки запросов.
+
+Собирает гистограммы длительности этапов обработки по типам запросов,
+счетчики запросов и ошибок, а также число запросов в обработке.
+Сбор выключен по умолчанию и включается настройкой `BROKER_METRICS_ENABLED = True`
+или вызовом `metrics.enable()`. В выключенном состоянии замеры не выполняются:
+обработчики получают пустой таймер, методы которого ничего не делают.
+
+Текущие значения доступны через `metrics.snapshot()`,
+текстовое представление для Prometheus - через `metrics.to_prometheus()`.
+"""
+
+import threading
+from bisect import bisect_left
+from time import perf_counter
+from typing import Dict, Iterable, Optional, Tuple
+
+from rmq_broker.settings import settings
+
+PREFIX = "rmq_broker_"
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+STAGE_DURATION = "stage_duration_seconds"
+REQUEST_DURATION = "request_duration_seconds"
+REQUESTS = "requests_total"
+ERRORS = "errors_total"
+IN_FLIGHT = "in_flight_requests"
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами корзин (в секундах)."""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS) -> None:
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> Dict[str, int]:
+        """Накопленное число наблюдений, не превышающих границу корзины."""
+        result, total = {}, 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result[format_value(bound)] = total
+        result["+Inf"] = self.count
+        return result
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Оценка перцентиля q (0..1) по верхней границе корзины."""
+        if not self.count:
+            return None
+        rank, total = q * self.count, 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= rank:
+                return bound
+        return float("inf")
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50": self.percentile(0.5),
+            "p90": self.percentile(0.9),
+            "p99": self.percentile(0.99),
+            "buckets": self.cumulative(),
+        }
+
+
+class NullTimer:
+    """Таймер, используемый при выключенном сборе метрик."""
+
+    __slots__ = ()
+
+    def lap(self, stage: str) -> None:
+        pass
+
+    def finish(self, response: Optional[dict] = None) -> None:
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+class StageTimer:
+    """Замеряет длительность последовательных этапов обработки одного запроса."""
+
+    __slots__ = ("registry", "request_type", "last")
+
+    def __init__(self, registry: "MetricsRegistry", request_type: str) -> None:
+        self.registry = registry
+        self.request_type = request_type
+        self.last = perf_counter()
+
+    def lap(self, stage: str) -> None:
+        """Записывает длительность этапа, завершившегося в момент вызова."""
+        now = perf_counter()
+        self.registry.observe(
+            STAGE_DURATION,
+            now - self.last,
+            request_type=self.request_type,
+            stage=stage,
+        )
+        self.last = now
+
+    def finish(self, response: Optional[dict] = None) -> None:
+        pass
+
+
+class RequestTimer(StageTimer):
+    """Замеряет полное время обработки запроса и учитывает его в числе
+    запросов в обработке и ошибок.
+    """
+
+    __slots__ = ("started",)
+
+    def __init__(self, registry: "MetricsRegistry", request_type: str) -> None:
+        super().__init__(registry, request_type)
+        self.started = self.last
+        registry.add_gauge(IN_FLIGHT, 1, request_type=request_type)
+
+    def finish(self, response: Optional[dict] = None) -> None:
+        """Завершает замер. Ответ без статуса или с кодом >= 400 считается ошибкой."""
+        registry, request_type = self.registry, self.request_type
+        registry.add_gauge(IN_FLIGHT, -1, request_type=request_type)
+        registry.inc(REQUESTS, request_type=request_type)
+        registry.observe(
+            REQUEST_DURATION, perf_counter() - self.started, request_type=request_type
+        )
+        try:
+            failed = response["status"]["code"] >= 400
+        except (TypeError, KeyError):
+            failed = True
+        if failed:
+            registry.inc(ERRORS, request_type=request_type)
+
+
+class MetricsRegistry:
+    """Хранилище гистограмм, счетчиков и датчиков с метками.
+
+    При enabled=None сбор метрик включается настройкой BROKER_METRICS_ENABLED,
+    которая читается при первой проверке.
+    """
+
+    def __init__(
+        self,
+        enabled: Optional[bool] = False,
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        self._enabled = enabled
+        self.buckets = tuple(buckets)
+        self.descriptions: Dict[str, Tuple[str, str]] = {}
+        self._lock = threading.Lock()
+        self.reset()
+        self.describe(
+            STAGE_DURATION, "histogram", "Длительность этапа обработки запроса."
+        )
+        self.describe(REQUEST_DURATION, "histogram", "Полное время обработки запроса.")
+        self.describe(REQUESTS, "counter", "Число обработанных запросов.")
+        self.describe(ERRORS, "counter", "Число ответов с ошибкой.")
+        self.describe(IN_FLIGHT, "gauge", "Число запросов в обработке.")
+
+    @property
+    def enabled(self) -> bool:
+        if self._enabled is None:
+            self._enabled = bool(getattr(settings, "BROKER_METRICS_ENABLED", False))
+        return self._enabled
+
+    def enable(self) -> None:
+        self._enabled = True
+
+    def disable(self) -> None:
+        self._enabled = False
+
+    def reset(self) -> None:
+        """Сбрасывает все накопленные значения."""
+        with self._lock:
+            self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+            self.counters: Dict[Tuple[str, Labels], float] = {}
+            self.gauges: Dict[Tuple[str, Labels], float] = {}
+
+    def describe(self, name: str, metric_type: str, description: str) -> None:
+        """Регистрирует тип и описание метрики для экспорта в Prometheus."""
+        self.descriptions[name] = (metric_type, description)
+
+    def timer(self, request_type: str):
+        """Таймер этапов обработки запроса внутри обработчика."""
+        if not self.enabled:
+            return NULL_TIMER
+        return StageTimer(self, request_type.lower())
+
+    def request_timer(self, request_type: str):
+        """Таймер полного времени обработки запроса диспетчером."""
+        if not self.enabled:
+            return NULL_TIMER
+        return RequestTimer(self, request_type.lower())
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels: str) -> None:
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.gauges[key] = value
+
+    def add_gauge(self, name: str, value: float, **labels: str) -> None:
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.gauges[key] = self.gauges.get(key, 0) + value
+
+    def snapshot(self) -> dict:
+        """Текущее состояние метрик: {имя метрики: [{"labels": ..., значения}]}."""
+        result: dict = {}
+        with self._lock:
+            for (name, labels), histogram in self.histograms.items():
+                result.setdefault(name, []).append(
+                    {"labels": dict(labels), **histogram.to_dict()}
+                )
+            for (name, labels), value in self.counters.items():
+                result.setdefault(name, []).append(
+                    {"labels": dict(labels), "value": value}
+                )
+            for (name, labels), value in self.gauges.items():
+                result.setdefault(name, []).append(
+                    {"labels": dict(labels), "value": value}
+                )
+        return result
+
+    def to_prometheus(self) -> str:
+        """Метрики в текстовом формате экспозиции Prometheus."""
+        samples: Dict[str, list] = {}
+        with self._lock:
+            for (name, labels), histogram in self.histograms.items():
+                lines = samples.setdefault(name, [])
+                for bound, count in histogram.cumulative().items():
+                    lines.append(
+                        f"{PREFIX}{name}_bucket"
+                        f"{format_labels(labels + (('le', bound),))} {count}"
+                    )
+                lines.append(
+                    f"{PREFIX}{name}_sum{format_labels(labels)} "
+                    f"{format_value(histogram.sum)}"
+                )
+                lines.append(
+                    f"{PREFIX}{name}_count{format_labels(labels)} {histogram.count}"
+                )
+            for metrics in (self.counters, self.gauges):
+                for (name, labels), value in metrics.items():
+                    samples.setdefault(name, []).append(
+                        f"{PREFIX}{name}{format_labels(labels)} {format_value(value)}"
+                    )
+        output = []
+        for name in sorted(samples):
+            metric_type, description = self.descriptions.get(name, ("untyped", name))
+            output.append(f"# HELP {PREFIX}{name} {description}")
+            output.append(f"# TYPE {PREFIX}{name} {metric_type}")
+            output.extend(samples[name])
+        return "\n".join(output) + "\n" if output else ""
+
+
+def format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        '%s="%s"'
+        % (
+            key,
+            str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'),
+        )
+        for key, value in labels
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+metrics = MetricsRegistry(enabled=None)
@@ -0,0 +1,139 @@
+"""Подключение к кластеру RabbitMQ из нескольких узлов.
+
+`broker_url` в настройках может быть списком адресов узлов:
+
+    CONSUMERS = {
+        "rabbitmq": {
+            "broker_url": ["amqp://node1/", "amqp://node2/", "amqp://node3/"],
+            "queue_leaders": {"orders": "amqp://node2/"},
+            "node_cooldown": 30,
+            "connect_timeout": 5,
+        }
+    }
+
+Каждый процесс начинает перебор узлов со случайного, поэтому соединения
+распределяются по кластеру. Если для очереди указан узел-лидер (`queue_leaders`),
+к нему подключаются в первую очередь. Узел, к которому не удалось подключиться
+или соединение с которым разорвано, не используется `node_cooldown` секунд;
+соединение переподключается к следующему узлу.
+"""
+
+import asyncio
+import random
+import time
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from rmq_broker.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+BrokerUrl = Union[str, Sequence[str]]
+
+
+class BrokerNodes:
+    """Порядок подключения к узлам кластера с учетом недоступных узлов."""
+
+    def __init__(
+        self,
+        urls: BrokerUrl,
+        queue_leaders: Optional[Dict[str, str]] = None,
+        cooldown: float = 30,
+        connect_timeout: Optional[float] = 5,
+    ) -> None:
+        self.urls: List[str] = [urls] if isinstance(urls, str) else list(urls)
+        if not self.urls:
+            raise AttributeError("Broker url list is empty.")
+        self.queue_leaders = queue_leaders or {}
+        self.cooldown = cooldown
+        self.connect_timeout = connect_timeout
+        self.failed_until: Dict[str, float] = {}
+        self.offset = random.randrange(len(self.urls))
+
+    def candidates(self, queue: Optional[str] = None) -> List[str]:
+        """Адреса узлов в порядке подключения: лидер очереди, затем остальные узлы
+        по кругу; недоступные узлы в конце списка.
+        """
+        count = len(self.urls)
+        ordered = [self.urls[(self.offset + i) % count] for i in range(count)]
+        leader = self.queue_leaders.get(queue) if queue else None
+        if leader in ordered:
+            ordered.remove(leader)
+            ordered.insert(0, leader)
+        now = time.monotonic()
+        available = [url for url in ordered if self.failed_until.get(url, 0) <= now]
+        return available + [url for url in ordered if url not in available]
+
+    def next_url(self, current: str, queue: Optional[str] = None) -> str:
+        """Узел для переподключения после потери соединения с узлом current."""
+        candidates = [url for url in self.candidates(queue) if url != current]
+        return candidates[0] if candidates else current
+
+    def mark_failed(self, url: str) -> None:
+        self.failed_until[url] = time.monotonic() + self.cooldown
+        logger.warning(
+            "%s.%s: Broker node unavailable for %ss: %s",
+            self.__class__.__name__,
+            self.mark_failed.__name__,
+            self.cooldown,
+            censor(url),
+        )
+
+    def mark_available(self, url: str) -> None:
+        self.failed_until.pop(url, None)
+
+    async def connect(self, queue: Optional[str] = None, **kwargs):
+        """Подключается к первому доступному узлу. Соединение при разрыве
+        переподключается к другому узлу.
+        """
+        from aio_pika.robust_connection import CONNECTION_EXCEPTIONS
+
+        from rmq_broker.queues.connection import connect_failover
+
+        error: Optional[BaseException] = None
+        for url in self.candidates(queue):
+            try:
+                connection = await connect_failover(
+                    url, self, queue, timeout=self.connect_timeout, **kwargs
+                )
+            except (asyncio.TimeoutError, *CONNECTION_EXCEPTIONS) as exc:
+                error = exc
+                self.mark_failed(url)
+                continue
+            self.mark_available(url)
+            return connection
+        raise error
+
+
+def censor(url: str) -> str:
+    """Адрес узла без пароля для записи в лог."""
+    scheme, _, rest = url.rpartition("://")
+    credentials, at, host = rest.rpartition("@")
+    if not at:
+        return url
+    user = credentials.split(":", 1)[0]
+    return f"{scheme}://{user}:******@{host}" if scheme else f"{user}:******@{host}"
+
+
+_nodes: Dict[
+    Tuple[Tuple[str, ...], Tuple[Tuple[str, str], ...], float, Optional[float]],
+    BrokerNodes,
+] = {}
+
+
+def get_broker_nodes(urls: BrokerUrl, config: Optional[dict] = None) -> BrokerNodes:
+    """Общий для процесса список узлов, чтобы недоступные узлы учитывались всеми
+    соединениями.
+    """
+    config = config or {}
+    cooldown = config.get("node_cooldown", 30)
+    connect_timeout = config.get("connect_timeout", 5)
+    queue_leaders = config.get("queue_leaders") or {}
+    key = (
+        (urls,) if isinstance(urls, str) else tuple(urls),
+        tuple(sorted(queue_leaders.items())),
+        cooldown,
+        connect_timeout,
+    )
+    if key not in _nodes:
+        _nodes[key] = BrokerNodes(urls, queue_leaders, cooldown, connect_timeout)
+    return _nodes[key]
@@ -0,0 +1,132 @@
+"""Упорядоченная обработка запросов с одинаковым ключом.
+
+Обработчик с атрибутом `partition_key` (путь к полю сообщения через точку, например
+"body.account_id" или "header.src") обрабатывает запросы с одинаковым значением ключа
+строго по очереди, в порядке получения, а запросы с разными ключами - параллельно.
+Обработчики с одинаковым `partition_key` разделяют очереди: обновление и закрытие
+одного счета не выполняются одновременно.
+
+Порядок гарантируется в пределах одного консьюмера: при нескольких консьюмерах
+очереди сообщения с одним ключом должны направляться одному из них. Для обработчиков-
+генераторов упорядочивается только начало обработки.
+
+Число ожидающих запросов одного ключа ограничено `max_pending`, следующие запросы
+получают ответ с кодом 503. Настраивается в `settings.CONSUMERS[<брокер>]["ordering"]`:
+
+    "ordering": {"max_pending": 100}
+"""
+
+import asyncio
+import functools
+from collections.abc import Mapping
+from http import HTTPStatus
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+from aiormq.tools import awaitable
+
+from rmq_broker.async_chains.base import ChainManager
+from rmq_broker.models import ErrorMessage
+from rmq_broker.utils.logger import get_logger
+from rmq_broker.utils.metrics import metrics
+
+logger = get_logger(__name__)
+
+ORDERING_REJECTED = "ordering_rejected_total"
+
+metrics.describe(
+    ORDERING_REJECTED,
+    "counter",
+    "Число запросов, отклоненных из-за переполнения очереди ключа.",
+)
+
+_missing = object()
+
+
+class Partition:
+    __slots__ = ("lock", "pending")
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.pending = 0
+
+
+def get_ordering_config(config: dict) -> Optional[dict]:
+    """Параметры OrderedDispatcher из настроек консьюмера. Очереди по ключам
+    включаются, если они настроены или есть обработчики с partition_key.
+    """
+    ordering = config.get("ordering")
+    if ordering is None:
+        if not any(chain.partition_key for chain in ChainManager.chains.values()):
+            return None
+        ordering = {}
+    return ordering
+
+
+class OrderedDispatcher:
+    """Очереди запросов по значениям ключа обработчика."""
+
+    def __init__(self, max_pending: int = 100) -> None:
+        self.max_pending = max_pending
+        self.partitions: Dict[Tuple[str, Hashable], Partition] = {}
+        self.paths: Dict[str, Tuple[str, ...]] = {}
+
+    def get_key(self, data) -> Optional[Tuple[str, Hashable]]:
+        """Ключ запроса или None, если обработчик не упорядочивает запросы."""
+        if not isinstance(data, Mapping):
+            return None
+        chain = ChainManager.chains.get(str(data.get("request_type", "")).lower())
+        if chain is None or not chain.partition_key:
+            return None
+        path = chain.partition_key
+        parts = self.paths.get(path)
+        if parts is None:
+            parts = self.paths[path] = tuple(path.split("."))
+        value = data
+        for part in parts:
+            if not isinstance(value, Mapping):
+                return None
+            value = value.get(part, _missing)
+            if value is _missing:
+                return None
+        try:
+            hash(value)
+        except TypeError:
+            value = repr(value)
+        return path, value
+
+    def wrap(self, worker: Callable) -> Callable:
+        """Оборачивает обработчик сообщений консьюмера очередями по ключам."""
+        worker = awaitable(worker)
+
+        @functools.wraps(worker)
+        async def dispatch(data: dict):
+            key = self.get_key(data)
+            if key is None:
+                return await worker(data=data)
+            partition = self.partitions.get(key)
+            if partition is None:
+                partition = self.partitions[key] = Partition()
+            elif partition.pending >= self.max_pending:
+                metrics.inc(ORDERING_REJECTED, request_type=str(data["request_type"]))
+                logger.warning(
+                    "%s.%s: Partition queue is full: key=%s request_id=%s",
+                    self.__class__.__name__,
+                    self.wrap.__name__,
+                    key,
+                    data.get("request_id"),
+                )
+                return ErrorMessage().generate_reply(
+                    data,
+                    code=HTTPStatus.SERVICE_UNAVAILABLE.value,
+                    message="Too many pending requests for the partition key",
+                )
+            partition.pending += 1
+            try:
+                async with partition.lock:
+                    return await worker(data=data)
+            finally:
+                partition.pending -= 1
+                if not partition.pending:
+                    del self.partitions[key]
+
+        return dispatch
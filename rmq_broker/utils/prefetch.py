@@ -0,0 +1,165 @@
+"""Подстройка prefetch канала консьюмера по времени обработки запросов.
+
+Каждые `interval` секунд контроллер сравнивает сглаженное время обработки
+запроса (EWMA) с `target_latency` и загрузку консьюмера (наибольшее за интервал
+число запросов в обработке, деленное на текущий prefetch):
+
+    время обработки выше target_latency  - prefetch умножается на `decrease_factor`;
+    загрузка не ниже `high_utilization`  - prefetch увеличивается на `increase`;
+    загрузка ниже `low_utilization`      - prefetch уменьшается на `increase`.
+
+Значение prefetch остается в пределах [`min_prefetch`, `max_prefetch`].
+
+Настраивается в `settings.CONSUMERS[<брокер>]["adaptive_prefetch"]`:
+
+    "adaptive_prefetch": {"min_prefetch": 5, "max_prefetch": 200, "target_latency": 0.5}
+"""
+
+import asyncio
+import functools
+from time import perf_counter
+from typing import Awaitable, Callable, Optional
+
+from aiormq.tools import awaitable
+
+from rmq_broker.utils.logger import get_logger
+from rmq_broker.utils.metrics import metrics
+
+logger = get_logger(__name__)
+
+PREFETCH = "prefetch_count"
+LATENCY_EWMA = "handler_latency_ewma_seconds"
+UTILIZATION = "consumer_utilization"
+ADJUSTMENTS = "prefetch_adjustments_total"
+
+metrics.describe(PREFETCH, "gauge", "Текущий prefetch канала консьюмера.")
+metrics.describe(LATENCY_EWMA, "gauge", "Сглаженное время обработки запроса.")
+metrics.describe(UTILIZATION, "gauge", "Доля prefetch, занятая запросами в обработке.")
+metrics.describe(ADJUSTMENTS, "counter", "Число изменений prefetch консьюмера.")
+
+
+class PrefetchController:
+    """Изменяет prefetch по правилу AIMD: аддитивное увеличение, мультипликативное
+    уменьшение.
+    """
+
+    def __init__(
+        self,
+        min_prefetch: int = 1,
+        max_prefetch: int = 100,
+        initial_prefetch: Optional[int] = None,
+        target_latency: float = 1.0,
+        interval: float = 5.0,
+        increase: int = 1,
+        decrease_factor: float = 0.5,
+        high_utilization: float = 0.9,
+        low_utilization: float = 0.3,
+        alpha: float = 0.2,
+        set_prefetch: Optional[Callable[[int], Awaitable]] = None,
+    ) -> None:
+        if not 1 <= min_prefetch <= max_prefetch:
+            raise AttributeError("Prefetch bounds must satisfy 1 <= min <= max.")
+        self.min_prefetch = min_prefetch
+        self.max_prefetch = max_prefetch
+        self.prefetch = self.clamp(initial_prefetch or min_prefetch)
+        self.target_latency = target_latency
+        self.interval = interval
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.high_utilization = high_utilization
+        self.low_utilization = low_utilization
+        self.alpha = alpha
+        self.set_prefetch = set_prefetch
+        self.latency: Optional[float] = None
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def clamp(self, prefetch: int) -> int:
+        return max(self.min_prefetch, min(self.max_prefetch, int(prefetch)))
+
+    def observe(self, latency: float) -> None:
+        """Учитывает время обработки запроса в скользящем среднем."""
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += self.alpha * (latency - self.latency)
+
+    def next_prefetch(self) -> int:
+        """Новое значение prefetch по данным за прошедший интервал."""
+        utilization = self.peak_in_flight / self.prefetch
+        metrics.set_gauge(UTILIZATION, utilization)
+        if self.latency is not None:
+            metrics.set_gauge(LATENCY_EWMA, self.latency)
+            if self.latency > self.target_latency:
+                return self.clamp(self.prefetch * self.decrease_factor)
+        if utilization >= self.high_utilization:
+            return self.clamp(self.prefetch + self.increase)
+        if utilization < self.low_utilization:
+            return self.clamp(self.prefetch - self.increase)
+        return self.prefetch
+
+    async def adjust(self) -> None:
+        prefetch = self.next_prefetch()
+        self.peak_in_flight = self.in_flight
+        if prefetch != self.prefetch:
+            direction = "up" if prefetch > self.prefetch else "down"
+            logger.debug(
+                "%s.%s: Prefetch %s -> %s: latency=%s",
+                self.__class__.__name__,
+                self.adjust.__name__,
+                self.prefetch,
+                prefetch,
+                self.latency,
+            )
+            self.prefetch = prefetch
+            metrics.inc(ADJUSTMENTS, direction=direction)
+            if self.set_prefetch is not None:
+                await self.set_prefetch(prefetch)
+        metrics.set_gauge(PREFETCH, self.prefetch)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.ensure_future(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.adjust()
+            except Exception as error:
+                logger.error(
+                    "%s.%s: Prefetch adjustment failed: %s",
+                    self.__class__.__name__,
+                    self.run.__name__,
+                    error,
+                )
+
+    def wrap(self, worker: Callable) -> Callable:
+        """Оборачивает обработчик сообщений консьюмера замером времени обработки
+        и числа запросов в обработке. Запросы считаются с момента доставки, поэтому
+        обертка должна быть внешней по отношению к остальным механизмам консьюмера.
+        """
+        worker = awaitable(worker)
+
+        @functools.wraps(worker)
+        async def measure(data: dict):
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            started = perf_counter()
+            try:
+                return await worker(data=data)
+            finally:
+                self.in_flight -= 1
+                self.observe(perf_counter() - started)
+
+        return measure
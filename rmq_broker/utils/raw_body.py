@@ -0,0 +1,32 @@
+"""Тело сообщения в закодированном виде.
+
+Сервис, который отправляет запросы с `raw_body = True`, передает тело запроса
+закодированным отдельно от сообщения. Промежуточный сервис (шлюз) с обработчиком
+`passthrough = True` получает такое тело как байты и пересылает его дальше через
+`BaseService.forward_message`, не декодируя. Конечный обработчик получает
+декодированное тело, а тело ответа кодируется так же, как тело запроса.
+"""
+
+import pickle
+from typing import Any
+
+
+class RawBody(bytes):
+    """Закодированное тело сообщения."""
+
+    __slots__ = ()
+
+    @classmethod
+    def encode(cls, body: Any) -> "RawBody":
+        return cls(pickle.dumps(body, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def decode(self) -> Any:
+        return pickle.loads(self)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(<{len(self)} bytes>)"
+
+
+def decode_body(body: Any) -> Any:
+    """Декодирует тело, если оно передано закодированным."""
+    return body.decode() if isinstance(body, RawBody) else body
@@ -0,0 +1,193 @@
+"""Справедливое распределение обработки между сервисами-отправителями.
+
+Консьюмер выполняет одновременно не больше `max_concurrency` запросов. Ожидающие
+запросы выбираются по взвешенной справедливой очереди (WFQ) по отправителю
+(`header.src`): каждый запрос получает метку виртуального времени
+`max(текущее время, метка предыдущего запроса отправителя) + 1 / вес`, первым
+выполняется запрос с наименьшей меткой. Отправитель, заполнивший очередь, получает
+свою долю обработки (пропорционально весу из `weights`, по умолчанию 1), но не
+задерживает остальных.
+
+Для отправителей можно задать ограничение частоты (token bucket): `rate` запросов
+в секунду, `burst` - допустимый всплеск. Запросы сверх ограничения сразу получают
+ответ с кодом 429. Ограничение "*" действует для каждого отправителя без своего
+ограничения. Очередь одного отправителя ограничена `max_queue`, запросы сверх нее
+получают ответ с кодом 503.
+
+Настраивается в `settings.CONSUMERS[<брокер>]["fair_scheduling"]`:
+
+    "fair_scheduling": {
+        "max_concurrency": 50,
+        "weights": {"gateway": 3},
+        "rate_limits": {"reports": {"rate": 10, "burst": 20}, "*": {"rate": 500}},
+        "max_queue": 1000,
+    }
+"""
+
+import asyncio
+import functools
+import heapq
+import itertools
+import time
+from collections import defaultdict
+from collections.abc import Mapping
+from http import HTTPStatus
+from typing import Callable, Dict, List, Optional, Tuple
+
+from aiormq.tools import awaitable
+
+from rmq_broker.models import ErrorMessage
+from rmq_broker.utils.logger import get_logger
+from rmq_broker.utils.metrics import metrics
+
+logger = get_logger(__name__)
+
+ANY_SOURCE = "*"
+
+THROTTLED = "throttled_requests_total"
+SCHEDULER_QUEUED = "scheduler_queued_requests"
+
+metrics.describe(
+    THROTTLED, "counter", "Число запросов, отклоненных ограничением частоты."
+)
+metrics.describe(
+    SCHEDULER_QUEUED, "gauge", "Число запросов в очереди консьюмера по отправителям."
+)
+
+
+class TokenBucket:
+    """Ограничение частоты: rate запросов в секунду, всплеск до burst запросов."""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: Optional[float] = None) -> None:
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def try_acquire(self, now: Optional[float] = None) -> bool:
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+def get_source(data) -> str:
+    if isinstance(data, Mapping):
+        header = data.get("header")
+        if isinstance(header, Mapping):
+            return str(header.get("src", ""))
+    return ""
+
+
+class FairScheduler:
+    """Очередь запросов консьюмера с долями по отправителям."""
+
+    def __init__(
+        self,
+        max_concurrency: int = 100,
+        weights: Optional[Dict[str, float]] = None,
+        rate_limits: Optional[Dict[str, dict]] = None,
+        max_queue: Optional[int] = None,
+    ) -> None:
+        self.max_concurrency = max_concurrency
+        self.weights = weights or {}
+        self.rate_limits = rate_limits or {}
+        self.max_queue = max_queue
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.in_flight = 0
+        self.virtual_time = 0.0
+        self.last_tags: Dict[str, float] = {}
+        self.queued: Dict[str, int] = defaultdict(int)
+        self.heap: List[Tuple[float, int, str, asyncio.Future]] = []
+        self.sequence = itertools.count()
+
+    def get_bucket(self, src: str) -> Optional[TokenBucket]:
+        bucket = self.buckets.get(src)
+        if bucket is None:
+            limit = self.rate_limits.get(src, self.rate_limits.get(ANY_SOURCE))
+            if limit is None:
+                return None
+            bucket = self.buckets[src] = TokenBucket(**limit)
+        return bucket
+
+    def throttle(self, src: str) -> bool:
+        """Проверяет ограничение частоты отправителя."""
+        bucket = self.get_bucket(src)
+        return bucket is not None and not bucket.try_acquire()
+
+    def next_tag(self, src: str) -> float:
+        start = max(self.virtual_time, self.last_tags.get(src, 0.0))
+        tag = self.last_tags[src] = start + 1 / self.weights.get(src, 1)
+        return tag
+
+    async def acquire(self, src: str) -> None:
+        tag = self.next_tag(src)
+        if self.in_flight < self.max_concurrency and not self.heap:
+            self.virtual_time = tag - 1 / self.weights.get(src, 1)
+            self.in_flight += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.heap, (tag, next(self.sequence), src, future))
+        self.queued[src] += 1
+        metrics.add_gauge(SCHEDULER_QUEUED, 1, src=src)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Место уже передано этому запросу.
+                self.release()
+            raise
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        while self.heap and self.in_flight < self.max_concurrency:
+            tag, _, src, future = heapq.heappop(self.heap)
+            self.queued[src] -= 1
+            if not self.queued[src]:
+                del self.queued[src]
+            metrics.add_gauge(SCHEDULER_QUEUED, -1, src=src)
+            if future.cancelled():
+                continue
+            self.virtual_time = tag - 1 / self.weights.get(src, 1)
+            self.in_flight += 1
+            future.set_result(None)
+
+    def reject(self, data, code: int, message: str) -> dict:
+        logger.warning(
+            "%s.%s: %s: src=%s request_id=%s",
+            self.__class__.__name__,
+            self.reject.__name__,
+            message,
+            get_source(data),
+            data.get("request_id"),
+        )
+        return ErrorMessage().generate_reply(data, code=code, message=message)
+
+    def wrap(self, worker: Callable) -> Callable:
+        """Оборачивает обработчик сообщений консьюмера очередью по отправителям."""
+        worker = awaitable(worker)
+
+        @functools.wraps(worker)
+        async def schedule(data: dict):
+            src = get_source(data)
+            if self.throttle(src):
+                metrics.inc(THROTTLED, src=src)
+                return self.reject(
+                    data, HTTPStatus.TOO_MANY_REQUESTS.value, "Too many requests"
+                )
+            if self.max_queue is not None and self.queued.get(src, 0) >= self.max_queue:
+                return self.reject(
+                    data, HTTPStatus.SERVICE_UNAVAILABLE.value, "Source queue is full"
+                )
+            await self.acquire(src)
+            try:
+                return await worker(data=data)
+            finally:
+                self.release()
+
+        return schedule
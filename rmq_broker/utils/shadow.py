@@ -0,0 +1,178 @@
+"""Копирование части входящих запросов в теневую очередь.
+
+Консьюмер отправляет копию доли `sample_rate` входящих запросов в очередь `queue`
+(например, консьюмер новой версии сервиса), не дожидаясь ответа. Ответ теневого
+сервиса не возвращается вызывающему: он сравнивается с ответом основного обработчика
+по полям `compare` (по умолчанию status и body), результаты записываются в метрики
+по типу запроса:
+
+- `shadow_requests_total{request_type, result}` - result: match, mismatch, error
+  (теневой вызов завершился исключением или вернул ответ не на этот запрос,
+  например ErrorMessage об ошибке валидации запроса) или timeout;
+- `shadow_latency_seconds{request_type, target}` - время обработки основным
+  (target="primary") и теневым (target="shadow") сервисом.
+
+Ответы частями не сравниваются, их теневые вызовы отменяются. Одновременно выполняется
+не больше `max_in_flight` теневых вызовов, остальные запросы не копируются.
+Настраивается в `settings.CONSUMERS[<брокер>]["shadow"]`:
+
+    "shadow": {"queue": "catalog_next", "sample_rate": 0.05, "timeout": 10}
+"""
+
+import asyncio
+import functools
+import inspect
+import random
+import time
+from collections.abc import Mapping
+from typing import Any, Awaitable, Callable, Iterable, Optional, Set, Tuple
+
+from aiormq.tools import awaitable
+
+from rmq_broker.utils.capture import snapshot
+from rmq_broker.utils.logger import get_logger
+from rmq_broker.utils.metrics import metrics
+from rmq_broker.utils.raw_body import RawBody
+
+logger = get_logger(__name__)
+
+SHADOW_REQUESTS = "shadow_requests_total"
+SHADOW_LATENCY = "shadow_latency_seconds"
+
+MATCH = "match"
+MISMATCH = "mismatch"
+ERROR = "error"
+TIMEOUT = "timeout"
+
+metrics.describe(
+    SHADOW_REQUESTS, "counter", "Число запросов, скопированных в теневую очередь."
+)
+metrics.describe(
+    SHADOW_LATENCY,
+    "histogram",
+    "Время обработки копируемых запросов основным и теневым сервисом.",
+)
+
+
+def normalize(value: Any) -> Any:
+    if isinstance(value, RawBody):
+        return value.decode()
+    return value
+
+
+def get_fields(response: Any, fields: Iterable[str]) -> Optional[Tuple]:
+    if not isinstance(response, Mapping):
+        return None
+    return tuple(normalize(response.get(field)) for field in fields)
+
+
+class ShadowMirror:
+    """Отправляет копии запросов в теневую очередь и сравнивает ответы."""
+
+    def __init__(
+        self,
+        queue: str,
+        post: Callable[[dict, str], Awaitable[Any]],
+        sample_rate: float = 0.01,
+        timeout: float = 10,
+        max_in_flight: int = 100,
+        compare: Iterable[str] = ("status", "body"),
+    ) -> None:
+        self.queue = queue
+        self.post = post
+        self.sample_rate = sample_rate
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        self.compare = tuple(compare)
+        # Теневые вызовы, их число ограничено max_in_flight.
+        self._tasks: Set[asyncio.Task] = set()
+        self._comparisons: Set[asyncio.Task] = set()
+
+    def sample(self) -> bool:
+        return (
+            len(self._tasks) < self.max_in_flight and random.random() < self.sample_rate
+        )
+
+    async def send(self, data: dict) -> Tuple[float, Any]:
+        """Теневой вызов. Возвращает время обработки и ответ."""
+        started = time.monotonic()
+        response = await asyncio.wait_for(self.post(data, self.queue), self.timeout)
+        latency = time.monotonic() - started
+        if not isinstance(response, Mapping):
+            raise ValueError(f"Invalid response: {response!r}")
+        if str(response.get("request_id")) != str(data.get("request_id")):
+            # post_message не отправил запрос и вернул ErrorMessage с новым
+            # request_id (например, запрос не прошел валидацию).
+            raise ValueError(f"Not a response to the request: {response.get('status')}")
+        return latency, response
+
+    @staticmethod
+    def track(tasks: Set[asyncio.Task], coroutine) -> asyncio.Task:
+        task = asyncio.ensure_future(coroutine)
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        return task
+
+    async def compare_responses(
+        self,
+        request_type: str,
+        latency: float,
+        response: Any,
+        shadow: asyncio.Future,
+    ) -> None:
+        metrics.observe(
+            SHADOW_LATENCY, latency, request_type=request_type, target="primary"
+        )
+        try:
+            shadow_latency, shadow_response = await shadow
+        except asyncio.TimeoutError:
+            result = TIMEOUT
+        except Exception as error:
+            logger.warning(
+                "%s.%s: Shadow call failed: %s",
+                self.__class__.__name__,
+                self.compare_responses.__name__,
+                error,
+            )
+            result = ERROR
+        else:
+            metrics.observe(
+                SHADOW_LATENCY,
+                shadow_latency,
+                request_type=request_type,
+                target="shadow",
+            )
+            same = get_fields(response, self.compare) == get_fields(
+                shadow_response, self.compare
+            )
+            result = MATCH if same else MISMATCH
+        metrics.inc(SHADOW_REQUESTS, request_type=request_type, result=result)
+
+    def wrap(self, worker: Callable) -> Callable:
+        """Оборачивает обработчик сообщений консьюмера копированием запросов."""
+        worker = awaitable(worker)
+
+        @functools.wraps(worker)
+        async def mirror(data: dict):
+            if not isinstance(data, Mapping) or not self.sample():
+                return await worker(data=data)
+            request_type = str(data.get("request_type", "")).lower()
+            shadow = self.track(self._tasks, self.send(snapshot(data)))
+            started = time.monotonic()
+            try:
+                response = await worker(data=data)
+            except BaseException:
+                shadow.cancel()
+                raise
+            if inspect.isasyncgen(response):
+                shadow.cancel()
+                return response
+            self.track(
+                self._comparisons,
+                self.compare_responses(
+                    request_type, time.monotonic() - started, response, shadow
+                ),
+            )
+            return response
+
+        return mirror
@@ -0,0 +1,358 @@
+"""Распространение контекста трассировки между сервисами.
+
+Идентификаторы трассировки передаются в заголовке сообщения (`header`) в поле
+`traceparent` в формате W3C Trace Context: `00-<trace_id>-<span_id>-<flags>`.
+`ChainManager.handle` продолжает трассировку входящего сообщения, а запросы
+`BaseService`, отправленные во время обработки, получают заголовок с текущим
+контекстом. Завершенные спаны передаются экспортеру: OpenTelemetry, если пакет
+установлен и в приложении настроен TracerProvider, иначе - файл в формате JSON Lines.
+
+Трассировка выключена по умолчанию и включается настройкой
+`BROKER_TRACING_ENABLED = True`. Путь к файлу спанов задается настройкой
+`BROKER_TRACING_FILE` (по умолчанию "spans.jsonl").
+"""
+
+import json
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextvars import ContextVar
+from typing import Optional, Tuple
+
+from rmq_broker.settings import settings
+from rmq_broker.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+TRACEPARENT = "traceparent"
+VERSION = "00"
+SERVER = "server"
+CLIENT = "client"
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar(
+    "rmq_broker_current_span", default=None
+)
+
+
+def generate_id(bits: int) -> str:
+    value = 0
+    while not value:
+        value = random.getrandbits(bits)
+    return "%0*x" % (bits // 4, value)
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """Разбирает заголовок traceparent.
+
+    Returns:
+        (trace_id, span_id, sampled) или None, если заголовок отсутствует
+        или некорректен.
+    """
+    if not value or not isinstance(value, str):
+        return None
+    parts = value.strip().lower().split("-")
+    if len(parts) < 4 or parts[0] == "ff":
+        return None
+    version, trace_id, span_id, flags = parts[:4]
+    if (
+        len(version) != 2
+        or len(trace_id) != 32
+        or len(span_id) != 16
+        or len(flags) != 2
+        or trace_id == "0" * 32
+        or span_id == "0" * 16
+    ):
+        return None
+    try:
+        int(trace_id, 16), int(span_id, 16)
+        sampled = bool(int(flags, 16) & 1)
+    except ValueError:
+        return None
+    return trace_id, span_id, sampled
+
+
+class NullSpan:
+    """Спан, используемый при выключенной трассировке."""
+
+    __slots__ = ()
+    traceparent = None
+
+    def __enter__(self) -> "NullSpan":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+    def set_attribute(self, key: str, value) -> None:
+        pass
+
+    def set_response(self, response: Optional[dict]) -> None:
+        pass
+
+    def inject(self, message: dict) -> None:
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span:
+    """Интервал обработки с идентификаторами W3C Trace Context.
+
+    Используется как контекстный менеджер: на время блока спан становится текущим,
+    по выходе из блока завершается и передается экспортеру трассировщика.
+    """
+
+    __slots__ = (
+        "tracer",
+        "name",
+        "kind",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "sampled",
+        "start_time",
+        "end_time",
+        "attributes",
+        "error",
+        "_token",
+    )
+
+    def __init__(
+        self,
+        tracer: "Tracer",
+        name: str,
+        kind: str,
+        trace_id: str,
+        parent_id: Optional[str],
+        sampled: bool,
+        attributes: dict,
+    ) -> None:
+        self.tracer = tracer
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = generate_id(64)
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.attributes = attributes
+        self.start_time = 0
+        self.end_time = 0
+        self.error = False
+        self._token = None
+
+    @property
+    def traceparent(self) -> str:
+        return "%s-%s-%s-%s" % (
+            VERSION,
+            self.trace_id,
+            self.span_id,
+            "01" if self.sampled else "00",
+        )
+
+    def __enter__(self) -> "Span":
+        self.start_time = time.time_ns()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.end_time = time.time_ns()
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # Span потокового ответа может завершиться в другом контексте.
+            pass
+        if exc_type is not None:
+            self.error = True
+            self.attributes["error.type"] = exc_type.__name__
+        if self.sampled:
+            self.tracer.export(self)
+
+    def set_attribute(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def set_response(self, response: Optional[dict]) -> None:
+        """Запоминает код ответа. Код >= 400 отмечает спан как ошибочный."""
+        try:
+            code = response["status"]["code"]
+        except (TypeError, KeyError):
+            return
+        self.attributes["status.code"] = code
+        self.error = self.error or code >= 400
+
+    def inject(self, message: dict) -> None:
+        """Передает контекст спана в заголовок исходящего сообщения."""
+        message["header"][TRACEPARENT] = self.traceparent
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "kind": self.kind,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "duration": (self.end_time - self.start_time) / 1e9,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class SpanExporter(ABC):
+    """Интерфейс экспортера завершенных спанов."""
+
+    @abstractmethod
+    def export(self, span: Span) -> None:
+        ...  # pragma: no cover
+
+
+class FileSpanExporter(SpanExporter):
+    """Дописывает спаны в файл, по одному JSON объекту в строке."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file = None
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", buffering=1, encoding="utf-8")
+            self._file.write(line + "\n")
+
+
+class OpenTelemetrySpanExporter(SpanExporter):
+    """Передает спаны в OpenTelemetry.
+
+    Родителем спана OpenTelemetry становится удаленный контекст с trace_id и
+    идентификатором родительского спана из сообщения. OpenTelemetry назначает
+    спану собственный идентификатор, исходный сохраняется в атрибуте
+    `rmq_broker.span_id`.
+    """
+
+    def __init__(self, tracer_name: str = "rmq_broker") -> None:
+        from opentelemetry import trace
+
+        self.trace = trace
+        self.tracer = trace.get_tracer(tracer_name)
+
+    def export(self, span: Span) -> None:
+        trace = self.trace
+        context = None
+        if span.parent_id:
+            parent = trace.SpanContext(
+                trace_id=int(span.trace_id, 16),
+                span_id=int(span.parent_id, 16),
+                is_remote=True,
+                trace_flags=trace.TraceFlags(trace.TraceFlags.SAMPLED),
+            )
+            context = trace.set_span_in_context(trace.NonRecordingSpan(parent))
+        otel_span = self.tracer.start_span(
+            span.name,
+            context=context,
+            kind=trace.SpanKind.CLIENT
+            if span.kind == CLIENT
+            else trace.SpanKind.SERVER,
+            attributes={
+                **{key: str(value) for key, value in span.attributes.items()},
+                "rmq_broker.trace_id": span.trace_id,
+                "rmq_broker.span_id": span.span_id,
+            },
+            start_time=span.start_time,
+        )
+        if span.error:
+            otel_span.set_status(trace.Status(trace.StatusCode.ERROR))
+        otel_span.end(end_time=span.end_time)
+
+
+def get_default_exporter() -> SpanExporter:
+    """OpenTelemetry, если приложение настроило TracerProvider (например, из
+    opentelemetry-sdk): без него OpenTelemetry API отбрасывает спаны. Иначе - файл.
+    """
+    path = getattr(settings, "BROKER_TRACING_FILE", "spans.jsonl")
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        return FileSpanExporter(path)
+    provider = trace.get_tracer_provider()
+    if isinstance(provider, (trace.ProxyTracerProvider, trace.NoOpTracerProvider)):
+        logger.warning(
+            "%s: OpenTelemetry tracer provider is not configured, "
+            "writing spans to %s",
+            get_default_exporter.__name__,
+            path,
+        )
+        return FileSpanExporter(path)
+    return OpenTelemetrySpanExporter()
+
+
+class Tracer:
+    """Создает спаны и передает завершенные спаны экспортеру.
+
+    При enabled=None трассировка включается настройкой BROKER_TRACING_ENABLED,
+    которая читается при первой проверке.
+    """
+
+    def __init__(
+        self, enabled: Optional[bool] = False, exporter: Optional[SpanExporter] = None
+    ) -> None:
+        self._enabled = enabled
+        self.exporter = exporter
+
+    @property
+    def enabled(self) -> bool:
+        if self._enabled is None:
+            self._enabled = bool(getattr(settings, "BROKER_TRACING_ENABLED", False))
+        return self._enabled
+
+    def enable(self, exporter: Optional[SpanExporter] = None) -> None:
+        self._enabled = True
+        if exporter is not None:
+            self.exporter = exporter
+
+    def disable(self) -> None:
+        self._enabled = False
+
+    def start_span(
+        self,
+        name: str,
+        traceparent: Optional[str] = None,
+        kind: str = SERVER,
+        **attributes,
+    ):
+        """Создает спан, продолжающий трассировку из `traceparent`.
+        Если заголовок не передан - продолжает текущий спан, а при его отсутствии
+        начинает новую трассировку.
+        """
+        if not self.enabled:
+            return NULL_SPAN
+        parent = parse_traceparent(traceparent)
+        if parent is None and (current := _current_span.get()) is not None:
+            parent = (current.trace_id, current.span_id, current.sampled)
+        if parent is None:
+            trace_id, parent_id, sampled = generate_id(128), None, True
+        else:
+            trace_id, parent_id, sampled = parent
+        return Span(self, name, kind, trace_id, parent_id, sampled, attributes)
+
+    def current_span(self) -> Optional[Span]:
+        return _current_span.get()
+
+    def export(self, span: Span) -> None:
+        if self.exporter is None:
+            self.exporter = get_default_exporter()
+        try:
+            self.exporter.export(span)
+        except Exception as exc:
+            logger.error(
+                "%s.%s: Span export failed: %s",
+                self.__class__.__name__,
+                self.export.__name__,
+                str(exc),
+            )
+
+
+tracer = Tracer(enabled=None)
@@ -0,0 +1,25 @@
+"""Валидаторы тела запроса по атрибуту `body_model` обработчика."""
+
+from typing import Any, Callable, Optional
+
+from pydantic import BaseModel, create_model
+
+
+def build_body_validator(
+    body_model: Any, name: str = "Body"
+) -> Optional[Callable[[Any], Any]]:
+    """Функция, которая валидирует тело запроса и возвращает разобранное значение.
+
+    Для pydantic модели возвращается ее экземпляр, для остальных типов
+    (например, List[Item]) - значение, приведенное к типу.
+    """
+    if body_model is None:
+        return None
+    if isinstance(body_model, type) and issubclass(body_model, BaseModel):
+        return body_model.parse_obj
+    root_model = create_model(name, __root__=(body_model, ...))
+
+    def validate(body: Any) -> Any:
+        return root_model.parse_obj({"__root__": body}).__root__
+
+    return validate
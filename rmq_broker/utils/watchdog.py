@@ -0,0 +1,105 @@
+"""Сторож цикла событий консьюмера.
+
+Цикл событий периодически отмечается в сторожевом потоке. Если отметок нет дольше
+`threshold_ms` миллисекунд, значит цикл занят синхронным кодом: поток записывает
+в лог стек вызовов цикла событий вместе с `request_type` и `request_id`
+обрабатываемого запроса. Отчеты пишутся не чаще одного раза за остановку и не чаще
+одного раза в `report_interval` секунд.
+
+Настраивается в `settings.CONSUMERS[<брокер>]["watchdog"]`:
+
+    "watchdog": {"threshold_ms": 500, "report_interval": 60}
+"""
+
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from rmq_broker.utils.active import active_requests
+from rmq_broker.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class LoopWatchdog:
+    def __init__(self, threshold_ms: float = 500, report_interval: float = 60) -> None:
+        self.threshold = threshold_ms / 1000
+        self.interval = self.threshold / 2
+        self.report_interval = report_interval
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.loop_thread_id: Optional[int] = None
+        self.last_beat = time.monotonic()
+        self.last_report = float("-inf")
+        self.stall_reported = False
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self) -> None:
+        """Запускает сторожевой поток. Вызывается из цикла событий."""
+        if self._thread is not None:
+            return
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread_id = threading.get_ident()
+        self._stopped.clear()
+        active_requests.enable()
+        self.beat()
+        self._thread = threading.Thread(
+            target=self.watch, name="rmq-broker-watchdog", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stopped.set()
+        if self._handle is not None:
+            self._handle.cancel()
+        self._thread.join(self.interval * 2)
+        self._thread = None
+        active_requests.disable()
+
+    def beat(self) -> None:
+        self.last_beat = time.monotonic()
+        self._handle = self.loop.call_later(self.interval, self.beat)
+
+    def watch(self) -> None:
+        while not self._stopped.wait(self.interval):
+            stalled = time.monotonic() - self.last_beat
+            if stalled <= self.threshold:
+                if self.stall_reported:
+                    logger.info(
+                        "%s.%s: Event loop resumed",
+                        self.__class__.__name__,
+                        self.watch.__name__,
+                    )
+                    self.stall_reported = False
+                continue
+            if self.stall_reported:
+                continue
+            now = time.monotonic()
+            if now - self.last_report < self.report_interval:
+                continue
+            self.last_report = now
+            self.stall_reported = True
+            self.report(stalled)
+
+    def report(self, stalled: float) -> None:
+        task, info = active_requests.current(self.loop)
+        request_type, request_id = info or (None, None)
+        frame = sys._current_frames().get(self.loop_thread_id)
+        stack = "".join(traceback.format_stack(frame)) if frame else ""
+        logger.warning(
+            "%s.%s: Event loop blocked for %.3fs: request_type=%s request_id=%s "
+            "task=%s\n%s",
+            self.__class__.__name__,
+            self.report.__name__,
+            stalled,
+            request_type,
+            request_id,
+            task.get_name() if task is not None else None,
+            stack,
+        )